@@ -0,0 +1,227 @@
+"""Throughput benchmarks of the data loading, pair testing and backtesting code paths.
+
+Every benchmark runs on the bundled `data/raw` CSV files. A benchmark is a setup function registered
+with `@benchmark(unit)`: it prepares its inputs and returns the callable to time, together with the
+number of units (bars, pairs) that callable processes. The suite reports the best time over a few
+repeats and the resulting units per second.
+
+Results are saved as JSON with the versions of the libraries they were measured with, and
+`compare` flags the benchmarks whose throughput dropped below a baseline by more than a tolerance.
+
+Run it with `python scripts/benchmark.py`.
+"""
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import platform
+import time
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from src.data_manager import DataManager
+from src.feeds import ArrayData
+
+# Tickers listed over the whole period, used by every benchmark.
+TICKERS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA', 'META', 'TSLA', 'PEP', 'COST', 'ADBE']
+BACKTEST_TICKERS = {'PairsTradingStrategy': ['AAPL', 'MSFT'], 'SimpleMovingAverage': ['AAPL'],
+                    'SimpleRSI': ['AAPL']}
+LIBRARIES = ('numpy', 'pandas', 'backtrader', 'statsmodels', 'scipy')
+
+BENCHMARKS = {}
+
+
+def benchmark(unit):
+    """Registers a benchmark setup function, measured in `unit` per second."""
+    def register(setup):
+        BENCHMARKS[setup.__name__] = dict(setup=setup, unit=unit)
+        return setup
+    return register
+
+
+def _pairs(n_pairs):
+    return list(itertools.islice(itertools.combinations(TICKERS, 2), n_pairs))
+
+
+def _closes(data_manager, tickers):
+    return {ticker: data_manager.load_ticker_data(ticker)['close'] for ticker in tickers}
+
+
+@benchmark('bars')
+def load_ticker_data(n_pairs):
+    data_manager = DataManager()
+    data_manager.price_store()
+    bars = sum(len(data_manager.load_ticker_data(ticker)) for ticker in TICKERS)
+    return lambda: [data_manager.load_ticker_data(ticker) for ticker in TICKERS], bars
+
+
+@benchmark('bars')
+def load_ticker_data_csv(n_pairs):
+    data_manager = DataManager(use_cache=False)
+    bars = sum(len(data_manager.load_ticker_data(ticker)) for ticker in TICKERS)
+    return lambda: [data_manager.load_ticker_data(ticker) for ticker in TICKERS], bars
+
+
+@benchmark('bars')
+def cerebro_add_data(n_pairs):
+    data_manager = DataManager()
+
+    def run():
+        # The feeds only read their files when they are started, as cerebro.run() does.
+        cerebro = bt.Cerebro()
+        data_manager.cerebro_add_data(TICKERS, cerebro)
+        for data in cerebro.datas:
+            data._start()
+            data.preload()
+        return cerebro
+
+    bars = sum(data.buflen() for data in run().datas)
+    return run, bars
+
+
+@benchmark('pairs')
+def adf_test(n_pairs):
+    from src.utils import TimeSeriesAnalysis
+    closes = _closes(DataManager(), TICKERS)
+    pairs = _pairs(n_pairs)
+
+    def run():
+        # `adf_test` prints its results, which would be timed with it.
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [TimeSeriesAnalysis.adf_test(closes[a], closes[b]) for a, b in pairs]
+
+    return run, len(pairs)
+
+
+@benchmark('pairs')
+def engle_granger_two_step_cointegration_test(n_pairs):
+    from src.utils import TimeSeriesAnalysis
+    closes = _closes(DataManager(), TICKERS)
+    pairs = _pairs(n_pairs)
+    return (lambda: [TimeSeriesAnalysis.engle_granger_two_step_cointegration_test(closes[a], closes[b])
+                     for a, b in pairs], len(pairs))
+
+
+@benchmark('pairs')
+def scan_pairs(n_pairs):
+    from src.utils import TimeSeriesAnalysis
+    prices = DataManager().load_panel(TICKERS).frame('close')
+    return lambda: TimeSeriesAnalysis.scan_pairs(prices), len(TICKERS) * (len(TICKERS) - 1) // 2
+
+
+def _cerebro_run(strategy_name):
+    from src import strategy as strategies
+    strategy = getattr(strategies, strategy_name)
+    tickers = BACKTEST_TICKERS[strategy_name]
+    panel = DataManager().load_panel(tickers, fields=('open', 'high', 'low', 'close', 'volume'))
+    rows = panel.common_rows()
+    frames = [pd.DataFrame(panel.values[:, rows, column].T, index=panel.dates[rows], columns=list(panel.fields))
+              for column in range(len(tickers))]
+
+    def run():
+        cerebro = bt.Cerebro(stdstats=False)
+        for ticker, frame in zip(tickers, frames):
+            cerebro.adddata(ArrayData.from_frame(frame), name=ticker)
+        cerebro.addstrategy(strategy)
+        cerebro.broker.setcash(100_000.0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cerebro.run()
+
+    return run, int(rows.sum())
+
+
+@benchmark('bars')
+def run_pairs_trading_strategy(n_pairs):
+    return _cerebro_run('PairsTradingStrategy')
+
+
+@benchmark('bars')
+def run_simple_moving_average(n_pairs):
+    return _cerebro_run('SimpleMovingAverage')
+
+
+@benchmark('bars')
+def run_simple_rsi(n_pairs):
+    return _cerebro_run('SimpleRSI')
+
+
+def environment():
+    """Returns the Python, platform and library versions the results are measured with."""
+    versions = {}
+    for name in LIBRARIES:
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return dict(python=platform.python_version(), platform=platform.platform(), libraries=versions,
+                date=datetime.datetime.now().isoformat(timespec='seconds'))
+
+
+def run_suite(names=None, repeat=3, n_pairs=20, verbose=False):
+    """
+    Runs the benchmarks and measures their throughput.
+
+    Parameters:
+    - names (list, optional): The benchmarks to run. Defaults to all of them.
+    - repeat (int): Number of timed runs of each benchmark. The best one is reported.
+    - n_pairs (int): Number of pairs used by the pair testing benchmarks.
+    - verbose (bool): Print each result as soon as it is measured.
+
+    Returns:
+    - dict: The 'environment' and, for every benchmark, its 'unit', 'units', best 'seconds' and 'rate'.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        entry = BENCHMARKS[name]
+        run, units = entry['setup'](n_pairs)
+        run()  # Warm-up: imports, caches and lazily built stores are not timed.
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        seconds = min(timings)
+        results[name] = dict(unit=entry['unit'], units=units, seconds=seconds, median=float(np.median(timings)),
+                             rate=units / seconds)
+        if verbose:
+            print(f'{name:45s} {units / seconds:14,.1f} {entry["unit"]}/s  ({seconds * 1000:.1f} ms)')
+    return dict(environment=environment(), results=results)
+
+
+def save(report, path):
+    """Writes a report of `run_suite` as JSON."""
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+def load(path):
+    """Reads a report written by `save`."""
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Compares the throughput of a report with a baseline.
+
+    Parameters:
+    - report (dict): The current results, from `run_suite`.
+    - baseline (dict): The reference results, e.g. from `load`.
+    - tolerance (float): Relative slowdown allowed before a benchmark is flagged, 0.2 for 20%.
+
+    Returns:
+    - pd.DataFrame: One row per benchmark of both reports with the baseline and current rates,
+      their 'ratio' (current / baseline) and a 'regression' flag.
+    """
+    rows = []
+    for name, result in report['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        ratio = result['rate'] / reference['rate']
+        rows.append(dict(benchmark=name, unit=result['unit'], baseline=reference['rate'], current=result['rate'],
+                         ratio=ratio, regression=ratio < 1.0 - tolerance))
+    return pd.DataFrame(rows, columns=['benchmark', 'unit', 'baseline', 'current', 'ratio', 'regression'])
@@ -1,40 +1,111 @@
-from __future__ import (absolute_import, division, print_function,
-                        unicode_literals)
+"""Backtests strategies of src.strategy from the command line, e.g.
+
+    python scripts/backtest.py --strategy SimpleMovingAverage --tickers AAPL --param fast=10 --start 2020-01-01
+    python scripts/backtest.py --pairs AAPL:MSFT NVDA:AMD --workers 4 --format csv --output results.csv
+    python scripts/backtest.py --pairs-file pairs.txt --portfolio
+    python scripts/backtest.py --manifest jobs.json --store
+
+Without arguments, SimpleRSI is backtested on AAPL. Pairs are backtested with PairsTradingStrategy
+unless --strategy is given. A manifest is a JSON list of jobs, or {"defaults": {...}, "jobs": [...]},
+whose keys are those of src.batch.JOB_FIELDS; all its jobs run in this process and share the loaded data.
+Nothing is plotted and no observer is added unless --plot or --stdstats is given.
+"""
+import argparse
+import os
 import sys
-sys.path.append("/Users/baobach/Backtesting-Algo-Trading")
-import backtrader as bt
-from src.strategy import PairsTradingStrategy, SimpleMovingAverage, SimpleRSI
-from src.analyzer import AnalyzerSuite
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.batch import load_manifest, parse_params, run_jobs
 from src.data_manager import DataManager
+from src.profiler import Profiler
+from src.results_store import ResultsStore
+
+FORMATS = ('table', 'csv', 'json')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Backtest the trading strategies.')
+    parser.add_argument('--strategy', help='Strategy class name in src.strategy (default: SimpleRSI, '
+                                           'PairsTradingStrategy with pairs).')
+    jobs = parser.add_mutually_exclusive_group()
+    jobs.add_argument('--tickers', nargs='+', help='Tickers added as data0, data1, ... (default: AAPL).')
+    jobs.add_argument('--pairs', nargs='+', metavar='TICKER1:TICKER2', help='Backtest each of these pairs.')
+    jobs.add_argument('--pairs-file', metavar='FILE',
+                      help='Backtest each pair of FILE, one TICKER1:TICKER2 per line, or a scan_pairs CSV.')
+    jobs.add_argument('--manifest', metavar='FILE', help='Run the jobs of a JSON manifest instead.')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a strategy parameter, can be repeated.')
+    parser.add_argument('--start', help='First date of the backtests, e.g. 2020-01-01.')
+    parser.add_argument('--end', help='Last date of the backtests, inclusive.')
+    parser.add_argument('--cash', type=float, default=100_000.0, help='Starting cash (default: 100000).')
+    parser.add_argument('--adjusted', action='store_true',
+                        help='Trade the split and dividend adjusted prices instead of the raw ones.')
+    parser.add_argument('--portfolio', action='store_true',
+                        help='Trade all the pairs together with PairsPortfolioStrategy in a single run.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to backtest the pairs of a job (default: 1).')
+    parser.add_argument('--format', choices=FORMATS, default='table', help='Output format (default: table).')
+    parser.add_argument('--output', metavar='FILE', help='Write the results to FILE instead of the standard output.')
+    parser.add_argument('--store', nargs='?', const='', metavar='DB',
+                        help='Record the runs in a results database (default: results.sqlite in the '
+                             'price store folder), or serve them from there if they were already run.')
+    parser.add_argument('--refresh', action='store_true',
+                        help='With --store, run the backtests even if their result is already stored.')
+    parser.add_argument('--stdstats', action='store_true', help='Add the standard backtrader observers.')
+    parser.add_argument('--plot', action='store_true', help='Plot every backtest (needs matplotlib and a display).')
+    parser.add_argument('--verbose', action='store_true', help='Show what the strategies print.')
+    parser.add_argument('--events', metavar='FOLDER',
+                        help='Record the orders and trades of every backtest in a Parquet file of FOLDER.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time the feeds, indicators, strategy, broker and analyzers and print a report.')
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help='With --profile, also run cProfile and write its statistics (pstats format) to FILE.')
+    return parser.parse_args()
+
+
+def command_line_job(args):
+    job = dict(strategy=args.strategy, params=parse_params(args.param), start=args.start, end=args.end,
+               cash=args.cash, portfolio=args.portfolio, adjusted=args.adjusted)
+    if args.pairs:
+        job['pairs'] = args.pairs
+    elif args.pairs_file:
+        job['pairs_file'] = args.pairs_file
+    else:
+        job['tickers'] = args.tickers or ['AAPL']
+    return job
+
+
+def format_results(results, output_format):
+    if output_format == 'csv':
+        return results.to_csv(index=False)
+    if output_format == 'json':
+        return results.to_json(orient='records', indent=2) + '\n'
+    return results.to_string(index=False) + '\n'
+
 
 if __name__ == '__main__':
-    # ------------------------------------------------------------------------------------
-    # Create a cerebro entity
-    cerebro = bt.Cerebro()
-    data = DataManager()
-    # Add a strategy
-    tickers = ['AAPL']
-    cerebro.addstrategy(SimpleRSI)
-    data.cerebro_add_data(tickers=tickers, cerebro=cerebro)
-
-    # Set our desired cash start
-    cerebro.broker.setcash(100_000.0)
-    # Set the commission
-    #cerebro.broker.setcommission(commission=0.001)
-
-    # ------------------------------------------------------------------------------------
-
-    # Print out the starting conditions
-    print('Starting Portfolio Value: %.2f' % cerebro.broker.getvalue())
-    # Analyzer
-    AnalyzerSuite.defineAnalyzers(AnalyzerSuite,cerebro)
-    # Run over everything
-    thestrats = cerebro.run(stdstats=True)
-
-    # -----------------------------------------------------------------------------------
-
-    print(AnalyzerSuite.returnAnalyzers(AnalyzerSuite,thestrats))
-    # Print out the final result
-    print('Final Portfolio Value: %.2f' % cerebro.broker.getvalue())
-    # Plot the result
-    cerebro.plot()  
\ No newline at end of file
+    args = parse_args()
+    store = None
+    try:
+        jobs = load_manifest(args.manifest) if args.manifest else [command_line_job(args)]
+        store = ResultsStore(args.store or None) if args.store is not None else None
+        profiler = Profiler(cprofile=bool(args.profile_output)) if args.profile else None
+        results = run_jobs(jobs, data_manager=DataManager(), store=store, refresh=args.refresh,
+                           workers=args.workers, quiet=not args.verbose, stdstats=args.stdstats, plot=args.plot,
+                           profiler=profiler, events=args.events)
+    except (OSError, ValueError) as error:
+        sys.exit(f'error: {error}')
+    finally:
+        if store is not None:
+            store.close()
+
+    text = format_results(results, args.format)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    else:
+        sys.stdout.write(text)
+    if profiler is not None:
+        print(profiler.summary(), file=sys.stderr)
+        if args.profile_output:
+            profiler.dump_stats(args.profile_output)
+    sys.exit(1 if results['error'].notna().any() else 0)
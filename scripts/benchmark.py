@@ -0,0 +1,48 @@
+import argparse
+import os
+import sys
+import warnings
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from benchmarks.suite import BENCHMARKS, compare, load, run_suite, save
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'baseline.json')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Measure the throughput of the data loading, pair testing '
+                                                 'and backtesting code paths.')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f'Benchmarks to run (default: all). One of {", ".join(BENCHMARKS)}.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark, the best is kept.')
+    parser.add_argument('--pairs', type=int, default=20, help='Number of pairs of the pair testing benchmarks.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Write the results to {BASELINE}.')
+    parser.add_argument('--compare', nargs='?', const=BASELINE, metavar='BASELINE',
+                        help='Compare with a baseline JSON file (default: the saved baseline).')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown flagged as a regression (default: 0.2).')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.compare and not os.path.exists(args.compare):
+        sys.exit(f'error: no baseline at {args.compare}, run with --save-baseline first.')
+    # Deprecation warnings of the statistics libraries would flood the output on every pair.
+    warnings.simplefilter('ignore')
+    report = run_suite(args.benchmarks or None, repeat=args.repeat, n_pairs=args.pairs, verbose=True)
+    if args.output:
+        save(report, args.output)
+    if args.save_baseline:
+        save(report, BASELINE)
+    if args.compare:
+        comparison = compare(report, load(args.compare), tolerance=args.tolerance)
+        print(comparison.to_string(index=False))
+        regressions = comparison[comparison['regression']]
+        if len(regressions):
+            print(f'Regressions: {", ".join(regressions["benchmark"])}')
+            sys.exit(1)
@@ -1,25 +1,38 @@
-import sys
-sys.path.append("/Users/baobach/Backtesting-Algo-Trading")
+import argparse
+import datetime
 import os
 import sys
-import pandas as pd
-from openbb import obb
-from src.config import get_api_key
-from src.utils import DataWrangler
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.downloader import Downloader, OpenBBProvider
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Download or refresh the daily prices of the NASDAQ constituents.')
+    parser.add_argument('--tickers', nargs='+', help='Tickers to refresh instead of the NASDAQ constituents.')
+    parser.add_argument('--start-date', default='2020-01-01', help='Start of the history of new tickers.')
+    # The end date is excluded: by default the bar of today, which is partial during the session and would
+    # not be downloaded again by the next refresh, is left out.
+    parser.add_argument('--end-date', default=datetime.date.today().isoformat(),
+                        help='End of the range to download, excluded. Defaults to today.')
+    parser.add_argument('--workers', type=int, default=8, help='Number of concurrent downloads.')
+    parser.add_argument('--retries', type=int, default=3, help='Number of retries of a failed download.')
+    return parser.parse_args()
 
-# Load equities list
-pat = get_api_key()
-obb.account.login(pat=pat)
-tickers = obb.index.constituents('nasdaq').to_df()['symbol']
 
-# Create an instance of the datawrangler class
-start_date = '2020-01-01'
-end_date = '2024-01-01'
-dw = DataWrangler()
+def nasdaq_constituents():
+    from openbb import obb
+    from src.config import get_api_key
+    obb.account.login(pat=get_api_key())
+    return list(obb.index.constituents('nasdaq').to_df()['symbol'])
 
-# Download data for each ticker in the list
-for ticker in tickers:
-    df = dw.download_data(ticker = ticker, start_date = start_date, end_date = end_date)
-    df.to_csv(f'./data/raw/{ticker}.csv')
 
+if __name__ == '__main__':
+    args = parse_args()
+    tickers = args.tickers or nasdaq_constituents()
 
+    # Only the dates after the last stored row of each ticker are downloaded.
+    downloader = Downloader(OpenBBProvider(), workers=args.workers, retries=args.retries)
+    summary = downloader.update(tickers, args.start_date, args.end_date)
+    print(summary.to_string(index=False))
+    failed = summary['error'].notna().sum()
+    print(f'{summary["rows_added"].sum()} rows added, {failed} tickers failed.')
@@ -0,0 +1,60 @@
+"""Parameter sweep of a strategy, e.g.
+
+    python scripts/optimize.py --strategy PairsTradingStrategy --tickers AAPL MSFT \
+        --param period=10,20,30 --param upper=2.0,2.5 --param transform=RollingOLSTransformation --workers 8
+
+With --random N, each --param gives the values to draw from, or a range written low:high.
+"""
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import src.strategy
+from src.batch import parse_value
+from src.optimizer import ParameterSweep, grid, random_points
+
+
+def parse_param(text):
+    name, _, values = text.partition('=')
+    if ':' in values:
+        low, high = values.split(':')
+        return name, (parse_value(low), parse_value(high))
+    return name, [parse_value(value) for value in values.split(',')]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Parameter sweep of a strategy.')
+    parser.add_argument('--strategy', required=True, help='Strategy class name in src.strategy.')
+    parser.add_argument('--tickers', nargs='+', required=True, help='Tickers added as data0, data1, ...')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=V1,V2|LOW:HIGH',
+                        help='Values of a parameter, can be repeated.')
+    parser.add_argument('--random', type=int, metavar='N', help='Draw N random points instead of the full grid.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the random draws.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes (default: all CPUs).')
+    parser.add_argument('--cash', type=float, default=100_000.0, help='Starting cash (default: 100000).')
+    parser.add_argument('--adjusted', action='store_true',
+                        help='Trade the split and dividend adjusted prices instead of the raw ones.')
+    parser.add_argument('--events', metavar='FOLDER',
+                        help='Record the orders and trades of every point in a Parquet file of FOLDER.')
+    parser.add_argument('--sort', default='final_value', help='Column used to rank the results.')
+    parser.add_argument('--output', help='Write the results table to this CSV file.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    space = dict(parse_param(text) for text in args.param)
+    if args.random:
+        points = random_points(args.random, seed=args.seed, **space)
+    else:
+        if any(isinstance(values, tuple) for values in space.values()):
+            sys.exit('Ranges (LOW:HIGH) can only be used with --random.')
+        points = grid(**space)
+
+    sweep = ParameterSweep(getattr(src.strategy, args.strategy), args.tickers, cash=args.cash, adjusted=args.adjusted,
+                           events=args.events)
+    results = sweep.run(points, workers=args.workers)
+    results = results.sort_values(args.sort, ascending=False)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.to_string(index=False))
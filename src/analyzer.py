@@ -1,4 +1,174 @@
+import math
+from array import array
+
+import backtrader as bt
 import backtrader.analyzers as btanalyzers
+import numpy as np
+
+# Metrics computed by `compute_metrics`, by group. A group is only computed if one of its metrics is asked.
+METRIC_GROUPS = {
+    'returns': ('final_value', 'total_return', 'cagr'),
+    'drawdown': ('max_drawdown', 'max_drawdown_length'),
+    'risk': ('volatility', 'sharpe', 'sortino'),
+    'turnover': ('turnover',),
+    'trades': ('trades', 'hit_rate', 'avg_trade', 'avg_win', 'avg_loss', 'profit_factor', 'avg_bars'),
+}
+METRICS = tuple(name for names in METRIC_GROUPS.values() for name in names)
+
+
+def compute_metrics(values, dates=None, pnl=None, barlen=None, traded=None, metrics=None, riskfree=0.0,
+                    annualization=252):
+    """
+    Computes the performance metrics of an equity curve and of a list of closed trades.
+
+    Parameters:
+    - values (np.ndarray): The portfolio value of every bar.
+    - dates (np.ndarray, optional): The dates of the bars (datetime64), used to count the years of the CAGR
+      and of the turnover. `len(values) / annualization` years otherwise.
+    - pnl (np.ndarray, optional): The net profit and loss of every closed trade.
+    - barlen (np.ndarray, optional): The number of bars every closed trade was open.
+    - traded (np.ndarray, optional): The value traded on every bar.
+    - metrics (list, optional): The metrics to compute, see `METRICS`. Defaults to all of them.
+    - riskfree (float): Annual risk free rate of the Sharpe and Sortino ratios.
+    - annualization (int): Number of bars per year.
+
+    Returns:
+    - dict: The metrics. Returns, CAGR, drawdown and turnover are fractions (0.1 for 10%), the drawdown
+      length is a number of bars, and volatility, Sharpe and Sortino ratios are annualized.
+    """
+    names = METRICS if metrics is None else tuple(metrics)
+    unknown = set(names) - set(METRICS)
+    if unknown:
+        raise ValueError(f'Unknown metrics: {", ".join(sorted(unknown))}.')
+    wanted = {group for group, group_names in METRIC_GROUPS.items() if set(group_names) & set(names)}
+    values = np.asarray(values, dtype=np.float64)
+    if dates is not None and len(dates) > 1:
+        years = (np.datetime64(dates[-1], 'D') - np.datetime64(dates[0], 'D')).astype(np.float64) / 365.25
+    else:
+        years = len(values) / annualization
+    result = {}
+
+    if 'returns' in wanted:
+        result['final_value'] = values[-1] if len(values) else math.nan
+        growth = values[-1] / values[0] if len(values) else math.nan
+        result['total_return'] = growth - 1
+        result['cagr'] = growth ** (1 / years) - 1 if years > 0 and growth > 0 else math.nan
+
+    if 'drawdown' in wanted:
+        peak = np.maximum.accumulate(values)
+        drawdown = 1 - values / peak
+        result['max_drawdown'] = drawdown.max() if len(values) else math.nan
+        # Longest run of bars below the previous peak.
+        underwater = np.concatenate(([0], (drawdown > 0).astype(np.int8), [0]))
+        edges = np.flatnonzero(np.diff(underwater))
+        result['max_drawdown_length'] = int((edges[1::2] - edges[::2]).max()) if len(edges) else 0
+
+    if 'risk' in wanted:
+        returns = values[1:] / values[:-1] - 1
+        excess = returns - riskfree / annualization
+        scale = math.sqrt(annualization)
+        volatility = returns.std(ddof=1) if len(returns) > 1 else math.nan
+        downside = math.sqrt(np.mean(np.minimum(excess, 0.0) ** 2)) if len(returns) else math.nan
+        mean = excess.mean() if len(returns) else math.nan
+        result['volatility'] = volatility * scale
+        result['sharpe'] = mean / excess.std(ddof=1) * scale if volatility > 0 else math.nan
+        result['sortino'] = mean / downside * scale if downside > 0 else math.nan
+
+    if 'turnover' in wanted:
+        traded = np.zeros(0) if traded is None else np.asarray(traded, dtype=np.float64)
+        # Value traded per year, relative to the average portfolio value.
+        result['turnover'] = traded.sum() / values.mean() / years if years > 0 and len(values) else math.nan
+
+    if 'trades' in wanted:
+        pnl = np.zeros(0) if pnl is None else np.asarray(pnl, dtype=np.float64)
+        barlen = np.zeros(0) if barlen is None else np.asarray(barlen, dtype=np.float64)
+        wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+        result['trades'] = len(pnl)
+        result['hit_rate'] = len(wins) / len(pnl) if len(pnl) else math.nan
+        result['avg_trade'] = pnl.mean() if len(pnl) else math.nan
+        result['avg_win'] = wins.mean() if len(wins) else math.nan
+        result['avg_loss'] = losses.mean() if len(losses) else math.nan
+        result['profit_factor'] = wins.sum() / -losses.sum() if len(losses) else math.nan
+        result['avg_bars'] = barlen.mean() if len(barlen) else math.nan
+
+    return {name: result[name].item() if isinstance(result[name], np.generic) else result[name] for name in names}
+
+
+class Recorder(bt.Analyzer):
+    '''Records the portfolio value of every bar, the traded value and the
+    closed trades (close date, data index, net pnl, length) into arrays, and computes all the metrics at the end of the
+    run with ``compute_metrics``.
+
+    The arrays are allocated for the length of the preloaded data, and grow
+    when the data is not preloaded.
+
+    Params:
+      - ``metrics``: the metrics to compute, all of ``METRICS`` by default
+      - ``riskfree``: annual risk free rate of the Sharpe and Sortino ratios
+      - ``annualization``: number of bars per year
+    '''
+    params = (
+        ('metrics', None),
+        ('riskfree', 0.0),
+        ('annualization', 252),
+    )
+
+    def start(self):
+        size = max([data.buflen() for data in self.strategy.datas] + [256])
+        self.dates = np.empty(size, dtype=np.float64)
+        self.values = np.empty(size, dtype=np.float64)
+        self.traded = np.zeros(size, dtype=np.float64)
+        self.bars = 0
+        self.pnl = array('d')
+        self.barlen = array('d')
+        self.trade_dates = array('d')
+        self.trade_datas = array('l')
+        self._analysis = None
+
+    def _grow(self):
+        size = 2 * len(self.values)
+        for name in ('dates', 'values', 'traded'):
+            grown = np.zeros(size, dtype=np.float64)
+            grown[:self.bars] = getattr(self, name)[:self.bars]
+            setattr(self, name, grown)
+
+    def prenext(self):
+        self.next()
+
+    def next(self):
+        if self.bars == len(self.values):
+            self._grow()
+        self.dates[self.bars] = self.strategy.datetime[0]
+        self.values[self.bars] = self.strategy.broker.getvalue()
+        self.bars += 1
+
+    def notify_order(self, order):
+        if order.status in [order.Submitted, order.Accepted, order.Partial] or not order.executed.size:
+            return
+        if self.bars == len(self.values):
+            self._grow()
+        # Orders are notified before the bar they were executed on is recorded.
+        self.traded[self.bars] += abs(order.executed.size) * order.executed.price
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self.pnl.append(trade.pnlcomm)
+            self.barlen.append(trade.barlen)
+            self.trade_dates.append(trade.dtclose)
+            # Lines compare by value in `==`, so the data is looked up by identity.
+            self.trade_datas.append(next(index for index, data in enumerate(self.strategy.datas)
+                                         if data is trade.data))
+
+    def get_analysis(self):
+        if self._analysis is None:
+            dates = np.array([bt.num2date(value) for value in self.dates[:self.bars][[0, -1]]],
+                             dtype='datetime64[s]') if self.bars else None
+            self._analysis = compute_metrics(
+                self.values[:self.bars], dates=dates, pnl=np.frombuffer(self.pnl, dtype=np.float64),
+                barlen=np.frombuffer(self.barlen, dtype=np.float64), traded=self.traded[:self.bars],
+                metrics=self.p.metrics, riskfree=self.p.riskfree, annualization=self.p.annualization)
+        return self._analysis
+
 
 class AnalyzerSuite():
     def defineAnalyzers(self, cerebro):
@@ -10,4 +180,32 @@ class AnalyzerSuite():
         thestrat = thestrats[0]
         return {'DrawDown': thestrat.analyzers.mydrawdown.get_analysis()['max']['drawdown'],
                 'Sharpe Ratio:': thestrat.analyzers.mysharpe.get_analysis()['sharperatio'],
-                'Returns:': thestrat.analyzers.myreturn.get_analysis()['rnorm100']}
\ No newline at end of file
+                'Returns:': thestrat.analyzers.myreturn.get_analysis()['rnorm100']}
+
+    @staticmethod
+    def defineRecorder(cerebro, metrics=None, **kwargs):
+        """
+        Adds a single `Recorder` analyzer in place of the per bar analyzers of `defineAnalyzers`.
+
+        Parameters:
+        - cerebro (backtrader.Cerebro): The cerebro engine.
+        - metrics (list, optional): The metrics to compute, see `METRICS`. Defaults to all of them.
+        - kwargs: The other `Recorder` params, riskfree and annualization.
+        """
+        cerebro.addanalyzer(Recorder, _name='recorder', metrics=metrics, **kwargs)
+
+    @staticmethod
+    def returnMetrics(thestrats):
+        """
+        Returns the metrics of the `Recorder` of every strategy of a run.
+
+        Parameters:
+        - thestrats (list): The result of `cerebro.run()`, a list of strategies, or a list of lists of
+          strategies for an optimization run.
+
+        Returns:
+        - list: One dict per strategy, with its class name as 'strategy' followed by its metrics.
+        """
+        strategies = [strat for item in thestrats for strat in (item if isinstance(item, list) else [item])]
+        return [dict(strategy=type(strat).__name__, **strat.analyzers.recorder.get_analysis())
+                for strat in strategies]
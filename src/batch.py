@@ -0,0 +1,232 @@
+"""Batches of backtests described by jobs, run one after the other in a single process.
+
+A job is a dict naming a strategy class of `src.strategy`, the tickers or the pairs it trades,
+parameter overrides, a date range and the starting cash, see `JOB_FIELDS`. The interpreter, the
+imports and the `DataManager` (with its cache of aligned panels) are shared by all the jobs of a
+batch, so a job only costs its backtest.
+"""
+import json
+import os
+
+import backtrader as bt
+import pandas as pd
+
+import src.indicators
+import src.strategy
+from src.data_manager import DataManager
+from src.events import log_path
+from src.optimizer import describe
+from src.parallel import run_pair_backtests
+from src.results_store import run_backtest
+
+JOB_FIELDS = ('name', 'strategy', 'tickers', 'pairs', 'pairs_file', 'params', 'start', 'end', 'cash', 'portfolio',
+              'adjusted')
+DEFAULT_STRATEGY = 'SimpleRSI'
+DEFAULT_PAIRS_STRATEGY = 'PairsTradingStrategy'
+DEFAULT_PORTFOLIO_STRATEGY = 'PairsPortfolioStrategy'
+
+
+def parse_value(text):
+    """Parses a command line parameter value: an int, a float, an indicator class name or a string."""
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    # Indicator classes, e.g. transform=RollingOLSTransformation
+    return getattr(src.indicators, text, text)
+
+
+def parse_params(texts):
+    """Parses NAME=VALUE parameter overrides into a dict."""
+    params = {}
+    for text in texts:
+        name, sep, value = text.partition('=')
+        if not sep or not name:
+            raise ValueError(f'Invalid parameter {text!r}, expected NAME=VALUE.')
+        params[name] = parse_value(value)
+    return params
+
+
+def strategy_class(name):
+    """Returns the strategy class of `src.strategy` with the given name."""
+    strategy = getattr(src.strategy, name, None)
+    if not (isinstance(strategy, type) and issubclass(strategy, bt.Strategy)):
+        available = sorted(key for key, value in vars(src.strategy).items()
+                           if isinstance(value, type) and issubclass(value, bt.Strategy) and value is not bt.Strategy)
+        raise ValueError(f'Unknown strategy {name!r}. Available strategies: {", ".join(available)}.')
+    return strategy
+
+
+def parse_pair(text):
+    """Parses a pair written TICKER1:TICKER2 or TICKER1,TICKER2."""
+    tickers = tuple(ticker.strip() for ticker in text.replace(',', ':').split(':')[:2])
+    if len(tickers) != 2 or not all(tickers):
+        raise ValueError(f'Invalid pair {text!r}, expected TICKER1:TICKER2.')
+    return tickers
+
+
+def read_pairs(path):
+    """
+    Reads a pairs file.
+
+    The file holds one pair per line, written TICKER1:TICKER2 or TICKER1,TICKER2. Blank lines and
+    lines starting with # are skipped. The CSV written from `TimeSeriesAnalysis.scan_pairs` results
+    can be used as is: its header is skipped and its first two columns are the pair.
+
+    Parameters:
+    - path (str): The pairs file.
+
+    Returns:
+    - list: The (ticker1, ticker2) tuples.
+    """
+    pairs = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            pair = parse_pair(line)
+            if pair != ('ticker1', 'ticker2'):
+                pairs.append(pair)
+    return pairs
+
+
+def load_manifest(path):
+    """
+    Reads the jobs of a JSON manifest.
+
+    The manifest is either a list of jobs, or a dict with a list of 'jobs' and 'defaults' applied to
+    every job, e.g. {"defaults": {"start": "2020-01-01"}, "jobs": [{"strategy": "SimpleRSI",
+    "tickers": ["AAPL"]}, {"pairs_file": "pairs.txt", "params": {"period": 30}}]}. Pairs files are
+    relative to the manifest.
+
+    Parameters:
+    - path (str): The manifest file.
+
+    Returns:
+    - list: The jobs, as dicts.
+    """
+    with open(path) as file:
+        manifest = json.load(file)
+    if isinstance(manifest, list):
+        manifest = dict(jobs=manifest)
+    defaults = manifest.get('defaults', {})
+    folder = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for job in manifest.get('jobs', []):
+        job = dict(defaults, **job)
+        if job.get('pairs_file'):
+            job['pairs_file'] = os.path.join(folder, job['pairs_file'])
+        jobs.append(job)
+    return jobs
+
+
+def expand_job(job):
+    """
+    Returns the backtests of a job.
+
+    A job with tickers is one backtest with the tickers as data0, data1, ... A job with pairs is one
+    backtest per pair, or a single backtest of all the pairs together if 'portfolio' is set.
+
+    Parameters:
+    - job (dict): The job, with the keys of `JOB_FIELDS`.
+
+    Returns:
+    - list: One dict per backtest with the strategy class, tickers, params, start, end, cash, adjusted
+      and common_dates arguments of `run_backtest`.
+    """
+    unknown = set(job) - set(JOB_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown job fields: {", ".join(sorted(unknown))}.')
+    pairs = [parse_pair(pair) if isinstance(pair, str) else tuple(pair) for pair in job.get('pairs') or []]
+    if job.get('pairs_file'):
+        pairs += read_pairs(job['pairs_file'])
+    if bool(pairs) == bool(job.get('tickers')):
+        raise ValueError('A job needs either tickers or pairs.')
+    params = {name: parse_value(value) if isinstance(value, str) else value
+              for name, value in (job.get('params') or {}).items()}
+    common = dict(params=params, start=job.get('start'), end=job.get('end'), cash=float(job.get('cash', 100_000.0)),
+                  adjusted=bool(job.get('adjusted', False)))
+    if job.get('portfolio'):
+        if not pairs:
+            raise ValueError('A portfolio job needs pairs.')
+        strategy = strategy_class(job.get('strategy') or DEFAULT_PORTFOLIO_STRATEGY)
+        # Each ticker is added once, whatever the number of pairs it is part of.
+        tickers = list(dict.fromkeys(ticker for pair in pairs for ticker in pair))
+        return [dict(common, strategy=strategy, tickers=tickers, params=dict(params, pairs=pairs),
+                     common_dates=False)]
+    if pairs:
+        strategy = strategy_class(job.get('strategy') or DEFAULT_PAIRS_STRATEGY)
+        return [dict(common, strategy=strategy, tickers=list(pair), common_dates=True) for pair in pairs]
+    strategy = strategy_class(job.get('strategy') or DEFAULT_STRATEGY)
+    return [dict(common, strategy=strategy, tickers=list(job['tickers']), common_dates=True)]
+
+
+def run_jobs(jobs, data_manager=None, store=None, refresh=False, workers=1, quiet=True, stdstats=False, plot=False,
+             profiler=None, events=None):
+    """
+    Runs the backtests of a batch of jobs.
+
+    Every job is expanded and checked before the first backtest is run, so a mistake in a manifest
+    fails at once. A backtest that raises does not stop the batch: its error is reported in the
+    'error' column.
+
+    Parameters:
+    - jobs (list): The jobs, see `JOB_FIELDS` and `expand_job`.
+    - data_manager (DataManager, optional): The data manager shared by the jobs.
+    - store (ResultsStore, optional): Where the runs are looked up and recorded.
+    - refresh (bool): Run the backtests even if their result is already stored.
+    - workers (int): With more than one, the backtests of a pairs job run in that many processes
+      (without the results store).
+    - quiet (bool): Hide what the strategies print.
+    - stdstats (bool): Add the standard observers to the backtests.
+    - plot (bool): Plot every backtest. Runs one after the other in the current process.
+    - profiler (Profiler, optional): Times the loading and the runs of the backtests.
+    - events (str, optional): Folder where the orders and trades of every backtest are recorded by an
+      `EventRecorder`, in <job>/<TICKER1>-<TICKER2>....parquet. Not recorded if None.
+
+    Returns:
+    - pd.DataFrame: One row per backtest with the job, strategy, tickers, params, run id, whether
+      it was served from the store, wall time, error and `Recorder` metrics.
+    """
+    data_manager = data_manager or DataManager()
+    batches = [(job.get('name') or str(index), job, expand_job(job)) for index, job in enumerate(jobs)]
+    rows = []
+    for name, job, backtests in batches:
+        results = None
+        if workers > 1 and len(backtests) > 1 and not job.get('portfolio') and store is None and not plot:
+            try:
+                results = run_pair_backtests([tuple(backtest['tickers']) for backtest in backtests],
+                                             strategy=backtests[0]['strategy'], params=backtests[0]['params'],
+                                             cash=backtests[0]['cash'], data_manager=data_manager, workers=workers,
+                                             start=job.get('start'), end=job.get('end'), quiet=quiet,
+                                             adjusted=backtests[0]['adjusted'],
+                                             events=None if events is None else os.path.join(events, name))
+            except Exception:
+                # One failing pair fails the whole pool, the backtests are run one by one below so that
+                # the error is reported on the row of that pair only.
+                pass
+        if results is not None:
+            for backtest, metrics in zip(backtests, results.drop(columns=['ticker1', 'ticker2']).to_dict('records')):
+                rows.append(dict(_describe_backtest(name, backtest), id=None, served=False, wall_time=None,
+                                 error=None, **metrics))
+            continue
+        for backtest in backtests:
+            row = _describe_backtest(name, backtest)
+            try:
+                path = None if events is None else log_path(os.path.join(events, name), *backtest['tickers'])
+                run = run_backtest(data_manager=data_manager, store=store, refresh=refresh, quiet=quiet,
+                                   stdstats=stdstats, plot=plot, profiler=profiler, events=path, **backtest)
+            except Exception as error:
+                rows.append(dict(row, id=None, served=False, wall_time=None, error=f'{type(error).__name__}: {error}'))
+                continue
+            rows.append(dict(row, id=run.get('id'), served=run['served'], wall_time=run['wall_time'], error=None,
+                             **run['metrics']))
+    return pd.DataFrame(rows)
+
+
+def _describe_backtest(name, backtest):
+    params = {key: describe(value) for key, value in backtest['params'].items()}
+    return dict(job=name, strategy=backtest['strategy'].__name__, tickers=','.join(backtest['tickers']),
+                params=json.dumps(params, default=repr), start=backtest['start'], end=backtest['end'])
@@ -1,16 +1,107 @@
+import hashlib
 import os
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-import backtrader as bt
+from src.price_store import PriceStore, adjust_prices
+
+# Number of panels kept in memory by `DataManager.load_panel`, shared by every DataManager.
+PANEL_CACHE_SIZE = 8
+_panel_cache = OrderedDict()
+# Number of tickers whose feed arrays are kept in memory by `DataManager.feed_arrays`.
+FEED_CACHE_SIZE = 128
+_feed_cache = OrderedDict()
+
+
+def default_data_folder():
+    """Returns the path of the bundled `data/raw` folder, relative to this package."""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(os.path.dirname(package_dir), 'data', 'raw')
+
+
+def default_cache_folder(data_folder):
+    """Returns the folder of the compiled price store, next to the data folder (`data/raw` -> `data/cache`)."""
+    return os.path.join(os.path.dirname(os.path.abspath(data_folder)), 'cache')
+
+
+class Panel:
+    """
+    Several tickers aligned on a common trading calendar, held in one contiguous array.
+
+    Attributes:
+    - dates (pd.DatetimeIndex): The calendar, the union of the dates of the tickers.
+    - tickers (list): The tickers, in column order.
+    - fields (tuple): The price columns held by the panel.
+    - values (np.ndarray): Read-only (fields x dates x tickers) float64 array, NaN where a ticker has no data.
+    - mask (np.ndarray): Read-only (dates x tickers) boolean array, True where a ticker has data.
+    """
+
+    def __init__(self, dates, tickers, fields, values, mask):
+        self.dates = dates
+        self.tickers = list(tickers)
+        self.fields = tuple(fields)
+        self.values = values
+        self.mask = mask
+        self.values.flags.writeable = False
+        self.mask.flags.writeable = False
+
+    def field(self, name):
+        """Returns the (dates x tickers) array of one field."""
+        return self.values[self.fields.index(name)]
+
+    def frame(self, name='close'):
+        """Returns one field as a DataFrame with dates as index and tickers as columns."""
+        return pd.DataFrame(self.field(name), index=self.dates, columns=self.tickers)
+
+    def first_valid(self):
+        """Returns the first date with data of every ticker, which shows the late listings."""
+        first = np.argmax(self.mask, axis=0)
+        dates = self.dates[first].to_numpy().copy()
+        dates[~self.mask.any(axis=0)] = np.datetime64('NaT')
+        return pd.Series(dates, index=self.tickers)
+
+    def fingerprint(self):
+        """Returns a SHA-1 hex digest of the dates, tickers, fields and values, which identifies the data."""
+        digest = hashlib.sha1(repr((self.tickers, self.fields)).encode())
+        digest.update(self.dates.to_numpy().tobytes())
+        digest.update(np.ascontiguousarray(self.values).tobytes())
+        return digest.hexdigest()
+
+    def common_rows(self, tickers=None):
+        """Returns the boolean row mask of the dates where all the given tickers (default: all) have data."""
+        if tickers is None:
+            return self.mask.all(axis=1)
+        columns = [self.tickers.index(ticker) for ticker in tickers]
+        return self.mask[:, columns].all(axis=1)
+
 
 class DataManager:
-    def __init__(self):
+    def __init__(self, data_folder=None, cache_folder=None, use_cache=True):
         """
         Manage the data in the `data` folder. Provides methods to get available tickers and load ticker data.
         - get_available_tickers(): Returns a list of available tickers.
         - load_ticker_data(ticker): Loads the data for a specific ticker.
-        - cerebro_add_data(ticker1, ticker2, cerebro): Loads and adds the data for two tickers to the cerebro engine.
+        - load_panel(tickers, fields, start, end): Loads several tickers aligned on a common calendar.
+        - feed(ticker, start, end): Returns an in-memory backtrader feed of a ticker.
+        - cerebro_add_data(tickers, cerebro, start, end): Adds the feeds of several tickers to the cerebro engine.
+
+        Parameters:
+        - data_folder (str, optional): Folder holding the `<ticker>.csv` files. Defaults to the repository `data/raw` folder.
+        - cache_folder (str, optional): Folder of the compiled price store. Defaults to `cache` next to the data folder.
+        - use_cache (bool): Load tickers from the memory-mapped price store instead of parsing the CSV files.
         """
-        self.data_folder = '/Users/baobach/Backtesting-Algo-Trading/data/raw'
+        self.data_folder = data_folder or default_data_folder()
+        self.cache_folder = cache_folder or default_cache_folder(self.data_folder)
+        self.use_cache = use_cache
+
+    def price_store(self, refresh=False):
+        """
+        Returns the memory-mapped price store of the data folder, building it from the CSV files if needed.
+
+        Parameters:
+        - refresh (bool): Check every CSV file and rebuild the store if any of them changed.
+        """
+        return PriceStore.open(self.data_folder, self.cache_folder, refresh=refresh)
 
     def get_available_tickers(self):
         """
@@ -32,46 +123,156 @@ class DataManager:
 
         It checks if the ticker data file exists in the data_folder.
         If the file does not exist, it raises a ValueError.
-        Otherwise, it reads the CSV file using pandas and returns the DataFrame.
+        Otherwise, it returns the ticker columns from the price store, which is rebuilt first if the
+        CSV file changed since it was compiled. With `use_cache=False` the CSV file is read with pandas.
+        Besides the raw columns, the data holds the split and dividend adjusted prices computed when
+        the store is built (see `src.price_store.adjust_prices`): 'adj_factor', 'adj_open', 'adj_high',
+        'adj_low' and 'adj_close'.
         
         Parameters:
         - ticker (str): The ticker symbol for which to load the data.
 
         Returns:
-        - df (pandas.DataFrame): The loaded ticker data as a DataFrame.
+        - df (pandas.DataFrame): The loaded ticker data as a DataFrame indexed by date.
         """
         file_path = os.path.join(self.data_folder, f'{ticker}.csv')
         if not os.path.exists(file_path):
             raise ValueError(f'Ticker data for {ticker} does not exist.')
-        df = pd.read_csv(file_path)
+        if self.use_cache:
+            store = self.price_store()
+            if not store.is_fresh(ticker):
+                store = self.price_store(refresh=True)
+            return store.frame(ticker)
+        df = pd.read_csv(file_path, parse_dates=['date'])
         df = df.set_index('date')  # Set the index as the date column
+        for field, values in adjust_prices(df).items():
+            df[field] = values
         return df
     
-    def cerebro_add_data(self, tickers, cerebro):
+    def load_panel(self, tickers=None, fields=('close',), start=None, end=None):
+        """
+        Loads several tickers aligned on a common trading calendar.
+
+        The calendar is the union of the dates of the tickers, so tickers listed after the start of
+        the sample (ABNB, CEG, GEHC, ...) hold NaN before their first date and the panel `mask` tells
+        where each ticker has data. The panel is built in a single pass over the price store and kept
+        in an LRU cache of `PANEL_CACHE_SIZE` entries, which is dropped when the store is rebuilt.
+
+        Parameters:
+        - tickers (list, optional): The tickers to load. Defaults to every available ticker, sorted.
+        - fields (tuple): The price columns to load. Defaults to ('close',).
+        - start (str, optional): First date of the panel, e.g. '2021-01-01'.
+        - end (str, optional): Last date of the panel, inclusive.
+
+        Returns:
+        - panel (Panel): The aligned tickers. The arrays are shared with the cache and read-only.
+        """
+        tickers = list(tickers) if tickers is not None else sorted(self.get_available_tickers())
+        fields = (fields,) if isinstance(fields, str) else tuple(fields)
+        missing = [ticker for ticker in tickers if not os.path.exists(os.path.join(self.data_folder, f'{ticker}.csv'))]
+        if missing:
+            raise ValueError(f'Ticker data for {", ".join(missing)} does not exist.')
+        store = self.price_store()
+        if not all(store.is_fresh(ticker) for ticker in tickers):
+            store = self.price_store(refresh=True)
+
+        key = (self.cache_folder, store.manifest['token'], tuple(tickers), fields, start, end)
+        panel = _panel_cache.get(key)
+        if panel is not None:
+            _panel_cache.move_to_end(key)
+            return panel
+        start = None if start is None else pd.Timestamp(start).to_datetime64()
+        end = None if end is None else pd.Timestamp(end).to_datetime64()
+        calendar, values, mask = store.align(tickers, fields, start, end)
+        panel = Panel(pd.DatetimeIndex(calendar, name='date'), tickers, fields, values, mask)
+        _panel_cache[key] = panel
+        while len(_panel_cache) > PANEL_CACHE_SIZE:
+            _panel_cache.popitem(last=False)
+        return panel
+
+    def feed_arrays(self, ticker, adjusted=False):
+        """
+        Returns the columns of a ticker as the arrays of an `ArrayData` feed.
+
+        The dates are converted to backtrader numbers once: the arrays are kept in an LRU cache of
+        `FEED_CACHE_SIZE` tickers shared by every DataManager, keyed by the price store version (or
+        the CSV file signature with `use_cache=False`), so they are rebuilt when the data changes.
+
+        Parameters:
+        - ticker (str): The ticker symbol.
+        - adjusted (bool): Use the split and dividend adjusted prices as open, high, low and close.
+          The volume is not adjusted.
+
+        Returns:
+        - arrays (dict): Read-only float64 arrays of 'datetime', 'open', 'high', 'low', 'close' and 'volume'.
+        """
+        from src.feeds import frame_arrays
+
+        file_path = os.path.join(self.data_folder, f'{ticker}.csv')
+        if not os.path.exists(file_path):
+            raise ValueError(f'Ticker data for {ticker} does not exist.')
+        if self.use_cache:
+            store = self.price_store()
+            if not store.is_fresh(ticker):
+                store = self.price_store(refresh=True)
+            key = (self.cache_folder, store.manifest['token'], ticker, adjusted)
+        else:
+            stat = os.stat(file_path)
+            key = (file_path, stat.st_mtime_ns, stat.st_size, adjusted)
+        arrays = _feed_cache.get(key)
+        if arrays is not None:
+            _feed_cache.move_to_end(key)
+            return arrays
+        fields = ['open', 'high', 'low', 'close']
+        columns = [f'adj_{field}' for field in fields] if adjusted else fields
+        frame = self.load_ticker_data(ticker)[columns + ['volume']]
+        arrays = frame_arrays(frame.rename(columns=dict(zip(columns, fields))))
+        for values in arrays.values():
+            values.flags.writeable = False
+        _feed_cache[key] = arrays
+        while len(_feed_cache) > FEED_CACHE_SIZE:
+            _feed_cache.popitem(last=False)
+        return arrays
+
+    def feed(self, ticker, start=None, end=None, adjusted=False, **kwargs):
+        """
+        Returns an in-memory backtrader feed of a ticker, see `src.feeds.ArrayData`.
+
+        The feed reads the cached arrays of `feed_arrays`: the date range is a slice of them, not a copy.
+
+        Parameters:
+        - ticker (str): The ticker symbol.
+        - start (str, optional): First date of the feed, e.g. '2021-01-01'.
+        - end (str, optional): Last date of the feed, inclusive.
+        - adjusted (bool): Feed the split and dividend adjusted prices, see `feed_arrays`.
+        - kwargs: Other parameters of the feed.
+
+        Returns:
+        - feed (ArrayData): The feed, to be added to a cerebro engine.
+        """
+        from src.feeds import ArrayData, date2num
+
+        arrays = self.feed_arrays(ticker, adjusted)
+        dates = arrays['datetime']
+        first = 0 if start is None else np.searchsorted(dates, date2num([pd.Timestamp(start)])[0], side='left')
+        stop = len(dates) if end is None else np.searchsorted(dates, date2num([pd.Timestamp(end)])[0], side='right')
+        return ArrayData(dataname={name: values[first:stop] for name, values in arrays.items()}, **kwargs)
+
+    def cerebro_add_data(self, tickers, cerebro, start=None, end=None, adjusted=False):
         """
-        Loads and adds the data for multiple tickers to the cerebro engine.
+        Adds the data of several tickers to the cerebro engine, as feeds named after the tickers.
 
         It checks if the ticker data files exist in the data_folder.
         If any of the files do not exist, it raises a ValueError.
-        Otherwise, it reads the CSV files using pandas and adds the data to the cerebro engine.
+        Otherwise, it adds an in-memory feed of each ticker (see `feed`) to the cerebro engine.
 
         Parameters:
         - tickers (list): A list of ticker symbols to load and add.
         - cerebro (backtrader.Cerebro): The cerebro engine to add the data to.
+        - start (str, optional): First date of the feeds, e.g. '2021-01-01'.
+        - end (str, optional): Last date of the feeds, inclusive.
+        - adjusted (bool): Feed the split and dividend adjusted prices, see `feed_arrays`.
         """
-        for ticker in tickers:
-            file_path = os.path.join(self.data_folder, f'{ticker}.csv')
-            if not os.path.exists(file_path):
-                raise ValueError(f'Ticker data for {ticker} does not exist.')
-            data = bt.feeds.GenericCSVData(
-                dataname=file_path,
-                nullvalue=0.0,
-                dtformat=('%Y-%m-%d'),
-                datetime=0,
-                high=1,
-                low=2,
-                open=3,
-                close=4,
-                volume=5
-                )
+        feeds = [self.feed(ticker, start, end, adjusted) for ticker in tickers]
+        for ticker, data in zip(tickers, feeds):
             cerebro.adddata(data, name=ticker)
@@ -0,0 +1,186 @@
+"""Incremental, concurrent refresh of the `<ticker>.csv` files of a data folder.
+
+For every ticker the last stored date is read from the tail of its CSV file, and only the missing
+range is requested from the data provider. Tickers are processed by a bounded thread pool, provider
+calls are retried with exponential backoff, and new rows are merged into the file atomically
+(written to a temporary file, then renamed over the original).
+
+Providers implement `DataProvider.historical`. `OpenBBProvider` downloads from OpenBB (yfinance),
+`LocalCSVProvider` serves the CSV files of another folder, e.g. as a stand-in in tests.
+"""
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from src.data_manager import DataManager
+
+COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'dividends', 'stock_splits']
+
+
+class DataProvider(ABC):
+    """
+    Interface of the market data sources used by `Downloader`.
+    """
+
+    @abstractmethod
+    def historical(self, ticker, start_date, end_date):
+        """
+        Returns the daily bars of a ticker between two dates.
+
+        Parameters:
+        - ticker (str): The ticker symbol of the stock.
+        - start_date (str): The first date to return, 'YYYY-MM-DD'.
+        - end_date (str): The end of the range, 'YYYY-MM-DD', excluded.
+
+        Returns:
+        - df (pandas.DataFrame): Bars indexed by date, with the columns of the bundled CSV files.
+        """
+
+
+class OpenBBProvider(DataProvider):
+    """
+    Downloads daily bars from OpenBB with `DataWrangler`. The OpenBB session is opened on first use.
+    """
+
+    def __init__(self):
+        self._wrangler = None
+        self._lock = threading.Lock()
+
+    def historical(self, ticker, start_date, end_date):
+        with self._lock:
+            if self._wrangler is None:
+                from src.utils import DataWrangler
+                self._wrangler = DataWrangler()
+        return self._wrangler.download_data(ticker=ticker, start_date=start_date, end_date=end_date)
+
+
+class LocalCSVProvider(DataProvider):
+    """
+    Serves the `<ticker>.csv` files of a folder as if they were downloaded.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def historical(self, ticker, start_date, end_date):
+        df = pd.read_csv(os.path.join(self.folder, f'{ticker}.csv'), parse_dates=['date']).set_index('date')
+        return df[(df.index >= pd.Timestamp(start_date)) & (df.index < pd.Timestamp(end_date))]
+
+
+def last_stored_date(file_path):
+    """
+    Returns the date of the last row of a CSV file by reading its tail only, or None if it has no rows.
+    """
+    with open(file_path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(max(0, size - 4096))
+        lines = file.read().decode().strip().splitlines()
+    if len(lines) < 2 and size <= 4096:
+        return None  # Header only.
+    return pd.Timestamp(lines[-1].split(',', 1)[0])
+
+
+class Downloader:
+    """
+    Refreshes the CSV files of a data folder from a data provider.
+
+    Parameters:
+    - provider (DataProvider): Where the bars are downloaded from.
+    - data_folder (str, optional): Folder holding the `<ticker>.csv` files. Defaults to the DataManager folder.
+    - workers (int): Maximum number of concurrent provider calls.
+    - retries (int): Number of retries of a failed provider call.
+    - backoff (float): Delay before the first retry, in seconds. It doubles at each retry.
+    """
+
+    def __init__(self, provider, data_folder=None, workers=8, retries=3, backoff=1.0):
+        self.provider = provider
+        self.data_folder = data_folder or DataManager().data_folder
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+
+    def _fetch(self, ticker, start_date, end_date):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.provider.historical(ticker, start_date, end_date)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                # Exponential backoff with jitter, so that throttled workers do not retry together.
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def update_ticker(self, ticker, start_date, end_date):
+        """
+        Downloads the bars of one ticker that are missing from its CSV file and merges them.
+
+        Parameters:
+        - ticker (str): The ticker symbol.
+        - start_date (str): Start of the history, used when the ticker has no file yet.
+        - end_date (str): End of the range to download, excluded.
+
+        Returns:
+        - int: The number of rows added.
+        """
+        file_path = os.path.join(self.data_folder, f'{ticker}.csv')
+        last = last_stored_date(file_path) if os.path.exists(file_path) else None
+        first = (last + pd.Timedelta(days=1)) if last is not None else pd.Timestamp(start_date)
+        if first >= pd.Timestamp(end_date):
+            return 0
+        new = self._fetch(ticker, first.strftime('%Y-%m-%d'), end_date)
+        if new is None or len(new) == 0:
+            return 0
+
+        new = new.copy()
+        new.index = pd.to_datetime(new.index)
+        new = new[new.index >= first].sort_index()
+        new = new[~new.index.duplicated(keep='last')]
+        missing = [column for column in ('dividends', 'stock_splits') if column not in new]
+        if missing:
+            # Zeros would pass for "no corporate actions" in the adjusted prices of the price store.
+            raise ValueError(f'The provider returned no {" and ".join(missing)} column for {ticker}.')
+        new = new[COLUMNS]
+        new.index = new.index.strftime('%Y-%m-%d')
+        new.index.name = 'date'
+        if len(new) == 0:
+            return 0
+
+        temp_path = f'{file_path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', newline='') as file:
+            if last is not None:
+                with open(file_path) as existing:
+                    content = existing.read()
+                file.write(content if content.endswith('\n') else content + '\n')
+                new.to_csv(file, header=False)
+            else:
+                new.to_csv(file)
+        os.replace(temp_path, file_path)
+        return len(new)
+
+    def update(self, tickers, start_date, end_date):
+        """
+        Refreshes many tickers concurrently.
+
+        Parameters:
+        - tickers (list): The ticker symbols.
+        - start_date (str): Start of the history of tickers that have no file yet.
+        - end_date (str): End of the range to download, excluded.
+
+        Returns:
+        - pd.DataFrame: One row per ticker with the number of rows added and the error, if any.
+        """
+        def task(ticker):
+            try:
+                return ticker, self.update_ticker(ticker, start_date, end_date), None
+            except Exception as error:
+                return ticker, 0, f'{type(error).__name__}: {error}'
+
+        os.makedirs(self.data_folder, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(task, tickers))
+        return pd.DataFrame(results, columns=['ticker', 'rows_added', 'error'])
@@ -0,0 +1,254 @@
+"""Compact recording of the orders and trades of a run, in place of string logs.
+
+`EventLog` appends the events to a preallocated NumPy structured array of `EVENT_DTYPE`, one fixed
+size record per event: the date (a backtrader number), the index of the data (ticker), the kind
+(order or trade), the side, status, size, price, commission and pnl. Without a file the array
+doubles when it is full. With a file, every full chunk of `chunk_size` events is spilled to it and
+the array is reused, so the memory of a long run or of a sweep worker stays at one chunk. The file
+is raw binary records (`.bin`, read back with `np.fromfile`) or, for a `.parquet` path, a Parquet
+file with one row group per chunk.
+
+`EventRecorder` is the analyzer that fills a log from the order and trade notifications of a
+strategy. It also drops the finished orders and closed trades that backtrader would otherwise keep
+for the whole run:
+
+    cerebro.addanalyzer(EventRecorder, _name='events', path='events.parquet')
+    thestrats = cerebro.run()
+    events = thestrats[0].analyzers.events.get_analysis()
+
+The runners (`run_backtest`, `run_pair_backtests`, `ParameterSweep` and the batch jobs) attach it
+when they are given an `events` file or folder, one Parquet log per backtest, see `log_path`.
+"""
+import os
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+EVENT_DTYPE = np.dtype([
+    ('date', 'f8'),
+    ('data', 'i4'),
+    ('kind', 'i1'),
+    ('side', 'i1'),
+    ('status', 'i1'),
+    ('size', 'f8'),
+    ('price', 'f8'),
+    ('comm', 'f8'),
+    ('pnl', 'f8'),
+])
+# Values of the 'kind' field.
+ORDER, TRADE = 0, 1
+EVENT_KINDS = ('order', 'trade')
+# Number of events held in memory before they are spilled to the file of the log.
+EVENT_CHUNK_SIZE = 4096
+
+
+class EventLog:
+    """
+    Array of `EVENT_DTYPE` records, optionally spilled to a file in chunks.
+
+    Parameters:
+    - chunk_size (int): Number of events held in memory. Without a path the array grows beyond it.
+    - path (str, optional): The file the full chunks are written to, replaced if it exists. Parquet
+      if it ends with '.parquet', raw binary records otherwise. A Parquet file can only be read once
+      it is closed, so reading the events of a Parquet log closes it.
+
+    Attributes:
+    - spilled (int): Number of events written to the file.
+    """
+
+    def __init__(self, chunk_size=EVENT_CHUNK_SIZE, path=None):
+        self.chunk_size = chunk_size
+        self.path = path
+        self.parquet = path is not None and path.endswith('.parquet')
+        self.spilled = 0
+        self._buffer = np.zeros(chunk_size, dtype=EVENT_DTYPE)
+        self._count = 0
+        self._writer = None
+        self._closed = False
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def append(self, date, data, kind, side, status, size, price, comm, pnl):
+        """Appends one event, spilling the full chunk to the file first if needed."""
+        if self._closed:
+            raise ValueError('The event log is closed.')
+        if self._count == len(self._buffer):
+            if self.path is None:
+                grown = np.zeros(2 * len(self._buffer), dtype=EVENT_DTYPE)
+                grown[:self._count] = self._buffer
+                self._buffer = grown
+            else:
+                self.flush()
+        self._buffer[self._count] = (date, data, kind, side, status, size, price, comm, pnl)
+        self._count += 1
+
+    def flush(self):
+        """Writes the events held in memory to the file. Does nothing without a file."""
+        if self.path is None or not self._count:
+            return
+        chunk = self._buffer[:self._count]
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.table({name: chunk[name] for name in EVENT_DTYPE.names})
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            with open(self.path, 'ab') as file:
+                chunk.tofile(file)
+        self.spilled += self._count
+        self._count = 0
+
+    def close(self):
+        """Writes the remaining events and closes the file, which is then complete."""
+        if self.path is None or self._closed:
+            return
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._closed = True
+
+    def events(self):
+        """
+        Returns every event, those of the file followed by those held in memory.
+
+        Returns:
+        - np.ndarray: A structured array of `EVENT_DTYPE`.
+        """
+        if not self.spilled:
+            return self._buffer[:self._count].copy()
+        if self.parquet:
+            import pyarrow.parquet as pq
+
+            self.close()
+            table = pq.read_table(self.path)
+            stored = np.empty(table.num_rows, dtype=EVENT_DTYPE)
+            for name in EVENT_DTYPE.names:
+                stored[name] = table.column(name).to_numpy()
+        else:
+            stored = np.fromfile(self.path, dtype=EVENT_DTYPE)
+        return np.concatenate([stored, self._buffer[:self._count]])
+
+    def to_frame(self, names=None):
+        """
+        Returns the events as a DataFrame, with dates as datetimes and kinds as strings.
+
+        Parameters:
+        - names (list, optional): The names of the datas, which replace their indices in a 'ticker' column.
+
+        Returns:
+        - pd.DataFrame: One row per event, in the order they were recorded.
+        """
+        events = self.events()
+        frame = pd.DataFrame({name: events[name] for name in EVENT_DTYPE.names})
+        frame['date'] = [bt.num2date(value) for value in events['date']]
+        frame['kind'] = np.asarray(EVENT_KINDS)[events['kind']]
+        if names is not None:
+            frame.insert(1, 'ticker', np.asarray(names, dtype=object)[events['data']])
+        return frame
+
+    def __len__(self):
+        return self.spilled + self._count
+
+
+class EventRecorder(bt.Analyzer):
+    '''Records the orders and trades of a strategy into an ``EventLog``.
+
+    An order is recorded once, when it is completed, canceled, expired,
+    rejected or refused for margin, with its signed executed size, average
+    price, commission and pnl. A trade is recorded when it opens (size and
+    price of the opening) and when it closes (net pnl and commission).
+
+    Params:
+      - ``chunk_size``: number of events held in memory
+      - ``path``: file the events are spilled to, see ``EventLog``
+      - ``prune``: drop the order notifications kept by the strategy, the
+        finished orders of the broker and the closed trades of the strategy,
+        which backtrader keeps for the whole run
+    '''
+    params = (
+        ('chunk_size', EVENT_CHUNK_SIZE),
+        ('path', None),
+        ('prune', True),
+    )
+
+    def start(self):
+        self.events = EventLog(self.p.chunk_size, self.p.path)
+        # Lines compare by value in `==`, so the datas are looked up by identity.
+        self._datas = {id(data): index for index, data in enumerate(self.strategy.datas)}
+        self.names = [data._name for data in self.strategy.datas]
+        self._finished = self._notified = False
+
+    def notify_order(self, order):
+        self._notified = True
+        if order.status in [order.Submitted, order.Accepted, order.Partial]:
+            return
+        executed = order.executed
+        self.events.append(executed.dt or self.strategy.datetime[0], self._datas[id(order.data)], ORDER,
+                           1 if order.isbuy() else -1, order.status, executed.size, executed.price,
+                           executed.comm, executed.pnl)
+
+    def notify_trade(self, trade):
+        data = self._datas[id(trade.data)]
+        if trade.justopened:
+            self.events.append(trade.dtopen, data, TRADE, 1 if trade.long else -1, trade.status, trade.size,
+                               trade.price, trade.commission, 0.0)
+        if trade.isclosed:
+            self.events.append(trade.dtclose, data, TRADE, 1 if trade.long else -1, trade.status, 0.0,
+                               trade.price, trade.commission, trade.pnlcomm)
+            self._notified = True
+
+    def _prune(self):
+        strategy = self.strategy
+        # The strategy keeps a copy of the order of every notification, the broker the orders themselves.
+        del strategy._orders[:]
+        orders = getattr(strategy.broker, 'orders', None)
+        if orders is not None:
+            orders[:] = [order for order in orders if order.alive()]
+        for trades in strategy._trades.values():
+            for history in trades.values():
+                # The last trade is the one the next execution updates, or replaces if it is closed.
+                del history[:-1]
+
+    def prenext(self):
+        self.next()
+
+    def next(self):
+        # The strategy moves the orders notified on a bar to its list after the analyzers ran, so they
+        # are dropped on the next bar.
+        if self._finished and self.p.prune:
+            self._prune()
+        self._finished, self._notified = self._notified, False
+
+    def stop(self):
+        if (self._finished or self._notified) and self.p.prune:
+            self._prune()
+        self.events.close()
+
+    def get_analysis(self):
+        '''Returns the events as a DataFrame, see ``EventLog.to_frame``.'''
+        return self.events.to_frame(self.names)
+
+
+def log_path(folder, *names):
+    """
+    Returns the Parquet file of the event log of one run, creating its folder.
+
+    Parameters:
+    - folder (str): The folder of the event logs.
+    - names (str): What identifies the run, e.g. its tickers, joined by '-' in the file name.
+
+    Returns:
+    - str: The path of the log.
+    """
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, '-'.join(str(name) for name in names) + '.parquet')
+
+
+def add_event_recorder(cerebro, path):
+    """Adds an `EventRecorder`, named 'events', that spills the events of the run to `path`."""
+    cerebro.addanalyzer(EventRecorder, _name='events', path=path, prune=True)
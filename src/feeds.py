@@ -0,0 +1,114 @@
+"""In-memory backtrader data feeds built from NumPy arrays or DataFrames.
+
+`bt.feeds.GenericCSVData` parses every CSV row with `strptime`, and `bt.feeds.PandasData` reads
+every bar with a pandas lookup. `ArrayData` instead takes the columns as arrays, with the dates
+already converted to backtrader numbers, and fills the lines of the feed with one bulk copy per
+line when cerebro preloads the data. `DataManager.feed` builds these arrays once per ticker and
+process, so adding the same ticker to many cerebro instances costs a copy, not a parse.
+"""
+import array
+
+import backtrader as bt
+import numpy as np
+
+FEED_LINES = ('datetime', 'open', 'high', 'low', 'close', 'volume', 'openinterest')
+
+_ORDINAL_EPOCH = np.datetime64('0001-01-01', 'D')
+
+
+def date2num(dates):
+    """
+    Vectorized `backtrader.date2num` of naive dates, giving the same float values.
+
+    Parameters:
+    - dates (array-like): The dates, as datetime64 values or a DatetimeIndex.
+
+    Returns:
+    - np.ndarray: The backtrader date numbers (float64).
+    """
+    dates = np.asarray(dates, dtype='datetime64[us]')
+    days = dates.astype('datetime64[D]')
+    # Same operations, in the same order, as backtrader: ordinal + h / 24 + m / 1440 + s / 86400 + us / 8.64e10.
+    microseconds = (dates - days).astype(np.int64)
+    hours, microseconds = np.divmod(microseconds, 3_600_000_000)
+    minutes, microseconds = np.divmod(microseconds, 60_000_000)
+    seconds, microseconds = np.divmod(microseconds, 1_000_000)
+    ordinal = (days - _ORDINAL_EPOCH).astype(np.int64).astype(np.float64) + 1.0
+    return ordinal + (hours / 24.0 + minutes / 1440.0 + seconds / 86400.0 + microseconds / 86400000000.0)
+
+
+def frame_arrays(df):
+    """
+    Returns the arrays of an `ArrayData` feed from a DataFrame indexed by date.
+
+    The columns are mapped by name, whatever their case: open, high, low, close, volume and
+    openinterest. Other columns are ignored.
+
+    Parameters:
+    - df (pd.DataFrame): The bars, with a DatetimeIndex.
+
+    Returns:
+    - dict: Maps 'datetime' and the price lines found in `df` to float64 arrays.
+    """
+    arrays = {'datetime': date2num(df.index)}
+    for column in df.columns:
+        name = str(column).lower()
+        if name in FEED_LINES[1:]:
+            arrays[name] = np.asarray(df[column], dtype=np.float64)
+    return arrays
+
+
+class ArrayData(bt.feed.DataBase):
+    '''Data feed reading its bars from NumPy arrays already in memory.
+
+    When cerebro preloads the data, each line is filled with a single bulk
+    copy of its array, limited to ``fromdate``/``todate`` with a binary
+    search, instead of loading the bars one by one. Feeds with filters or a
+    ``tzinput`` are loaded bar by bar, like the other feeds. The arrays are
+    only read, so the same arrays can back the feeds of many cerebros.
+
+    Params:
+      - ``dataname``: dict of 1-D arrays of the same length: ``datetime``,
+        the ascending backtrader date numbers of the bars (see ``date2num``),
+        and any of ``open``, ``high``, ``low``, ``close``, ``volume`` and
+        ``openinterest``. Missing lines are NaN.
+    '''
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        '''Returns a feed of the bars of a DataFrame indexed by date, see ``frame_arrays``.'''
+        return cls(dataname=frame_arrays(df), **kwargs)
+
+    def start(self):
+        super(ArrayData, self).start()
+        arrays = self.p.dataname
+        self._dates = np.asarray(arrays['datetime'], dtype=np.float64)
+        self._columns = [(getattr(self.lines, name), np.asarray(arrays[name], dtype=np.float64))
+                         for name in FEED_LINES if name in arrays]
+        self._index = 0
+
+    def preload(self):
+        lines = list(self.lines)
+        if self._filters or self._tzinput or not all(isinstance(line.array, array.array) for line in lines):
+            return super(ArrayData, self).preload()
+        first = int(np.searchsorted(self._dates, self.fromdate, side='left'))
+        stop = int(np.searchsorted(self._dates, self.todate, side='right'))
+        count = max(stop - first, 0)
+        loaded = {id(line) for line, _ in self._columns}
+        for line, values in self._columns:
+            line.array.frombytes(np.ascontiguousarray(values[first:first + count]).tobytes())
+        for line in lines:
+            if id(line) not in loaded:
+                line.array.frombytes(np.full(count, np.nan).tobytes())
+        self._index = len(self._dates)
+        self._last()
+        self.home()
+
+    def _load(self):
+        if self._index >= len(self._dates):
+            return False
+        index = self._index
+        for line, values in self._columns:
+            line[0] = values[index]
+        self._index += 1
+        return True
@@ -0,0 +1,224 @@
+"""Indicator lines computed over whole arrays once, and shared by every strategy and run.
+
+The functions of `FUNCTIONS` compute the lines of an indicator over the whole history of its inputs
+with NumPy, with the same values as the backtrader indicator they replace. `IndicatorCache` keeps
+their results keyed by a digest of the input values, the indicator name and its parameters, so a
+sweep or a batch that runs the same indicator on the same data (e.g. the 50 bar SMA of a ticker in
+every run of a `PairsTradingStrategy` grid) computes it once. The cache holds `maxsize` results in
+memory and, when it has a folder, also writes them to `.npz` files that later processes read back.
+
+Strategies use the results through the `Cached*` indicators of `src.indicators`, which copy the
+cached lines into their own lines instead of computing them bar by bar.
+"""
+import hashlib
+import math
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from src.vectorized import OLS_PERIOD, rolling_mean, rolling_ols_zscore
+
+# Number of results kept in memory by the shared cache.
+INDICATOR_CACHE_SIZE = 1024
+
+
+def sma(values, period=30):
+    """Lines of `btind.SimpleMovingAverage`: 'sma', NaN for the first `period - 1` bars."""
+    return dict(sma=rolling_mean(values, period))
+
+
+def rsi(values, period=14, lookback=1):
+    """
+    Lines of `btind.RelativeStrengthIndex` with its default Wilder smoothing.
+
+    The up and down moves are averaged with a smoothed moving average seeded with the simple average
+    of their first `period` values. The smoothing is a recursion, so it is computed with a loop over
+    the averages, in the same order of operations as backtrader.
+
+    Parameters:
+    - values (np.ndarray): The close prices.
+    - period (int): The smoothing period.
+    - lookback (int): Number of bars of the up and down moves.
+
+    Returns:
+    - dict: The 'rsi' array, NaN for the first `period + lookback - 1` bars.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    first = period + lookback - 1
+    if len(values) <= first:
+        return dict(rsi=out)
+    change = values[lookback:] - values[:-lookback]
+    up_moves = np.maximum(change, 0.0).tolist()
+    down_moves = np.maximum(-change, 0.0).tolist()
+    alpha = 1.0 / period
+    alpha1 = 1.0 - alpha
+    up = np.empty(len(change) - period + 1)
+    down = np.empty(len(up))
+    up[0] = up_prev = math.fsum(up_moves[:period]) / period
+    down[0] = down_prev = math.fsum(down_moves[:period]) / period
+    for i in range(1, len(up)):
+        up[i] = up_prev = up_prev * alpha1 + up_moves[i + period - 1] * alpha
+        down[i] = down_prev = down_prev * alpha1 + down_moves[i + period - 1] * alpha
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[first:] = 100.0 - 100.0 / (1.0 + up / down)
+    return dict(rsi=out)
+
+
+def crossover(values0, values1):
+    """
+    Lines of `btind.CrossOver(data0, data1)`: 'crossover' is 1.0 when data0 crosses data1 upwards,
+    -1.0 when it crosses downwards and 0.0 otherwise.
+
+    As in backtrader, the side of data0 before the bar is the sign of the last non zero difference,
+    so touching data1 and moving away again is not a cross. The line is NaN until both inputs have
+    a value and one bar has passed.
+    """
+    values0 = np.asarray(values0, dtype=np.float64)
+    values1 = np.asarray(values1, dtype=np.float64)
+    out = np.full(len(values0), np.nan)
+    difference = values0 - values1
+    valid = np.flatnonzero(~np.isnan(difference))
+    if len(valid) < 2:
+        return dict(crossover=out)
+    seed = valid[0]
+    # Last non zero difference, with the first valid difference as seed even if it is zero.
+    index = np.arange(len(difference))
+    index[seed + 1:][difference[seed + 1:] == 0.0] = 0
+    previous = difference[np.maximum.accumulate(index)][seed:-1]
+    up = (previous < 0.0) & (values0[seed + 1:] > values1[seed + 1:])
+    down = (previous > 0.0) & (values0[seed + 1:] < values1[seed + 1:])
+    out[seed + 1:] = up.astype(np.float64) - down.astype(np.float64)
+    return dict(crossover=out)
+
+
+def ols_zscore(values0, values1, period=10, ols_period=OLS_PERIOD):
+    """Lines of `btind.OLS_TransformationN(data0, data1, period)`, see `rolling_ols_zscore`."""
+    result = rolling_ols_zscore(values0, values1, period, ols_period)
+    return {name: result[name] for name in ('spread', 'spread_mean', 'spread_std', 'zscore')}
+
+
+# Indicator functions by name. Each takes the input arrays then keyword parameters, and returns a
+# dict of line name -> array of the length of the inputs.
+FUNCTIONS = dict(sma=sma, rsi=rsi, crossover=crossover, ols_zscore=ols_zscore)
+
+
+class IndicatorCache:
+    """
+    LRU cache of indicator lines computed by the functions of `FUNCTIONS`, with an optional folder
+    of `.npz` files as second tier.
+
+    Parameters:
+    - maxsize (int): Number of results kept in memory.
+    - folder (str, optional): Folder where the results are also written, and looked up when they are
+      not in memory. Nothing is written to disk if None.
+
+    Attributes:
+    - hits, disk_hits, misses (int): Lookups served from memory, from the folder, and computed.
+    """
+
+    def __init__(self, maxsize=INDICATOR_CACHE_SIZE, folder=None):
+        self.maxsize = maxsize
+        self.folder = folder
+        self.hits = self.disk_hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def key(name, inputs, params):
+        """Returns the SHA-1 hex digest of an indicator name, its parameters and its input values."""
+        digest = hashlib.sha1(repr((name, sorted(params.items()), [len(values) for values in inputs])).encode())
+        for values in inputs:
+            digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def get(self, name, inputs, **params):
+        """
+        Returns the lines of an indicator, computing them only if they are not cached.
+
+        Parameters:
+        - name (str): The indicator, a key of `FUNCTIONS`.
+        - inputs (list): The input arrays, e.g. the close prices.
+        - params: The parameters of the indicator function.
+
+        Returns:
+        - dict: Maps the line names to read-only float64 arrays.
+        """
+        key = self.key(name, inputs, params)
+        with self._lock:
+            lines = self._entries.get(key)
+            if lines is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return lines
+        lines = self._read(key)
+        if lines is None:
+            lines = FUNCTIONS[name](*inputs, **params)
+            self._write(key, lines)
+            self.misses += 1
+        else:
+            self.disk_hits += 1
+        for values in lines.values():
+            values.flags.writeable = False
+        with self._lock:
+            self._entries[key] = lines
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return lines
+
+    def _path(self, key):
+        return os.path.join(self.folder, f'{key}.npz')
+
+    def _read(self, key):
+        if not self.folder or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with np.load(self._path(key)) as stored:
+                return {name: stored[name] for name in stored.files}
+        except (OSError, ValueError):
+            # Unreadable file, e.g. written by an interrupted process: computed again.
+            return None
+
+    def _write(self, key, lines):
+        if not self.folder:
+            return
+        temp_path = os.path.join(self.folder, f'{key}.{uuid.uuid4().hex}.tmp.npz')
+        np.savez(temp_path, **lines)
+        os.replace(temp_path, self._path(key))
+
+    def clear(self):
+        """Drops the results held in memory. The files of the folder are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_shared_cache = IndicatorCache()
+
+
+def shared_cache():
+    """Returns the cache used by the `Cached*` indicators which are not given one."""
+    return _shared_cache
+
+
+def configure_cache(maxsize=INDICATOR_CACHE_SIZE, folder=None):
+    """
+    Replaces the shared cache, e.g. to keep the results on disk across processes and runs.
+
+    Parameters:
+    - maxsize (int): Number of results kept in memory.
+    - folder (str, optional): Folder of the on-disk tier, e.g. `data/cache/indicators`.
+
+    Returns:
+    - IndicatorCache: The new shared cache.
+    """
+    global _shared_cache
+    _shared_cache = IndicatorCache(maxsize, folder)
+    return _shared_cache
@@ -0,0 +1,307 @@
+import array
+import math
+from collections import deque
+
+import backtrader as bt
+import numpy as np
+
+from src.indicator_cache import shared_cache
+from src.vectorized import OLS_PERIOD, rolling_ols_zscore
+
+
+class RollingOLSTransformation(bt.Indicator):
+    '''Incremental drop-in replacement for ``btind.OLS_TransformationN``
+
+    Calculates the ``zscore`` of the spread of data0 over data1 with the same
+    lines and the same values as ``OLS_TransformationN``, without refitting a
+    statsmodels regression on every bar.
+
+    In ``next`` mode the regression sums (x, y, xy, x^2, y^2) over the last
+    ``ols_period`` bars and the spread sums over the last ``period`` bars are
+    updated in constant time when a bar enters and another one leaves the
+    window. The sums are kept around an anchor value to limit cancellation,
+    and every ``reanchor`` bars they are recomputed from the window contents
+    around new anchors, so that rounding errors cannot build up.
+
+    In ``runonce`` mode the whole lines are computed at once with NumPy,
+    with data1 aligned on the dates of data0 as in ``next`` mode.
+
+    Params:
+      - ``period``: window of the spread mean and standard deviation
+      - ``ols_period``: window of the regression. ``OLS_TransformationN`` does
+        not forward its period to ``OLS_Slope_InterceptN``, which then uses
+        its default of 10 bars
+      - ``reanchor``: number of bars between two recomputations of the sums
+    '''
+    lines = ('spread', 'spread_mean', 'spread_std', 'zscore',)
+    params = (
+        ('period', 10),
+        ('ols_period', OLS_PERIOD),
+        ('reanchor', 250),
+    )
+
+    def __init__(self):
+        self.addminperiod(self.p.ols_period + self.p.period - 1)
+        self._x = deque(maxlen=self.p.ols_period)
+        self._y = deque(maxlen=self.p.ols_period)
+        self._spreads = deque(maxlen=self.p.period)
+        self._bars = 0
+        self._anchor()
+
+    def _anchor(self):
+        # Sums are kept for (value - anchor), with anchors close to the window means.
+        n = len(self._x)
+        self._x0 = sum(self._x) / n if n else 0.0
+        self._y0 = sum(self._y) / n if n else 0.0
+        self._sx = sum(x - self._x0 for x in self._x)
+        self._sy = sum(y - self._y0 for y in self._y)
+        self._sxy = sum((x - self._x0) * (y - self._y0) for x, y in zip(self._x, self._y))
+        self._sxx = sum((x - self._x0) ** 2 for x in self._x)
+        self._syy = sum((y - self._y0) ** 2 for y in self._y)
+        m = len(self._spreads)
+        self._s0 = sum(self._spreads) / m if m else 0.0
+        self._ss = sum(s - self._s0 for s in self._spreads)
+        self._sss = sum((s - self._s0) ** 2 for s in self._spreads)
+
+    def _push(self):
+        x, y = self.data1[0], self.data0[0]
+        if len(self._x) == self.p.ols_period:
+            dx, dy = self._x[0] - self._x0, self._y[0] - self._y0
+            self._sx -= dx
+            self._sy -= dy
+            self._sxy -= dx * dy
+            self._sxx -= dx * dx
+            self._syy -= dy * dy
+        self._x.append(x)
+        self._y.append(y)
+        dx, dy = x - self._x0, y - self._y0
+        self._sx += dx
+        self._sy += dy
+        self._sxy += dx * dy
+        self._sxx += dx * dx
+        self._syy += dy * dy
+
+        self._bars += 1
+        if self._bars % self.p.reanchor == 0:
+            self._anchor()
+        if len(self._x) < self.p.ols_period:
+            return None
+
+        n = self.p.ols_period
+        x_mean, y_mean = self._sx / n, self._sy / n
+        slope = (self._sxy / n - x_mean * y_mean) / (self._sxx / n - x_mean * x_mean)
+        intercept = (y_mean + self._y0) - slope * (x_mean + self._x0)
+        spread = y - (slope * x + intercept)
+
+        if len(self._spreads) == self.p.period:
+            ds = self._spreads[0] - self._s0
+            self._ss -= ds
+            self._sss -= ds * ds
+        self._spreads.append(spread)
+        ds = spread - self._s0
+        self._ss += ds
+        self._sss += ds * ds
+        return spread
+
+    def prenext(self):
+        spread = self._push()
+        if spread is not None:
+            self.lines.spread[0] = spread
+
+    def next(self):
+        spread = self._push()
+        m = self.p.period
+        mean = self._ss / m
+        variance = self._sss / m - mean * mean
+        self.lines.spread[0] = spread
+        self.lines.spread_mean[0] = mean + self._s0
+        self.lines.spread_std[0] = std = math.sqrt(variance) if variance > 0 else 0.0
+        self.lines.zscore[0] = (spread - self._s0 - mean) / std if std else float('nan')
+
+    def once(self, start, end):
+        y, x = (values[:end] for values in _aligned_inputs([self.data0, self.data1]))
+        result = rolling_ols_zscore(y, x, self.p.period, self.p.ols_period)
+        for name in self.lines.getlinealiases():
+            values = result[name][start:end]
+            getattr(self.lines, name).array[start:end] = array.array('d', values.tolist())
+
+    def oncestart(self, start, end):
+        self.once(start, end)
+
+
+class CachedIndicator(bt.Indicator):
+    '''Base of the indicators whose lines are read from an ``IndicatorCache``
+
+    The lines are computed over the whole input arrays by the function
+    ``function`` of ``src.indicator_cache.FUNCTIONS``, once for given input
+    values and parameters, and shared with every other indicator, strategy
+    and run with the same inputs. They are then copied to the lines of the
+    indicator: with one bulk copy per line in ``runonce`` mode, bar by bar in
+    ``next`` mode.
+
+    The whole input arrays must be known from the first bar: the inputs are
+    preloaded data feeds, other cached indicators, or any line in
+    ``runonce`` mode. Feeds which are not preloaded (see
+    ``src.streaming``) need the backtrader indicators instead.
+
+    Several feeds are aligned on the dates of the first one, like in
+    ``next`` mode: a feed without a bar on one of its dates, e.g. before a
+    late listing, gives NaN there. Other inputs must have the length of the
+    first one.
+
+    Subclasses set ``function`` and ``lines`` like the function's result,
+    return the parameters of the function from ``_arguments`` and set their
+    minimum period like the indicator they replace.
+
+    Params:
+      - ``cache``: the ``IndicatorCache`` to use, by default the shared
+        cache of ``src.indicator_cache``
+    '''
+    function = None
+    params = (('cache', None),)
+
+    def _arguments(self):
+        return {}
+
+    def whole_lines(self):
+        '''Returns the dict of the whole lines, as read-only NumPy arrays.'''
+        lines = getattr(self, '_whole', None)
+        if lines is None:
+            inputs = _aligned_inputs(self.datas)
+            cache = shared_cache() if self.p.cache is None else self.p.cache
+            lines = self._whole = cache.get(self.function, inputs, **self._arguments())
+        return lines
+
+    def once(self, start, end):
+        lines = self.whole_lines()
+        for name in self.lines.getlinealiases():
+            values = lines[name][start:end]
+            getattr(self.lines, name).array[start:end] = array.array('d', values.tobytes())
+
+    def oncestart(self, start, end):
+        self.once(start, end)
+
+    def next(self):
+        lines = self.whole_lines()
+        bar = len(self) - 1
+        for name in self.lines.getlinealiases():
+            values = lines[name]
+            if bar >= len(values):
+                raise RuntimeError(f'{type(self).__name__} needs the whole input arrays: preload the data '
+                                   'or use the backtrader indicator.')
+            getattr(self.lines, name)[0] = values[bar]
+
+    def prenext(self):
+        self.next()
+
+
+def _aligned_inputs(datas):
+    inputs = [_whole_array(data) for data in datas]
+    if len(datas) < 2:
+        return inputs
+    clock = datas[0]
+    dates = np.frombuffer(clock.datetime.array, dtype=np.float64) if _is_feed(clock) else None
+    for index, data in enumerate(datas[1:], start=1):
+        if dates is not None and _is_feed(data):
+            other = np.frombuffer(data.datetime.array, dtype=np.float64)
+            if len(other) == len(dates) and np.array_equal(other, dates):
+                continue
+            rows = np.minimum(np.searchsorted(other, dates), len(other) - 1)
+            inputs[index] = np.where(other[rows] == dates, inputs[index][rows], np.nan)
+        elif len(inputs[index]) != len(inputs[0]):
+            raise ValueError(f'The inputs of a cached indicator must be feeds or have the same length, got '
+                             f'{len(inputs[0])} and {len(inputs[index])} values.')
+    return inputs
+
+
+def _is_feed(data):
+    return isinstance(data, bt.AbstractDataBase)
+
+
+def _whole_array(data):
+    if isinstance(data, CachedIndicator):
+        return data.whole_lines()[data.lines.getlinealiases()[0]]
+    if not isinstance(data.array, array.array):
+        raise RuntimeError('Cached indicators need the whole input arrays: preload the data and do not '
+                           'use exactbars.')
+    return np.frombuffer(data.array, dtype=np.float64)
+
+
+class CachedSMA(CachedIndicator):
+    '''``btind.SimpleMovingAverage`` computed once per data and period
+
+    Params:
+      - ``period``: number of bars of the average
+    '''
+    function = 'sma'
+    lines = ('sma',)
+    params = (('period', 30),)
+
+    def __init__(self):
+        self.addminperiod(self.p.period)
+
+    def _arguments(self):
+        return dict(period=self.p.period)
+
+
+class CachedRSI(CachedIndicator):
+    '''``btind.RelativeStrengthIndex`` (Wilder smoothing) computed once per
+    data and period
+
+    Params:
+      - ``period``: smoothing period of the up and down moves
+      - ``lookback``: number of bars of the up and down moves
+      - ``upperband``, ``lowerband``: overbought and oversold levels, as in
+        ``btind.RelativeStrengthIndex``
+    '''
+    function = 'rsi'
+    lines = ('rsi',)
+    params = (
+        ('period', 14),
+        ('lookback', 1),
+        ('upperband', 70.0),
+        ('lowerband', 30.0),
+    )
+
+    def __init__(self):
+        self.addminperiod(self.p.period + self.p.lookback)
+
+    def _arguments(self):
+        return dict(period=self.p.period, lookback=self.p.lookback)
+
+
+class CachedCrossOver(CachedIndicator):
+    '''``btind.CrossOver`` of data0 over data1 computed once per inputs
+
+    1.0 when data0 crosses data1 upwards, -1.0 downwards, 0.0 otherwise.
+    '''
+    function = 'crossover'
+    lines = ('crossover',)
+
+    def __init__(self):
+        self.addminperiod(2)
+
+
+class CachedOLSTransformation(CachedIndicator):
+    '''``btind.OLS_TransformationN`` computed once per pair and periods
+
+    Same lines and values as ``RollingOLSTransformation`` in ``runonce``
+    mode, shared by every run of the pair, e.g. in a parameter sweep.
+
+    Params:
+      - ``period``: window of the spread mean and standard deviation
+      - ``ols_period``: window of the regression, see
+        ``RollingOLSTransformation``
+    '''
+    function = 'ols_zscore'
+    lines = ('spread', 'spread_mean', 'spread_std', 'zscore',)
+    params = (
+        ('period', 10),
+        ('ols_period', OLS_PERIOD),
+    )
+
+    def __init__(self):
+        self.addminperiod(self.p.ols_period + self.p.period - 1)
+
+    def _arguments(self):
+        return dict(period=self.p.period, ols_period=self.p.ols_period)
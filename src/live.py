@@ -0,0 +1,252 @@
+"""Incremental signals of `PairsTradingStrategy` for live or paper trading.
+
+`PairsSignalEngine` keeps the state that the strategy rebuilds from the whole history in a
+`cerebro.run()`: ring buffers of the last closes of every ticker and of the last spreads of every
+pair, and the status and quantities of every pair. Each new bar updates all the pairs at once with
+NumPy, as `PairsPortfolioStrategy` does, and returns the orders the strategy would send on that
+bar. The state is checkpointed to a single `.npz` file, so a restarted service goes on from the
+last bar it saw instead of replaying the history:
+
+    engine = PairsSignalEngine.load(path) if os.path.exists(path) else PairsSignalEngine(pairs)
+    signals = engine.update(date, closes)
+    engine.save(path)
+
+`replay` feeds the bars of the price files to an engine one date at a time, as a simulated live
+feed.
+"""
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from src.data_manager import DataManager
+from src.vectorized import OLS_PERIOD, SMA_PERIOD
+
+# Parameters of the engine saved with its state, with the defaults of `PairsTradingStrategy`.
+ENGINE_PARAMS = dict(
+    period=20,
+    qty1=0,
+    qty2=0,
+    upper=2.5,
+    lower=-2.5,
+    up_medium=0.5,
+    low_medium=-0.5,
+    status=0,
+    portfolio_value=100000,
+)
+STATE_ARRAYS = ('closes', 'spreads', 'bars', 'qty', 'status', 'holdings', 'zscore', 'capital')
+
+
+class PairsSignalEngine:
+    """
+    Computes the signals of `PairsTradingStrategy` for many pairs, one bar at a time.
+
+    The z-score is the one of `btind.OLS_TransformationN`: y is regressed on x over the last 10 bars,
+    and the spread is compared with its mean and standard deviation over `period` bars. Positions are
+    sized with the deviation of the closes from their 50 bar SMAs, as in the strategy. The close
+    orders of a pair flatten its holdings. By default the engine assumes that its orders are filled,
+    so the holdings are the sums of the orders, and the signals are those of a backtest whose broker
+    fills every order. With a real broker, set `assume_fills` to False and report the executions with
+    `record_fill`.
+
+    Parameters:
+    - pairs (list): The (ticker1, ticker2) pairs, ticker1 being regressed on ticker2.
+    - assume_fills (bool): Book the orders to the holdings when they are returned.
+    - portfolio_value (float or list): The capital of each pair, or one per pair.
+    - params: The other parameters of `PairsTradingStrategy`, see `ENGINE_PARAMS`.
+
+    Attributes:
+    - pairs, tickers (list): The pairs, and their distinct tickers in order of appearance.
+    - zscore (np.ndarray): The z-score of every pair at the last bar, NaN until it is defined.
+    - last_date (pd.Timestamp): The date of the last bar, None before the first one.
+    """
+
+    def __init__(self, pairs, assume_fills=True, **params):
+        unknown = set(params) - set(ENGINE_PARAMS)
+        if unknown:
+            raise ValueError(f'Unknown parameters: {", ".join(sorted(unknown))}.')
+        self.params = dict(ENGINE_PARAMS, **params)
+        self.pairs = [tuple(pair) for pair in pairs]
+        if not self.pairs:
+            raise ValueError('PairsSignalEngine needs at least one pair.')
+        self.tickers = list(dict.fromkeys(ticker for pair in self.pairs for ticker in pair))
+        self.column = {ticker: index for index, ticker in enumerate(self.tickers)}
+        self.left = np.array([self.column[pair[0]] for pair in self.pairs])
+        self.right = np.array([self.column[pair[1]] for pair in self.pairs])
+        self.assume_fills = assume_fills
+        self.last_date = None
+
+        n_pairs = len(self.pairs)
+        p = self.params
+        # Ring buffers: row `bars % length` holds the latest value.
+        self.window = max(SMA_PERIOD, OLS_PERIOD)
+        self.closes = np.full((self.window, len(self.tickers)), np.nan)
+        self.spreads = np.full((p['period'], n_pairs), np.nan)
+        self.bars = np.zeros(1, dtype=np.int64)
+        self.qty = np.tile(np.array([p['qty1'], p['qty2']], dtype=np.int64), (n_pairs, 1))
+        self.status = np.full(n_pairs, p['status'], dtype=np.int8)
+        self.holdings = np.zeros((n_pairs, 2), dtype=np.int64)
+        self.zscore = np.full(n_pairs, np.nan)
+        self.capital = np.broadcast_to(np.asarray(p['portfolio_value'], dtype=np.float64), (n_pairs,)).copy()
+        self.params['portfolio_value'] = None  # kept in `capital`
+
+    def _closes(self, closes):
+        if isinstance(closes, (dict, pd.Series)):
+            return np.array([closes.get(ticker, np.nan) for ticker in self.tickers], dtype=np.float64)
+        closes = np.asarray(closes, dtype=np.float64)
+        if closes.shape != (len(self.tickers),):
+            raise ValueError(f'Expected {len(self.tickers)} closes, in the order of the tickers of the engine.')
+        return closes
+
+    def update(self, date, closes):
+        """
+        Adds the closes of a new bar and returns the orders of the pairs with a signal on that bar.
+
+        Bars dated before or on the last bar seen are ignored, so the bars already in a checkpoint can
+        be sent again after a restart.
+
+        Parameters:
+        - date: The date of the bar.
+        - closes (dict, pd.Series or array): The closes by ticker, or an array in the order of
+          `tickers`. A missing or NaN close makes the pairs of its ticker inactive for the bar. The
+          last close of the ticker is carried forward in the buffers, so its SMA and z-scores are
+          defined again on the next bar.
+
+        Returns:
+        - list: One dict per signal with the pair index, ticker1, ticker2, action ('short', 'long' or
+          'close'), the signed order sizes size1 and size2 of the two legs and the z-score.
+        """
+        date = pd.Timestamp(date)
+        if self.last_date is not None and date <= self.last_date:
+            return []
+        closes = self._closes(closes)
+        self.last_date = date
+        sma = self._step(closes)
+        return self._signals(closes, sma)
+
+    def _step(self, closes):
+        bar = int(self.bars[0])
+        row = bar % self.window
+        # A missing close carries the previous one forward. The buffer stays NaN until the first close
+        # of the ticker, e.g. before its listing.
+        self.closes[row] = np.where(np.isnan(closes), self.closes[(row - 1) % self.window], closes)
+        closes = self.closes[row]
+        window = self.closes[(row - np.arange(OLS_PERIOD)) % self.window]
+        y, x = window[:, self.left], window[:, self.right]
+        x_mean, y_mean = x.mean(axis=0), y.mean(axis=0)
+        x_dev = x - x_mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = (x_dev * (y - y_mean)).sum(axis=0) / (x_dev * x_dev).sum(axis=0)
+            intercept = y_mean - slope * x_mean
+            spread = closes[self.left] - (slope * closes[self.right] + intercept)
+            self.spreads[bar % len(self.spreads)] = spread
+            mean = self.spreads.mean(axis=0)
+            std = np.sqrt((self.spreads * self.spreads).mean(axis=0) - mean * mean)
+            self.zscore = (spread - mean) / std
+        self.bars += 1
+        return self.closes[(row - np.arange(SMA_PERIOD)) % self.window].mean(axis=0)
+
+    def _signals(self, closes, sma):
+        p = self.params
+        z = self.zscore
+        active = np.isfinite(z) & np.isfinite(sma[self.left]) & np.isfinite(sma[self.right])
+        active &= np.isfinite(closes[self.left]) & np.isfinite(closes[self.right])
+        with np.errstate(invalid='ignore'):
+            short = active & (z > p['upper']) & (self.status != 1)
+            long = active & ~short & (z < p['lower']) & (self.status != 2)
+            flat = active & ~short & ~long & (z < p['up_medium']) & (z > p['low_medium']) & self.holdings.any(axis=1)
+
+        signals = []
+        for pair in np.flatnonzero(short | long | flat):
+            if flat[pair]:
+                sizes = -self.holdings[pair]
+                action = 'close'
+            else:
+                close1, close2 = closes[self.left[pair]], closes[self.right[pair]]
+                value1, value2 = 0.6 * self.capital[pair], 0.4 * self.capital[pair]
+                if abs(close1 / sma[self.left[pair]] - 1) > abs(close2 / sma[self.right[pair]] - 1):
+                    x, y = int(value1 / close1), int(value2 / close2)
+                else:
+                    x, y = int(value2 / close1), int(value1 / close2)
+                sizes = np.array([x + self.qty[pair, 0], -(y + self.qty[pair, 1])])
+                if short[pair]:
+                    sizes, action = -sizes, 'short'
+                    self.status[pair] = 1
+                else:
+                    action = 'long'
+                    self.status[pair] = 2
+                self.qty[pair] = x, y
+            if self.assume_fills:
+                self.holdings[pair] += sizes
+            ticker1, ticker2 = self.pairs[pair]
+            signals.append(dict(pair=int(pair), ticker1=ticker1, ticker2=ticker2, action=action,
+                                size1=int(sizes[0]), size2=int(sizes[1]), zscore=float(z[pair])))
+        return signals
+
+    def record_fill(self, pair, size1=0, size2=0):
+        """
+        Books executed sizes to the holdings of a pair, when the engine does not assume fills.
+
+        Parameters:
+        - pair (int): The index of the pair, as in the signals.
+        - size1 (int): The signed size executed on ticker1.
+        - size2 (int): The signed size executed on ticker2.
+        """
+        self.holdings[pair] += (size1, size2)
+
+    def save(self, path):
+        """
+        Writes the state of the engine to a `.npz` file, replacing it atomically.
+
+        Parameters:
+        - path (str): The checkpoint file.
+        """
+        config = dict(pairs=self.pairs, params=self.params, assume_fills=self.assume_fills,
+                      last_date=None if self.last_date is None else self.last_date.isoformat())
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp.npz'
+        np.savez(temp_path, config=np.array(json.dumps(config)),
+                 **{name: getattr(self, name) for name in STATE_ARRAYS})
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Restores an engine from a checkpoint written by `save`.
+
+        Parameters:
+        - path (str): The checkpoint file.
+
+        Returns:
+        - PairsSignalEngine: The engine, ready for the bar following the last one it saw.
+        """
+        with np.load(path) as stored:
+            config = json.loads(str(stored['config']))
+            params = {name: value for name, value in config['params'].items() if name != 'portfolio_value'}
+            engine = cls(config['pairs'], assume_fills=config['assume_fills'], portfolio_value=stored['capital'],
+                         **params)
+            for name in STATE_ARRAYS:
+                getattr(engine, name)[...] = stored[name]
+        engine.last_date = None if config['last_date'] is None else pd.Timestamp(config['last_date'])
+        return engine
+
+
+def replay(engine, data_manager=None, start=None, end=None):
+    """
+    Feeds the closes of the price files to an engine one date at a time, as a simulated live feed.
+
+    Parameters:
+    - engine (PairsSignalEngine): The engine, which keeps its state after the replay.
+    - data_manager (DataManager, optional): The data manager of the price files.
+    - start (str, optional): First date, e.g. '2023-01-01'.
+    - end (str, optional): Last date, inclusive.
+
+    Yields:
+    - tuple: The date of each bar and the list of its signals, see `PairsSignalEngine.update`.
+    """
+    data_manager = data_manager or DataManager()
+    panel = data_manager.load_panel(engine.tickers, start=start, end=end)
+    closes = panel.field('close')
+    for date, row in zip(panel.dates, closes):
+        yield date, engine.update(date, row)
@@ -0,0 +1,247 @@
+"""Parameter sweeps of the strategies over a fixed set of tickers.
+
+The prices of the tickers are loaded once and published to the worker processes through
+`src.parallel.SharedPriceMatrix`. Each worker builds the feed DataFrames once and reuses them for
+every combination it runs. Results are memoized on disk, keyed by the strategy and its parameters
+(with the source code of the strategy, of the classes among the parameters and of `ENGINE_MODULES`),
+the starting cash and a fingerprint of the price data, so re-running a sweep only evaluates the
+points that are missing, and a change of the code evaluates them again.
+"""
+import contextlib
+import functools
+import hashlib
+import importlib
+import inspect
+import io
+import itertools
+import json
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+from src.data_manager import DataManager, default_cache_folder
+from src.events import add_event_recorder, log_path
+from src.parallel import OHLCV_FIELDS, SharedPriceMatrix, adjusted_fields, map_tasks, worker_state
+
+# Modules whose code changes the result of any backtest, e.g. the feeds and the indicators.
+ENGINE_MODULES = ('src.analyzer', 'src.feeds', 'src.indicators', 'src.indicator_cache', 'src.vectorized')
+
+
+def grid(**values):
+    """
+    Returns every combination of the given parameter values.
+
+    Example: grid(period=[10, 20], upper=[2.0, 2.5]) gives 4 dicts.
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def random_points(n, seed=None, **space):
+    """
+    Draws `n` random parameter combinations.
+
+    Each parameter is given as a list of values to choose from, or as a (low, high) tuple: integers
+    are then drawn uniformly in [low, high] and floats uniformly in [low, high).
+
+    Example: random_points(100, seed=1, period=(10, 60), upper=(1.5, 3.0), stake=[10, 20])
+    """
+    rng = random.Random(seed)
+    points = []
+    for _ in range(n):
+        point = {}
+        for name, domain in space.items():
+            if isinstance(domain, tuple):
+                low, high = domain
+                if isinstance(low, int) and isinstance(high, int):
+                    point[name] = rng.randint(low, high)
+                else:
+                    point[name] = rng.uniform(low, high)
+            else:
+                point[name] = rng.choice(list(domain))
+        points.append(point)
+    return points
+
+
+def describe(value):
+    """Returns a JSON friendly description of a parameter value (classes by their dotted name)."""
+    if isinstance(value, type):
+        return f'{value.__module__}.{value.__qualname__}'
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def source_of(obj):
+    """Returns the source code of a class or module, or None if it is not available."""
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def engine_digest():
+    """Returns a SHA-1 hex digest of the source code of `ENGINE_MODULES`, part of the keys of cached runs."""
+    digest = hashlib.sha1()
+    for name in ENGINE_MODULES:
+        digest.update((source_of(importlib.import_module(name)) or name).encode())
+    return digest.hexdigest()
+
+
+def params_digest(params):
+    """Returns a SHA-1 hex digest of a parameter dict, the name of its event log in a sweep."""
+    description = {name: describe(value) for name, value in sorted(params.items())}
+    return hashlib.sha1(json.dumps(description, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def _feed_arrays(columns):
+    """Returns the feed arrays of the given matrix columns over their common dates, built once per worker."""
+    from src.feeds import date2num
+
+    worker = worker_state()
+    feeds = worker.setdefault('feeds', {})
+    if columns not in feeds:
+        close = worker['values'][worker['fields'].index('close')][:, list(columns)]
+        rows = np.isfinite(close).all(axis=1)
+        datenums = date2num(worker['dates'][rows])
+        feeds[columns] = [
+            dict({name: worker['values'][index, rows, column] for index, name in enumerate(worker['fields'])},
+                 datetime=datenums)
+            for column in columns
+        ]
+    return feeds[columns]
+
+
+def _sweep_chunk(points, strategy, columns, cash, quiet, events=None):
+    """Runs one backtest of `strategy` for every parameter dict of a chunk."""
+    import backtrader as bt
+    from src.analyzer import AnalyzerSuite
+    from src.feeds import ArrayData
+
+    feeds = _feed_arrays(columns)
+    tickers = worker_state()['tickers']
+    rows = []
+    for params in points:
+        cerebro = bt.Cerebro(stdstats=False)
+        for column, arrays in zip(columns, feeds):
+            cerebro.adddata(ArrayData(dataname=arrays), name=tickers[column])
+        cerebro.addstrategy(strategy, **params)
+        cerebro.broker.setcash(cash)
+        AnalyzerSuite.defineRecorder(cerebro)
+        if events is not None:
+            add_event_recorder(cerebro, log_path(events, params_digest(params)))
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            thestrats = cerebro.run()
+        metrics = AnalyzerSuite.returnMetrics(thestrats)[0]
+        del metrics['strategy']
+        rows.append(metrics)
+    return rows
+
+
+class ParameterSweep:
+    """
+    Evaluates many parameter combinations of a strategy on the same tickers.
+
+    Parameters:
+    - strategy (backtrader.Strategy): The strategy class.
+    - tickers (list): The tickers added as data0, data1, ... over their common dates.
+    - data_manager (DataManager, optional): The data manager used to load the tickers.
+    - cash (float): Starting cash of every backtest.
+    - cache_folder (str, optional): Folder of the memoized results. Defaults to `sweeps` in the price
+      store folder. Set to False to disable memoization.
+    - quiet (bool): Hide what the strategies print.
+    - adjusted (bool): Trade the split and dividend adjusted prices. The raw prices by default, which
+      keeps the results comparable with the vectorized engine and the memoized ones.
+    - events (str, optional): Folder where the orders and trades of every point are recorded by an
+      `EventRecorder`, in a file named after `params_digest` of the point. The points are then all run,
+      memoized or not. Not recorded if None.
+    """
+
+    def __init__(self, strategy, tickers, data_manager=None, cash=100_000.0, cache_folder=None, quiet=True,
+                 adjusted=False, events=None):
+        self.strategy = strategy
+        self.tickers = list(tickers)
+        self.data_manager = data_manager or DataManager()
+        self.cash = cash
+        self.quiet = quiet
+        self.adjusted = adjusted
+        self.events = events
+        fields = adjusted_fields(OHLCV_FIELDS) if adjusted else OHLCV_FIELDS
+        self.panel = self.data_manager.load_panel(self.tickers, fields=fields)
+        self.fingerprint = self.panel.fingerprint()
+        if cache_folder is None:
+            cache_folder = os.path.join(default_cache_folder(self.data_manager.data_folder), 'sweeps')
+        self.cache_path = os.path.join(cache_folder, 'results.jsonl') if cache_folder else None
+        self._memo = self._load_memo()
+
+    def _load_memo(self):
+        memo = {}
+        if self.cache_path and os.path.exists(self.cache_path):
+            with open(self.cache_path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Line cut by an interrupted run.
+                    memo[entry['key']] = entry['metrics']
+        return memo
+
+    def key(self, params):
+        """Returns the memoization key of a parameter combination."""
+        description = dict(
+            strategy=describe(self.strategy),
+            source=source_of(self.strategy),
+            params={name: describe(value) for name, value in sorted(params.items())},
+            param_sources={name: source_of(value) for name, value in sorted(params.items()) if isinstance(value, type)},
+            engine=engine_digest(),
+            tickers=self.tickers,
+            cash=self.cash,
+            data=self.fingerprint,
+            adjusted=self.adjusted,
+            metrics='recorder',
+        )
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def _save(self, points, results):
+        entries = [dict(key=self.key(params), metrics=metrics) for params, metrics in zip(points, results)]
+        for entry in entries:
+            self._memo[entry['key']] = entry['metrics']
+        if self.cache_path:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'a') as file:
+                file.write(''.join(json.dumps(entry, default=describe) + '\n' for entry in entries))
+
+    def run(self, points, workers=None, chunk_size=None):
+        """
+        Evaluates the parameter combinations that are not memoized yet, in parallel.
+
+        Results are saved after every chunk, so an interrupted sweep resumes where it stopped. With
+        `events`, every combination is evaluated, since the memo holds no events.
+
+        Parameters:
+        - points (list): The parameter dicts, e.g. from `grid` or `random_points`.
+        - workers (int, optional): Number of processes. Defaults to the number of CPUs.
+        - chunk_size (int, optional): Number of combinations per task.
+
+        Returns:
+        - pd.DataFrame: One row per point with its parameters and the `Recorder` metrics, and the path of
+          its event log in an 'events' column with `events`.
+        """
+        points = [dict(point) for point in points]
+        missing = list({self.key(point): point for point in points
+                        if self.events is not None or self.key(point) not in self._memo}.values())
+        if missing:
+            matrix = SharedPriceMatrix(self.panel.values, self.panel.dates, self.tickers, OHLCV_FIELDS)
+            with matrix:
+                columns = tuple(range(len(self.tickers)))
+                map_tasks(matrix, missing, _sweep_chunk, (self.strategy, columns, self.cash, self.quiet, self.events),
+                          workers=workers, chunk_size=chunk_size, callback=self._save)
+        rows = [dict({name: describe(value) for name, value in point.items()}, **self._memo[self.key(point)])
+                for point in points]
+        if self.events is not None:
+            for row, point in zip(rows, points):
+                row['events'] = log_path(self.events, params_digest(point))
+        return pd.DataFrame(rows)
@@ -0,0 +1,324 @@
+"""Process pool execution of pair tests and pair backtests.
+
+The prices of the universe are published once in a shared memory block. Every worker attaches to
+that block when it starts, so tasks only carry the (i, j) column indices of the pairs they process
+instead of pickled DataFrames. Pairs are split in chunks and the results are gathered back in the
+order of the input pairs, whatever the order in which the workers finish.
+"""
+import contextlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from src.data_manager import DataManager
+
+OHLCV_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+# Fields published by `SharedPriceMatrix.from_tickers`: the feeds of the backtests and the adjusted
+# closes of the pair tests, so that one matrix serves both.
+MATRIX_FIELDS = OHLCV_FIELDS + ('adj_close',)
+
+# State of a worker process, set by `_attach_worker`.
+_worker = {}
+
+
+class SharedPriceMatrix:
+    """
+    A (fields x dates x tickers) float64 price array published in shared memory.
+
+    Missing values (dates before a ticker was listed) are stored as NaN. The object owning the block
+    must call `close()` once the workers are done, or be used as a context manager.
+    """
+
+    def __init__(self, values, dates, tickers, fields=OHLCV_FIELDS):
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (len(fields), len(dates), len(tickers)):
+            raise ValueError('The price array shape does not match the fields, dates and tickers.')
+        self.dates = pd.DatetimeIndex(dates)
+        self.tickers = list(tickers)
+        self.fields = tuple(fields)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        self.values = np.ndarray(values.shape, dtype=np.float64, buffer=self._shm.buf)
+        self.values[...] = values
+
+    @classmethod
+    def from_tickers(cls, tickers, data_manager=None, fields=MATRIX_FIELDS, start=None, end=None, adjusted=False):
+        """
+        Loads the panel of the given tickers, optionally between two dates, and publishes it.
+
+        With `adjusted`, the split and dividend adjusted prices are published under the names of the
+        raw ones, so the feeds of the workers trade them unchanged. 'adj_close' is published as is.
+        """
+        data_manager = data_manager or DataManager()
+        panel = data_manager.load_panel(tickers, fields=adjusted_fields(fields) if adjusted else fields,
+                                        start=start, end=end)
+        return cls(panel.values, panel.dates, panel.tickers, fields)
+
+    def descriptor(self):
+        """Returns what a worker needs to attach to the block. It is pickled once per worker."""
+        return dict(name=self._shm.name, shape=self.values.shape, dates=self.dates.to_numpy(),
+                    tickers=self.tickers, fields=self.fields)
+
+    def close(self):
+        """Releases and removes the shared memory block."""
+        if self._shm is not None:
+            del self.values
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def adjusted_fields(fields):
+    """Returns the fields with the adjusted price columns (e.g. 'adj_close') in place of the raw prices."""
+    return tuple(f'adj_{field}' if field in PRICE_FIELDS else field for field in fields)
+
+
+def _attach_worker(descriptor):
+    """Pool initializer: maps the shared price block into the worker."""
+    shm = shared_memory.SharedMemory(name=descriptor['name'])
+    _worker['shm'] = shm
+    _worker['values'] = np.ndarray(descriptor['shape'], dtype=np.float64, buffer=shm.buf)
+    _worker['dates'] = pd.DatetimeIndex(descriptor['dates'])
+    _worker['tickers'] = descriptor['tickers']
+    _worker['fields'] = descriptor['fields']
+
+
+def worker_state():
+    """
+    Returns the state of the current worker: the 'values', 'dates', 'tickers' and 'fields' of the
+    published matrix. Chunk functions may also keep there what they reuse across their chunks.
+    """
+    return _worker
+
+
+def _use_local(matrix):
+    """Makes the in-process state look like an attached worker, for runs without a pool."""
+    _worker.update(values=matrix.values, dates=matrix.dates, tickers=matrix.tickers, fields=matrix.fields)
+
+
+def _series(field, column):
+    """Returns the valid part of one field of one ticker as a pd.Series."""
+    _require_field(_worker['fields'], field)
+    values = _worker['values'][_worker['fields'].index(field), :, column]
+    series = pd.Series(values, index=_worker['dates'], name=_worker['tickers'][column])
+    return series[np.isfinite(values)]
+
+
+def _require_field(fields, field):
+    if field not in fields:
+        raise ValueError(f"The price matrix has no '{field}' field, it holds {', '.join(fields)}.")
+
+
+def _feed(column, rows):
+    """Returns an in-memory feed of the OHLCV fields of one ticker over the selected rows."""
+    from src.feeds import ArrayData, date2num
+
+    if 'datenums' not in _worker:
+        _worker['datenums'] = date2num(_worker['dates'])
+    arrays = {name: _worker['values'][_worker['fields'].index(name), rows, column] for name in OHLCV_FIELDS}
+    arrays['datetime'] = _worker['datenums'][rows]
+    return ArrayData(dataname=arrays)
+
+
+def _pair_test_chunk(pairs):
+    """Runs the Engle & Granger test for a chunk of (i, j) pairs."""
+    from src.utils import TimeSeriesAnalysis
+
+    rows = []
+    for i, j in pairs:
+        df1 = _series('adj_close', i)
+        df2 = _series('adj_close', j)
+        common = df1.index.intersection(df2.index)
+        adfstat, pvalue = TimeSeriesAnalysis.engle_granger_two_step_cointegration_test(df1[common], df2[common])
+        rows.append((adfstat, pvalue, len(common)))
+    return rows
+
+
+def _backtest_chunk(pairs, strategy, params, cash, quiet=False, events=None):
+    """Runs one backtest of `strategy` for every (i, j) pair of a chunk."""
+    import backtrader as bt
+    from src.analyzer import AnalyzerSuite
+    from src.events import add_event_recorder, log_path
+
+    close = _worker['values'][_worker['fields'].index('close')]
+    rows = []
+    for i, j in pairs:
+        # Both legs are traded over the dates where the two tickers are listed.
+        common = np.isfinite(close[:, i]) & np.isfinite(close[:, j])
+        cerebro = bt.Cerebro(stdstats=False)
+        for column in (i, j):
+            cerebro.adddata(_feed(column, common), name=_worker['tickers'][column])
+        cerebro.addstrategy(strategy, **params)
+        cerebro.broker.setcash(cash)
+        AnalyzerSuite.defineRecorder(cerebro)
+        if events is not None:
+            add_event_recorder(cerebro, log_path(events, _worker['tickers'][i], _worker['tickers'][j]))
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            thestrats = cerebro.run()
+        metrics = AnalyzerSuite.returnMetrics(thestrats)[0]
+        del metrics['strategy']
+        rows.append(metrics)
+    return rows
+
+
+def _chunks(tasks, chunk_size):
+    return [tasks[start:start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+
+
+def _default_chunk_size(n_tasks, workers):
+    # About four chunks per worker keeps the pool busy while finishing workers pick up the tail.
+    return max(1, -(-n_tasks // (4 * workers)))
+
+
+def _pair_indices(matrix, pairs):
+    index = {ticker: column for column, ticker in enumerate(matrix.tickers)}
+    return [(index[ticker1], index[ticker2]) for ticker1, ticker2 in pairs]
+
+
+def map_tasks(matrix, tasks, func, args=(), workers=None, chunk_size=None, callback=None):
+    """
+    Applies `func(chunk, *args)` to chunks of tasks over a process pool sharing `matrix`.
+
+    `func` must be a module level function returning one result per task of its chunk. Results are
+    returned in the order of `tasks`. With `workers=1` the chunks are run in the current process.
+
+    Parameters:
+    - matrix (SharedPriceMatrix): The prices the workers read from.
+    - tasks (list): Small picklable task descriptions, e.g. (i, j) column indices.
+    - func (callable): The chunk function.
+    - args (tuple): Extra arguments passed to every call of `func`.
+    - workers (int, optional): Number of processes. Defaults to the number of CPUs.
+    - chunk_size (int, optional): Number of tasks per chunk. Defaults to about four chunks per worker.
+    - callback (callable, optional): Called with `(chunk, results)` as soon as a chunk is done,
+      in completion order. Useful to save partial results of long runs.
+
+    Returns:
+    - list: One result per task.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(list(tasks), chunk_size or _default_chunk_size(len(tasks), workers))
+    results = [None] * len(chunks)
+    if workers == 1 or len(chunks) <= 1:
+        _use_local(matrix)
+        try:
+            for index, chunk in enumerate(chunks):
+                results[index] = func(chunk, *args)
+                if callback is not None:
+                    callback(chunk, results[index])
+        finally:
+            _worker.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker,
+                                 initargs=(matrix.descriptor(),)) as pool:
+            futures = {pool.submit(func, chunk, *args): index for index, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                if callback is not None:
+                    callback(chunks[index], results[index])
+    return [row for chunk in results for row in chunk]
+
+
+def map_pairs(matrix, pairs, func, args=(), workers=None, chunk_size=None):
+    """
+    Applies `func(chunk, *args)` to chunks of pairs over a process pool.
+
+    The chunks hold the (i, j) column indices of the pairs in `matrix`, see `map_tasks`.
+
+    Parameters:
+    - matrix (SharedPriceMatrix): The prices the workers read from.
+    - pairs (list): List of (ticker1, ticker2) tuples.
+    - func (callable): The chunk function.
+    - args (tuple): Extra arguments passed to every call of `func`.
+    - workers (int, optional): Number of processes. Defaults to the number of CPUs.
+    - chunk_size (int, optional): Number of pairs per task. Defaults to about four tasks per worker.
+
+    Returns:
+    - list: One result per pair.
+    """
+    return map_tasks(matrix, _pair_indices(matrix, pairs), func, args, workers, chunk_size)
+
+
+def run_pair_tests(pairs, matrix=None, data_manager=None, workers=None, chunk_size=None):
+    """
+    Runs `TimeSeriesAnalysis.engle_granger_two_step_cointegration_test` for many pairs in parallel.
+
+    The tests regress the adjusted closes, like `TimeSeriesAnalysis.scan_pairs`.
+
+    Parameters:
+    - pairs (list): List of (ticker1, ticker2) tuples, ticker1 being regressed on ticker2.
+    - matrix (SharedPriceMatrix, optional): Already published prices with an 'adj_close' field, e.g. from
+      `SharedPriceMatrix.from_tickers`. Loaded from `data_manager` otherwise.
+    - data_manager (DataManager, optional): The data manager used to load the tickers.
+    - workers (int, optional): Number of processes. Defaults to the number of CPUs.
+    - chunk_size (int, optional): Number of pairs per task.
+
+    Returns:
+    - pd.DataFrame: The columns ticker1, ticker2, adfstat, pvalue and nobs, in the order of `pairs`.
+    """
+    pairs = [tuple(pair) for pair in pairs]
+    if matrix is not None:
+        _require_field(matrix.fields, 'adj_close')
+    rows = _run(pairs, matrix, data_manager, _pair_test_chunk, (), workers, chunk_size, fields=('adj_close',))
+    results = pd.DataFrame(rows, columns=['adfstat', 'pvalue', 'nobs'])
+    results.insert(0, 'ticker2', [pair[1] for pair in pairs])
+    results.insert(0, 'ticker1', [pair[0] for pair in pairs])
+    return results
+
+
+def run_pair_backtests(pairs, strategy=None, params=None, cash=100_000.0, matrix=None, data_manager=None,
+                       workers=None, chunk_size=None, start=None, end=None, quiet=False, adjusted=False,
+                       events=None):
+    """
+    Runs one backtest per pair in parallel, with the two tickers of a pair as data0 and data1.
+
+    Parameters:
+    - pairs (list): List of (ticker1, ticker2) tuples.
+    - strategy (backtrader.Strategy, optional): The strategy class. Defaults to PairsTradingStrategy.
+    - params (dict, optional): Parameters passed to the strategy.
+    - cash (float): Starting cash of every backtest.
+    - matrix (SharedPriceMatrix, optional): Already published prices. Loaded from `data_manager` otherwise.
+    - data_manager (DataManager, optional): The data manager used to load the tickers.
+    - workers (int, optional): Number of processes. Defaults to the number of CPUs.
+    - chunk_size (int, optional): Number of pairs per task.
+    - start (str, optional): First date of the backtests, when the prices are loaded from `data_manager`.
+    - end (str, optional): Last date of the backtests, inclusive.
+    - quiet (bool): Hide what the strategies print.
+    - adjusted (bool): Trade the split and dividend adjusted prices, when the prices are loaded from
+      `data_manager`. The raw prices by default, which keeps the runs comparable with the vectorized
+      and live engines.
+    - events (str, optional): Folder where the orders and trades of every pair are recorded by an
+      `EventRecorder`, in TICKER1-TICKER2.parquet. Not recorded if None.
+
+    Returns:
+    - pd.DataFrame: The `Recorder` metrics (final_value, sharpe, ...) of every pair, in the order of `pairs`.
+    """
+    if strategy is None:
+        from src.strategy import PairsTradingStrategy
+        strategy = PairsTradingStrategy
+    pairs = [tuple(pair) for pair in pairs]
+    rows = _run(pairs, matrix, data_manager, _backtest_chunk, (strategy, params or {}, cash, quiet, events), workers,
+                chunk_size, start, end, adjusted=adjusted)
+    results = pd.DataFrame(rows)
+    results.insert(0, 'ticker2', [pair[1] for pair in pairs])
+    results.insert(0, 'ticker1', [pair[0] for pair in pairs])
+    return results
+
+
+def _run(pairs, matrix, data_manager, func, args, workers, chunk_size, start=None, end=None, fields=OHLCV_FIELDS,
+         adjusted=False):
+    if matrix is not None:
+        return map_pairs(matrix, pairs, func, args, workers, chunk_size)
+    tickers = sorted({ticker for pair in pairs for ticker in pair})
+    with SharedPriceMatrix.from_tickers(tickers, data_manager, fields, start, end, adjusted) as matrix:
+        return map_pairs(matrix, pairs, func, args, workers, chunk_size)
@@ -0,0 +1,285 @@
+"""Compiled columnar cache of the CSV price files.
+
+The CSV files of a data folder are parsed once and written to two binary blocks: an int64 block
+holding the dates (as datetime64[ns] epoch values) and volumes, and a float64 block holding the
+open, high, low, close, dividends and stock_splits columns. Tickers are stored one after the other
+along the rows, so every column of every ticker is a contiguous slice. A JSON manifest records the
+offset, length, modification time and size of each source file.
+
+The float block also holds the corporate action adjusted prices of `ADJUSTED_FIELDS`, computed once
+by `adjust_prices` when the store is built, so reading them costs the same as reading the raw ones.
+
+The blocks are opened with `numpy.memmap`: reading a ticker is a slice of the mapping, and the pages
+are shared by every process that opens the same store through the OS page cache. The store is
+rebuilt whenever a CSV file is added, removed or modified.
+"""
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+ADJUSTED_FIELDS = ('adj_factor', 'adj_open', 'adj_high', 'adj_low', 'adj_close')
+FLOAT_FIELDS = ('open', 'high', 'low', 'close', 'dividends', 'stock_splits') + ADJUSTED_FIELDS
+INT_FIELDS = ('date', 'volume')
+COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'dividends', 'stock_splits') + ADJUSTED_FIELDS
+MANIFEST = 'manifest.json'
+STORE_VERSION = 2
+
+# Stores opened by this process, keyed by cache folder, so every DataManager shares the mappings.
+_open_stores = {}
+
+
+def adjust_prices(columns):
+    """
+    Computes the prices of a ticker adjusted for its splits and dividends, in one vectorized pass.
+
+    Every corporate action on a bar gives a multiplier of the prices of the bars before it: one minus
+    the dividend over the previous close for a dividend, and one over the ratio for a split. The
+    adjustment factor of a bar is the product of the multipliers of the later bars, so the last bar
+    keeps its price and the earlier ones are comparable with it. A split is only applied when the
+    prices jump by its ratio on that bar: providers such as yfinance deliver prices already adjusted
+    for splits (but not for dividends), which must not be adjusted twice.
+
+    Parameters:
+    - columns (dict or pd.DataFrame): The 'open', 'high', 'low', 'close', 'dividends' (cash per share on
+      the ex-date) and 'stock_splits' (new shares per old share on the split date) columns, in date order.
+
+    Returns:
+    - dict: The float64 arrays of `ADJUSTED_FIELDS`.
+    """
+    close = np.asarray(columns['close'], dtype=np.float64)
+    dividends = np.nan_to_num(np.asarray(columns['dividends'], dtype=np.float64)[1:])
+    ratios = np.nan_to_num(np.asarray(columns['stock_splits'], dtype=np.float64)[1:])
+    previous = close[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Gap between the previous close and the open, and what is left of it once the split is undone.
+        gap = np.log(previous / np.asarray(columns['open'], dtype=np.float64)[1:])
+        split = (ratios > 0) & (ratios != 1) & (np.abs(gap - np.log(ratios)) < np.abs(gap))
+        dividend = 1.0 - dividends / previous
+    multiplier = np.where((dividends > 0) & (dividend > 0), dividend, 1.0)
+    multiplier[split] /= ratios[split]
+    factor = np.ones(len(close))
+    factor[:-1] = np.cumprod(multiplier[::-1])[::-1]
+    adjusted = dict(adj_factor=factor)
+    for field in ('open', 'high', 'low', 'close'):
+        adjusted[f'adj_{field}'] = np.asarray(columns[field], dtype=np.float64) * factor
+    return adjusted
+
+
+def _source_signature(file_path):
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PriceStore:
+    """
+    Memory-mapped columnar store built from the `<ticker>.csv` files of a data folder.
+
+    Use `PriceStore.open(data_folder, cache_folder)` rather than the constructor: it reuses the store
+    already mapped by this process, and builds it when the source files changed.
+    """
+
+    def __init__(self, data_folder, cache_folder, manifest):
+        self.data_folder = data_folder
+        self.cache_folder = cache_folder
+        self.manifest = manifest
+        self.tickers = manifest['tickers']
+        rows = manifest['rows']
+        token = manifest['token']
+        self._floats = self._map(f'floats-{token}.f8', np.float64, (len(FLOAT_FIELDS), rows))
+        self._ints = self._map(f'ints-{token}.i8', np.int64, (len(INT_FIELDS), rows))
+
+    def _map(self, file_name, dtype, shape):
+        if shape[1] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.cache_folder, file_name), dtype=dtype, mode='r', shape=shape)
+
+    @classmethod
+    def open(cls, data_folder, cache_folder, refresh=False):
+        """
+        Returns an up to date store for `data_folder`, building it in `cache_folder` if needed.
+
+        The source files are checked the first time a store is opened by the process, or when
+        `refresh` is set. Later calls return the already mapped store.
+
+        Parameters:
+        - data_folder (str): Folder holding the `<ticker>.csv` files.
+        - cache_folder (str): Folder holding the compiled store.
+        - refresh (bool): Check the source files again and rebuild the store if they changed.
+
+        Returns:
+        - store (PriceStore): The opened store.
+        """
+        store = _open_stores.get(cache_folder)
+        if store is not None and not refresh:
+            return store
+        manifest = cls._read_manifest(cache_folder)
+        if manifest is None or not cls._manifest_is_fresh(manifest, data_folder):
+            manifest = cls.build(data_folder, cache_folder)
+        if store is None or store.manifest['token'] != manifest['token']:
+            store = cls(data_folder, cache_folder, manifest)
+            _open_stores[cache_folder] = store
+        return store
+
+    @staticmethod
+    def _read_manifest(cache_folder):
+        try:
+            with open(os.path.join(cache_folder, MANIFEST)) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return manifest if manifest.get('version') == STORE_VERSION else None
+
+    @staticmethod
+    def _csv_files(data_folder):
+        return {os.path.splitext(name)[0]: os.path.join(data_folder, name)
+                for name in os.listdir(data_folder) if name.endswith('.csv')}
+
+    @classmethod
+    def _manifest_is_fresh(cls, manifest, data_folder):
+        files = cls._csv_files(data_folder)
+        if set(files) != set(manifest['tickers']):
+            return False
+        return all(list(_source_signature(path)) == manifest['tickers'][ticker]['source']
+                   for ticker, path in files.items())
+
+    def is_fresh(self, ticker=None):
+        """
+        Checks the source files against the manifest, using their modification time and size.
+
+        Parameters:
+        - ticker (str, optional): Only check this ticker, which costs a single `stat` call.
+          By default the whole data folder is checked, including added and removed files.
+        """
+        if ticker is None:
+            return self._manifest_is_fresh(self.manifest, self.data_folder)
+        path = os.path.join(self.data_folder, f'{ticker}.csv')
+        if ticker not in self.tickers:
+            return not os.path.exists(path)
+        try:
+            return list(_source_signature(path)) == self.tickers[ticker]['source']
+        except OSError:
+            return False
+
+    @classmethod
+    def build(cls, data_folder, cache_folder):
+        """
+        Parses every CSV file of `data_folder` and writes the binary blocks and the manifest.
+
+        The blocks are written under new names and the manifest is replaced last, so processes
+        reading the previous version of the store are not disturbed.
+
+        Returns:
+        - manifest (dict): The manifest of the new store.
+        """
+        os.makedirs(cache_folder, exist_ok=True)
+        frames, tickers, offset = [], {}, 0
+        for ticker, path in sorted(cls._csv_files(data_folder).items()):
+            source = list(_source_signature(path))
+            frame = pd.read_csv(path, parse_dates=['date'])
+            tickers[ticker] = dict(offset=offset, length=len(frame), source=source)
+            frames.append(frame)
+            offset += len(frame)
+
+        token = uuid.uuid4().hex
+        floats = np.empty((len(FLOAT_FIELDS), offset), dtype=np.float64)
+        ints = np.empty((len(INT_FIELDS), offset), dtype=np.int64)
+        for frame, entry in zip(frames, tickers.values()):
+            rows = slice(entry['offset'], entry['offset'] + entry['length'])
+            for row, field in enumerate(FLOAT_FIELDS[:-len(ADJUSTED_FIELDS)]):
+                floats[row, rows] = frame[field].to_numpy(dtype=np.float64)
+            for field, values in adjust_prices(frame).items():
+                floats[FLOAT_FIELDS.index(field), rows] = values
+            ints[0, rows] = frame['date'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+            ints[1, rows] = frame['volume'].to_numpy(dtype=np.int64)
+        floats.tofile(os.path.join(cache_folder, f'floats-{token}.f8'))
+        ints.tofile(os.path.join(cache_folder, f'ints-{token}.i8'))
+
+        manifest = dict(version=STORE_VERSION, token=token, rows=offset, tickers=tickers)
+        temp_path = os.path.join(cache_folder, f'{MANIFEST}.{token}.tmp')
+        with open(temp_path, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(temp_path, os.path.join(cache_folder, MANIFEST))
+        cls._remove_stale_blocks(cache_folder, token)
+        return manifest
+
+    @staticmethod
+    def _remove_stale_blocks(cache_folder, token):
+        # Open mappings of the old blocks stay valid after the files are unlinked.
+        for name in os.listdir(cache_folder):
+            if name.endswith(('.f8', '.i8')) and token not in name:
+                try:
+                    os.remove(os.path.join(cache_folder, name))
+                except OSError:
+                    pass
+
+    def columns(self, ticker):
+        """
+        Returns the columns of a ticker as read-only NumPy views of the mapping, without copying.
+
+        Returns:
+        - columns (dict): Maps 'date' (datetime64[ns]) and every price column to a 1-D array.
+        """
+        entry = self.tickers[ticker]
+        rows = slice(entry['offset'], entry['offset'] + entry['length'])
+        # np.asarray drops the memmap subclass but keeps the view on the mapping.
+        columns = {'date': np.asarray(self._ints[0, rows]).view('datetime64[ns]')}
+        for row, field in enumerate(FLOAT_FIELDS):
+            columns[field] = np.asarray(self._floats[row, rows])
+        columns['volume'] = np.asarray(self._ints[1, rows])
+        return columns
+
+    def frame(self, ticker):
+        """Returns the data of a ticker as a DataFrame indexed by date, backed by the mapping."""
+        columns = self.columns(ticker)
+        index = pd.DatetimeIndex(columns.pop('date'), name='date')
+        return pd.DataFrame({field: columns[field] for field in COLUMNS}, index=index, copy=False)
+
+    def field(self, name):
+        """Returns one column of the whole store as a read-only array covering every ticker."""
+        if name == 'date':
+            return np.asarray(self._ints[0]).view('datetime64[ns]')
+        if name == 'volume':
+            return np.asarray(self._ints[1])
+        return np.asarray(self._floats[FLOAT_FIELDS.index(name)])
+
+    def align(self, tickers, fields, start=None, end=None):
+        """
+        Scatters the given fields of several tickers on their common calendar in a single pass.
+
+        The calendar is the union of the dates of the tickers between `start` and `end` (inclusive).
+
+        Parameters:
+        - tickers (list): The tickers, in the order of the output columns.
+        - fields (tuple): The columns to align.
+        - start (datetime64, optional): First date of the calendar.
+        - end (datetime64, optional): Last date of the calendar.
+
+        Returns:
+        - tuple: The calendar (datetime64[ns] array), a (fields x dates x tickers) float64 array holding
+          NaN where a ticker has no data, and the (dates x tickers) boolean mask of valid values.
+        """
+        entries = [self.tickers[ticker] for ticker in tickers]
+        lengths = np.array([entry['length'] for entry in entries], dtype=np.int64)
+        offsets = np.array([entry['offset'] for entry in entries], dtype=np.int64)
+        # Store rows of every requested ticker, and the output column each of them goes to.
+        columns = np.repeat(np.arange(len(tickers)), lengths)
+        rows = np.repeat(offsets - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        dates = self.field('date')[rows]
+        selected = np.ones(len(rows), dtype=bool)
+        if start is not None:
+            selected &= dates >= np.datetime64(start, 'ns')
+        if end is not None:
+            selected &= dates <= np.datetime64(end, 'ns')
+        rows, columns, dates = rows[selected], columns[selected], dates[selected]
+
+        calendar = np.unique(dates)
+        positions = np.searchsorted(calendar, dates)
+        values = np.full((len(fields), len(calendar), len(tickers)), np.nan)
+        for index, name in enumerate(fields):
+            values[index, positions, columns] = self.field(name)[rows]
+        mask = np.zeros((len(calendar), len(tickers)), dtype=bool)
+        mask[positions, columns] = True
+        return calendar, values, mask
@@ -0,0 +1,184 @@
+"""Opt-in timing instrumentation of backtrader runs.
+
+`Profiler.instrument(cerebro)` wraps, for the duration of a run, the callbacks backtrader calls on
+every bar: the feeds (`_start`, `preload`, `next`), the broker order matching (`next`), and the
+`next`/`prenext`/`once` style callbacks of the strategies, their indicators, observers and analyzers.
+Each wrapped call adds its duration to the counters of its component, e.g. 'indicator:SMA' or
+'strategy:PairsTradingStrategy'. The callbacks of the components do not call each other, so the
+component times do not overlap and add up to the run time, apart from the engine overhead.
+
+The whole per bar step of every strategy is timed as well ('bar'), which gives the per bar latency
+percentiles. Optionally a cProfile profiler runs during the phases, and its statistics can be written
+in the pstats format read by snakeviz, gprof2dot or flameprof.
+
+A disabled profiler does not wrap anything, and its `phase` is an empty context manager.
+"""
+import array
+import contextlib
+import cProfile
+import functools
+import time
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+FEED_METHODS = ('_start', 'preload', 'next')
+LINEITERATOR_METHODS = ('prenext', 'nextstart', 'next', 'preonce', 'oncestart', 'once')
+STRATEGY_METHODS = ('prenext', 'nextstart', 'next', 'notify_order', 'notify_trade', 'notify_cashvalue',
+                    'notify_fund', 'stop')
+ANALYZER_METHODS = ('prenext', 'nextstart', 'next', 'notify_order', 'notify_trade', 'notify_cashvalue',
+                    'notify_fund', 'stop')
+
+
+class Profiler:
+    """
+    Collects call counts and durations of the components of backtrader runs.
+
+    Parameters:
+    - enabled (bool): When False, `phase` and `instrument` do nothing.
+    - cprofile (bool): Also run cProfile during the phases, see `dump_stats`.
+    """
+
+    def __init__(self, enabled=True, cprofile=False):
+        self.enabled = enabled
+        self.durations = {}
+        self.phases = {}
+        self.cprofile = cProfile.Profile() if enabled and cprofile else None
+
+    def _timer(self, component):
+        if component not in self.durations:
+            self.durations[component] = array.array('d')
+        return self.durations[component].append
+
+    def _wrap(self, obj, methods, component):
+        record = self._timer(component)
+        # Callbacks of an object can call each other, e.g. `once_via_next` calling `next` for every bar.
+        # Only the outermost call is recorded, so that the time is not counted twice.
+        active = [False]
+        for name in methods:
+            method = getattr(obj, name, None)
+            if method is None or getattr(method, '_profiled', False):
+                continue
+
+            def timed(*args, _method=method, **kwargs):
+                if active[0]:
+                    return _method(*args, **kwargs)
+                active[0] = True
+                start = time.perf_counter()
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    record(time.perf_counter() - start)
+                    active[0] = False
+            timed._profiled = True
+            # Instance attributes take precedence over the methods of the class.
+            setattr(obj, name, functools.update_wrapper(timed, method))
+
+    def _wrap_lineiterators(self, owner):
+        # Line operations and delays are LineActions without children of their own.
+        lineiterators = getattr(owner, '_lineiterators', None) or {}
+        for kind, prefix in ((bt.LineIterator.IndType, 'indicator'), (bt.LineIterator.ObsType, 'observer')):
+            for child in lineiterators.get(kind, ()):
+                self._wrap(child, LINEITERATOR_METHODS, f'{prefix}:{type(child).__name__}')
+                self._wrap_lineiterators(child)
+
+    def _wrap_analyzer(self, analyzer):
+        self._wrap(analyzer, ANALYZER_METHODS, f'analyzer:{type(analyzer).__name__}')
+        for child in analyzer._children:
+            self._wrap_analyzer(child)
+
+    def _wrap_strategy(self, strategy):
+        self._wrap(strategy, STRATEGY_METHODS, f'strategy:{type(strategy).__name__}')
+        self._wrap(strategy, ('_next', '_oncepost'), 'bar')
+        self._wrap_lineiterators(strategy)
+        for analyzer in strategy.analyzers:
+            self._wrap_analyzer(analyzer)
+        for observer in strategy._lineiterators[bt.LineIterator.ObsType]:
+            for analyzer in observer._analyzers:
+                self._wrap_analyzer(analyzer)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times a block of code, e.g. `with profiler.phase('load'):`. The time is added to the phase."""
+        if not self.enabled:
+            yield
+            return
+        if self.cprofile:
+            self.cprofile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+            if self.cprofile:
+                self.cprofile.disable()
+
+    @contextlib.contextmanager
+    def instrument(self, cerebro):
+        """
+        Wraps the callbacks of the feeds, the broker and the strategies of `cerebro` while the block runs.
+
+        The strategies and their indicators only exist during `cerebro.run()`, so they are wrapped when
+        backtrader starts them, through a temporary hook on `bt.Strategy._start`.
+        """
+        if not self.enabled:
+            yield
+            return
+        for data in cerebro.datas:
+            self._wrap(data, FEED_METHODS, f'feed:{data._name or type(data).__name__}')
+        self._wrap(cerebro.broker, ('next',), 'broker')
+
+        profiler = self
+        original_start = bt.Strategy._start
+
+        def _start(strategy):
+            profiler._wrap_strategy(strategy)
+            return original_start(strategy)
+
+        bt.Strategy._start = _start
+        try:
+            yield
+        finally:
+            bt.Strategy._start = original_start
+
+    def run(self, cerebro, **kwargs):
+        """Runs `cerebro` instrumented, in the 'run' phase. Returns the result of `cerebro.run`."""
+        with self.instrument(cerebro), self.phase('run'):
+            return cerebro.run(**kwargs)
+
+    def report(self):
+        """
+        Summarizes the collected durations.
+
+        Returns:
+        - pd.DataFrame: One row per component with its number of calls, total time in seconds, share of
+          the 'run' phase, and mean and 50th/95th/99th percentile durations per call in microseconds.
+        """
+        rows = []
+        run = self.phases.get('run')
+        for component, durations in self.durations.items():
+            if not durations:
+                continue
+            values = np.frombuffer(durations, dtype=np.float64)
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1e6
+            total = values.sum()
+            rows.append(dict(component=component, calls=len(values), total_s=total,
+                             share=total / run if run and component != 'bar' else np.nan,
+                             mean_us=total / len(values) * 1e6, p50_us=p50, p95_us=p95, p99_us=p99))
+        columns = ['component', 'calls', 'total_s', 'share', 'mean_us', 'p50_us', 'p95_us', 'p99_us']
+        return pd.DataFrame(rows, columns=columns).sort_values('total_s', ascending=False, ignore_index=True)
+
+    def summary(self):
+        """Returns a printable summary of the phases and components."""
+        lines = [f'{name:>10s}: {seconds:.3f} s' for name, seconds in self.phases.items()]
+        report = self.report()
+        if len(report):
+            lines.append(report.to_string(index=False, float_format=lambda value: f'{value:.4g}'))
+        return '\n'.join(lines)
+
+    def dump_stats(self, path):
+        """Writes the cProfile statistics of the phases in the pstats format."""
+        if self.cprofile is None:
+            raise ValueError('The profiler was created without cprofile=True.')
+        self.cprofile.dump_stats(path)
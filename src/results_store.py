@@ -0,0 +1,338 @@
+"""Persistent store of backtest results, in a local SQLite database.
+
+Every run is recorded with its metadata (strategy class, parameters, tickers, fingerprint of the price
+data, code version, wall time), the metrics of the `Recorder` analyzer, and its equity curve and trade
+log as zlib compressed arrays. Parameters, tickers and metrics are also stored one row per value in
+indexed tables, so that thousands of runs can be filtered and ranked with a single SQL query.
+
+A run is identified by a key hashing its inputs: the strategy (including its source code), the
+parameters (including the source code of the classes passed as parameters, e.g. indicators), the
+tickers, the starting cash, the data fingerprint and a digest of the code of the feeds, indicators
+and analyzers (see `src.optimizer.ENGINE_MODULES`). `run_backtest` serves the
+recorded result when the key is already in the store, and only runs cerebro otherwise.
+"""
+import contextlib
+import datetime
+import functools
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from src.data_manager import DataManager, default_cache_folder, default_data_folder
+from src.optimizer import describe, engine_digest, source_of
+from src.parallel import OHLCV_FIELDS, adjusted_fields
+
+TRADE_DTYPE = np.dtype([('date', 'datetime64[ns]'), ('data', np.int64), ('pnl', np.float64),
+                        ('barlen', np.int64)])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    strategy TEXT NOT NULL,
+    params TEXT NOT NULL,
+    tickers TEXT NOT NULL,
+    cash REAL NOT NULL,
+    data TEXT NOT NULL,
+    code_version TEXT,
+    created TEXT NOT NULL,
+    wall_time REAL,
+    metrics TEXT NOT NULL,
+    dates BLOB,
+    equity BLOB,
+    trades BLOB
+);
+CREATE INDEX IF NOT EXISTS runs_strategy ON runs (strategy);
+CREATE TABLE IF NOT EXISTS run_params (run_id INTEGER NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS run_params_value ON run_params (name, value, run_id);
+CREATE TABLE IF NOT EXISTS run_tickers (run_id INTEGER NOT NULL, ticker TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS run_tickers_ticker ON run_tickers (ticker, run_id);
+CREATE TABLE IF NOT EXISTS run_metrics (run_id INTEGER NOT NULL, name TEXT NOT NULL, value REAL);
+CREATE INDEX IF NOT EXISTS run_metrics_value ON run_metrics (name, value, run_id);
+"""
+
+
+def default_store_path():
+    """Returns the path of the default results database, in the price store folder."""
+    return os.path.join(default_cache_folder(default_data_folder()), 'results.sqlite')
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Returns the git commit of the repository (with a -dirty suffix if it has changes), or None."""
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(__file__),
+                              capture_output=True, text=True, check=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _compress(array):
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array), allow_pickle=False)
+    return zlib.compress(buffer.getvalue())
+
+
+def _decompress(blob):
+    return np.load(io.BytesIO(zlib.decompress(blob)), allow_pickle=False)
+
+
+class ResultsStore:
+    """
+    SQLite database of backtest runs.
+
+    Parameters:
+    - path (str, optional): The database file. Defaults to `results.sqlite` in the price store folder.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_store_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def key(strategy, params, tickers, cash, data, common_dates=True, adjusted=False):
+        """
+        Returns the key identifying a run from its inputs.
+
+        Parameters:
+        - strategy (backtrader.Strategy): The strategy class. Its source code is part of the key.
+        - params (dict): The strategy parameters. The source code of the classes among them is part of the key.
+        - tickers (list): The tickers, in the order of the data feeds.
+        - cash (float): The starting cash.
+        - data (str): The fingerprint of the price data, see `Panel.fingerprint`.
+        - common_dates (bool): Whether the feeds were trimmed to the dates where all the tickers are listed.
+        - adjusted (bool): Whether the feeds held the split and dividend adjusted prices.
+        """
+        description = dict(strategy=describe(strategy), source=source_of(strategy),
+                           params={name: describe(value) for name, value in sorted(params.items())},
+                           param_sources={name: source_of(value) for name, value in sorted(params.items())
+                                          if isinstance(value, type)},
+                           engine=engine_digest(), tickers=list(tickers), cash=cash, data=data,
+                           common_dates=common_dates, adjusted=adjusted)
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def save(self, key, strategy, params, tickers, cash, data, metrics, wall_time=None, dates=None, equity=None,
+             trades=None):
+        """
+        Records a run, replacing the run with the same key if any.
+
+        Parameters:
+        - key (str): The key of the run, see `key`.
+        - strategy (backtrader.Strategy): The strategy class.
+        - params (dict): The strategy parameters.
+        - tickers (list): The tickers of the data feeds.
+        - cash (float): The starting cash.
+        - data (str): The fingerprint of the price data.
+        - metrics (dict): The metrics of the run.
+        - wall_time (float, optional): The duration of the run in seconds.
+        - dates (np.ndarray, optional): The dates of the equity curve (datetime64).
+        - equity (np.ndarray, optional): The portfolio value of every bar.
+        - trades (np.ndarray, optional): The trade log, a structured array of `TRADE_DTYPE`.
+
+        Returns:
+        - int: The id of the run.
+        """
+        params = {name: describe(value) for name, value in params.items()}
+        metrics = {name: describe(value) for name, value in metrics.items()}
+        with self.connection:
+            self.connection.execute('DELETE FROM run_params WHERE run_id IN (SELECT id FROM runs WHERE key = ?)', (key,))
+            self.connection.execute('DELETE FROM run_tickers WHERE run_id IN (SELECT id FROM runs WHERE key = ?)', (key,))
+            self.connection.execute('DELETE FROM run_metrics WHERE run_id IN (SELECT id FROM runs WHERE key = ?)', (key,))
+            self.connection.execute('DELETE FROM runs WHERE key = ?', (key,))
+            cursor = self.connection.execute(
+                'INSERT INTO runs (key, strategy, params, tickers, cash, data, code_version, created, wall_time, '
+                'metrics, dates, equity, trades) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, strategy.__name__, json.dumps(params, sort_keys=True, default=repr), ','.join(tickers),
+                 float(cash), data, code_version(), datetime.datetime.now().isoformat(timespec='seconds'),
+                 wall_time, json.dumps(metrics), None if dates is None else _compress(np.asarray(dates, 'datetime64[ns]')),
+                 None if equity is None else _compress(np.asarray(equity, dtype=np.float64)),
+                 None if trades is None else _compress(np.asarray(trades, dtype=TRADE_DTYPE))))
+            run_id = cursor.lastrowid
+            self.connection.executemany('INSERT INTO run_params VALUES (?, ?, ?)',
+                                        [(run_id, name, json.dumps(value, default=repr)) for name, value in params.items()])
+            self.connection.executemany('INSERT INTO run_tickers VALUES (?, ?)', [(run_id, ticker) for ticker in tickers])
+            self.connection.executemany('INSERT INTO run_metrics VALUES (?, ?, ?)',
+                                        [(run_id, name, value) for name, value in metrics.items()
+                                         if isinstance(value, (int, float))])
+        return run_id
+
+    def get(self, key):
+        """Returns the run recorded under `key` as a dict, or None."""
+        row = self.connection.execute('SELECT id FROM runs WHERE key = ?', (key,)).fetchone()
+        return None if row is None else self.run(row[0])
+
+    def run(self, run_id):
+        """
+        Returns a recorded run.
+
+        Returns:
+        - dict: The metadata of the run, its 'metrics', its 'equity' as a pd.Series indexed by date and
+          its 'trades' as a pd.DataFrame.
+        """
+        row = self.connection.execute(
+            'SELECT id, key, strategy, params, tickers, cash, data, code_version, created, wall_time, metrics, '
+            'dates, equity, trades FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(run_id)
+        (run_id, key, strategy, params, tickers, cash, data, version, created, wall_time, metrics,
+         dates, equity, trades) = row
+        return dict(
+            id=run_id, key=key, strategy=strategy, params=json.loads(params), tickers=tickers.split(','),
+            cash=cash, data=data, code_version=version, created=created, wall_time=wall_time,
+            metrics=json.loads(metrics),
+            equity=None if equity is None else pd.Series(_decompress(equity),
+                                                         index=pd.DatetimeIndex(_decompress(dates), name='date')),
+            trades=None if trades is None else pd.DataFrame(_decompress(trades)),
+        )
+
+    def query(self, strategy=None, ticker=None, params=None, order_by=None, ascending=False, limit=None):
+        """
+        Filters and ranks the recorded runs.
+
+        Parameters:
+        - strategy (str, optional): Only runs of this strategy class name.
+        - ticker (str, optional): Only runs trading this ticker.
+        - params (dict, optional): Only runs with these parameter values.
+        - order_by (str, optional): A metric to rank the runs by.
+        - ascending (bool): Rank by increasing metric.
+        - limit (int, optional): Maximum number of runs returned.
+
+        Returns:
+        - pd.DataFrame: One row per run with its id, strategy, tickers, parameters and metrics.
+        """
+        joins, where, arguments = [], [], []
+        if ticker is not None:
+            joins.append('JOIN run_tickers t ON t.run_id = r.id AND t.ticker = ?')
+            arguments.append(ticker)
+        for index, (name, value) in enumerate((params or {}).items()):
+            joins.append(f'JOIN run_params p{index} ON p{index}.run_id = r.id AND p{index}.name = ? '
+                         f'AND p{index}.value = ?')
+            arguments += [name, json.dumps(describe(value), default=repr)]
+        order = ''
+        if order_by is not None:
+            joins.append('LEFT JOIN run_metrics m ON m.run_id = r.id AND m.name = ?')
+            arguments.append(order_by)
+            order = f' ORDER BY m.value IS NULL, m.value {"ASC" if ascending else "DESC"}'
+        if strategy is not None:
+            where.append('r.strategy = ?')
+            arguments.append(strategy)
+        sql = ('SELECT r.id, r.strategy, r.tickers, r.params, r.metrics, r.wall_time, r.created FROM runs r '
+               + ' '.join(joins) + (' WHERE ' + ' AND '.join(where) if where else '') + order
+               + (' LIMIT ?' if limit is not None else ''))
+        if limit is not None:
+            arguments.append(int(limit))
+        rows = []
+        for run_id, strategy_name, tickers, run_params, metrics, wall_time, created in \
+                self.connection.execute(sql, arguments):
+            rows.append(dict(id=run_id, strategy=strategy_name, tickers=tickers, **json.loads(run_params),
+                             **json.loads(metrics), wall_time=wall_time, created=created))
+        return pd.DataFrame(rows)
+
+
+def run_backtest(strategy, tickers, params=None, cash=100_000.0, data_manager=None, store=None, refresh=False,
+                 metrics=None, quiet=True, start=None, end=None, common_dates=True, stdstats=False, plot=False,
+                 profiler=None, adjusted=False, events=None):
+    """
+    Backtests a strategy on tickers, or serves the result from a results store.
+
+    The tickers are added as named data feeds, data0, data1, ... in order, by default over the dates
+    where all of them are listed. The run is recorded with the `Recorder` analyzer.
+
+    Parameters:
+    - strategy (backtrader.Strategy): The strategy class.
+    - tickers (list): The tickers of the data feeds.
+    - params (dict, optional): The strategy parameters.
+    - cash (float): The starting cash.
+    - data_manager (DataManager, optional): The data manager used to load the tickers.
+    - store (ResultsStore, optional): Where runs are looked up and recorded. Not stored if None.
+    - refresh (bool): Run the backtest even if its result is already stored.
+    - metrics (list, optional): The metrics to compute, all of them by default.
+    - quiet (bool): Hide what the strategy prints.
+    - start (str, optional): First date of the backtest, e.g. '2021-01-01'.
+    - end (str, optional): Last date of the backtest, inclusive.
+    - common_dates (bool): Trim the feeds to the dates where all the tickers are listed. If False, each
+      feed starts at the listing of its ticker, for strategies handling late listings themselves.
+    - stdstats (bool): Add the standard observers (cash, value, trades, orders).
+    - plot (bool): Plot the run with `cerebro.plot()`. The run is never served from the store then.
+    - profiler (Profiler, optional): Times the loading and the run of the backtest.
+    - adjusted (bool): Feed the split and dividend adjusted prices as open, high, low and close. The raw
+      prices by default, which keeps the runs comparable with the vectorized and live engines and the
+      runs already stored.
+    - events (str, optional): Parquet file where the orders and trades of the run are recorded by an
+      `EventRecorder`. The run is never served from the store then. Not recorded if None.
+
+    Returns:
+    - dict: The run, as returned by `ResultsStore.run`, with 'served' telling if it came from the store.
+    """
+    import backtrader as bt
+    from src.analyzer import AnalyzerSuite
+    from src.events import add_event_recorder
+    from src.feeds import ArrayData, date2num
+
+    params = dict(params or {})
+    tickers = list(tickers)
+    data_manager = data_manager or DataManager()
+    with profiler.phase('load') if profiler is not None else contextlib.nullcontext():
+        fields = adjusted_fields(OHLCV_FIELDS) if adjusted else OHLCV_FIELDS
+        panel = data_manager.load_panel(tickers, fields=fields, start=start, end=end)
+    data = panel.fingerprint()
+    key = ResultsStore.key(strategy, params, tickers, cash, data, common_dates, adjusted)
+    if store is not None and not refresh and not plot and events is None:
+        run = store.get(key)
+        if run is not None:
+            return dict(run, served=True)
+
+    started = time.perf_counter()
+    cerebro = bt.Cerebro(stdstats=stdstats or plot)
+    datenums = date2num(panel.dates)
+    for column, ticker in enumerate(tickers):
+        rows = panel.common_rows() if common_dates else panel.mask[:, column]
+        arrays = {name: panel.values[index, rows, column] for index, name in enumerate(OHLCV_FIELDS)}
+        cerebro.adddata(ArrayData(dataname=dict(arrays, datetime=datenums[rows])), name=ticker)
+    cerebro.addstrategy(strategy, **params)
+    cerebro.broker.setcash(cash)
+    AnalyzerSuite.defineRecorder(cerebro, metrics=metrics)
+    if events is not None:
+        add_event_recorder(cerebro, events)
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        thestrats = cerebro.run() if profiler is None else profiler.run(cerebro)
+    wall_time = time.perf_counter() - started
+
+    recorder = thestrats[0].analyzers.recorder
+    run_metrics = AnalyzerSuite.returnMetrics(thestrats)[0]
+    del run_metrics['strategy']
+    dates = np.array([bt.num2date(value) for value in recorder.dates[:recorder.bars]], dtype='datetime64[ns]')
+    equity = recorder.values[:recorder.bars].copy()
+    trades = np.zeros(len(recorder.pnl), dtype=TRADE_DTYPE)
+    trades['date'] = [bt.num2date(value) for value in recorder.trade_dates]
+    trades['data'] = recorder.trade_datas
+    trades['pnl'] = recorder.pnl
+    trades['barlen'] = recorder.barlen
+    run = dict(key=key, strategy=strategy.__name__, params=params, tickers=tickers, cash=cash, data=data,
+               code_version=code_version(), wall_time=wall_time, metrics=run_metrics,
+               equity=pd.Series(equity, index=pd.DatetimeIndex(dates, name='date')), trades=pd.DataFrame(trades))
+    if plot:
+        cerebro.plot()
+    if store is not None:
+        run['id'] = store.save(key, strategy, params, tickers, cash, data, run_metrics, wall_time=wall_time,
+                               dates=dates, equity=equity, trades=trades)
+    return dict(run, served=False)
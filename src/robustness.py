@@ -0,0 +1,218 @@
+"""Monte Carlo robustness of backtest results, without running the backtests again.
+
+A backtest gives one equity path. The resamples of this module build thousands of alternative paths
+from its bar returns or from its closed trades, as NumPy arrays of (resamples x bars), and compute
+the Sharpe ratio, the maximum drawdown and the total return of every path at once:
+
+- 'block_bootstrap': the bar returns are drawn with replacement in blocks of `block_size` bars
+  (circular blocks), which keeps the short term autocorrelation of the returns.
+- 'reshuffle': the closed trades are played in a random order. The total return does not change,
+  the drawdown shows how much of it was due to the order of the trades.
+- 'noise': a Gaussian noise of `noise` times the standard deviation of the returns is added to
+  every bar return.
+
+`robustness` runs the resamples of many results (e.g. one per pair) over a process pool. Every result
+gets its own random stream spawned from `seed`, so the intervals do not depend on the number of
+workers or on the order in which the results are processed.
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+METHODS = ('block_bootstrap', 'reshuffle', 'noise')
+ROBUSTNESS_METRICS = ('sharpe', 'max_drawdown', 'total_return')
+
+
+def path_metrics(returns, riskfree=0.0, annualization=252):
+    """
+    Computes the metrics of many equity paths at once, as `compute_metrics` does for one path.
+
+    Parameters:
+    - returns (np.ndarray): The (paths x bars) returns of the paths.
+    - riskfree (float): Annual risk free rate of the Sharpe ratio.
+    - annualization (float): Number of bars per year.
+
+    Returns:
+    - dict: One array per metric of `ROBUSTNESS_METRICS`, with one value per path.
+    """
+    returns = np.atleast_2d(np.asarray(returns, dtype=np.float64))
+    growth = np.cumprod(1.0 + returns, axis=1)
+    # The path starts at 1.0 before the first return.
+    peak = np.maximum(np.maximum.accumulate(growth, axis=1), 1.0)
+    max_drawdown = np.maximum((1.0 - growth / peak).max(axis=1, initial=0.0), 0.0)
+    sharpe = np.full(len(returns), np.nan)
+    if returns.shape[1] > 1:
+        excess = returns - riskfree / annualization
+        std = excess.std(axis=1, ddof=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sharpe = np.where(std > 0, excess.mean(axis=1) / std * math.sqrt(annualization), np.nan)
+    total_return = growth[:, -1] - 1.0 if returns.shape[1] else np.full(len(returns), np.nan)
+    return dict(sharpe=sharpe, max_drawdown=max_drawdown, total_return=total_return)
+
+
+def _trade_returns(pnl, cash):
+    """Returns of the equity path of trades closed one after the other, (paths x trades)."""
+    values = cash + np.cumsum(pnl, axis=-1)
+    previous = np.concatenate([np.full(values.shape[:-1] + (1,), cash), values[..., :-1]], axis=-1)
+    return values / previous - 1.0
+
+
+def resample(returns=None, pnl=None, cash=100_000.0, method='block_bootstrap', n_resamples=10_000, block_size=20,
+             noise=0.5, seed=None, riskfree=0.0, annualization=252, chunk_size=1000):
+    """
+    Computes the metrics of the resampled paths of one backtest result.
+
+    Parameters:
+    - returns (np.ndarray, optional): The bar returns of the equity curve, for 'block_bootstrap' and 'noise'.
+    - pnl (np.ndarray, optional): The net pnl of the closed trades, in order, for 'reshuffle'.
+    - cash (float): The starting value of the portfolio, for 'reshuffle'.
+    - method (str): One of `METHODS`.
+    - n_resamples (int): Number of resampled paths.
+    - block_size (int): Number of bars of the blocks of 'block_bootstrap'.
+    - noise (float): Standard deviation of the noise of 'noise', relative to the one of the returns.
+    - seed (int or np.random.SeedSequence, optional): Seed of the random draws.
+    - riskfree (float): Annual risk free rate of the Sharpe ratio.
+    - annualization (float): Number of bars per year. The trade paths of 'reshuffle' are annualized
+      with the number of trades per year, from the number of bars of `returns` when it is given.
+    - chunk_size (int): Number of paths built at once, bounds the memory to (chunk_size x bars) arrays.
+
+    Returns:
+    - dict: 'observed', the metrics of the actual path, and 'samples', one array of `n_resamples`
+      values per metric of `ROBUSTNESS_METRICS`.
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown method {method!r}, expected one of {", ".join(METHODS)}.')
+    rng = np.random.default_rng(seed)
+    if method == 'reshuffle':
+        base = np.zeros(0) if pnl is None else np.asarray(pnl, dtype=np.float64)
+        if returns is not None and len(returns) and len(base):
+            annualization = len(base) * annualization / len(returns)
+        observed_returns = _trade_returns(base, cash)
+    else:
+        base = np.zeros(0) if returns is None else np.asarray(returns, dtype=np.float64)
+        observed_returns = base
+    observed = {name: values[0].item() for name, values in
+                path_metrics(observed_returns, riskfree, annualization).items()}
+    samples = {name: np.full(n_resamples, np.nan) for name in ROBUSTNESS_METRICS}
+    length = len(base)
+    if length < 2:
+        return dict(observed=observed, samples=samples)
+
+    scale = noise * base.std(ddof=1)
+    for start in range(0, n_resamples, chunk_size):
+        count = min(chunk_size, n_resamples - start)
+        if method == 'block_bootstrap':
+            size = min(block_size, length)
+            starts = rng.integers(0, length, size=(count, -(-length // size)))
+            rows = ((starts[:, :, None] + np.arange(size)) % length).reshape(count, -1)[:, :length]
+            paths = base[rows]
+        elif method == 'reshuffle':
+            paths = _trade_returns(rng.permuted(np.broadcast_to(base, (count, length)), axis=1), cash)
+        else:
+            paths = base + rng.normal(0.0, scale, size=(count, length))
+        for name, values in path_metrics(paths, riskfree, annualization).items():
+            samples[name][start:start + count] = values
+    return dict(observed=observed, samples=samples)
+
+
+def confidence_intervals(samples, observed=None, confidence=0.95):
+    """
+    Summarizes resampled metrics with their percentile confidence intervals.
+
+    Parameters:
+    - samples (dict): One array of resampled values per metric.
+    - observed (dict, optional): The metrics of the actual path.
+    - confidence (float): Coverage of the interval, e.g. 0.95 for the 2.5% and 97.5% percentiles.
+
+    Returns:
+    - pd.DataFrame: One row per metric with the columns observed, mean, std, lower, median and upper.
+    """
+    rows = []
+    tail = (1.0 - confidence) / 2
+    for name, values in samples.items():
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values):
+            lower, median, upper = np.quantile(values, [tail, 0.5, 1.0 - tail])
+            mean, std = values.mean(), values.std(ddof=1) if len(values) > 1 else math.nan
+        else:
+            lower = median = upper = mean = std = math.nan
+        rows.append(dict(metric=name, observed=(observed or {}).get(name, math.nan), mean=mean, std=std,
+                         lower=lower, median=median, upper=upper))
+    return pd.DataFrame(rows).set_index('metric')
+
+
+def result_inputs(result):
+    """
+    Returns the bar returns, trade pnl and starting cash of a backtest result.
+
+    Parameters:
+    - result: A run of `ResultsStore.run` or `run_backtest` (a dict with 'equity' and 'trades'), or an
+      equity curve (pd.Series or array).
+
+    Returns:
+    - dict: The 'returns', 'pnl' (None without trades) and 'cash' arguments of `resample`.
+    """
+    pnl = None
+    if isinstance(result, dict):
+        trades = result.get('trades')
+        if trades is not None:
+            pnl = np.asarray(trades['pnl'], dtype=np.float64)
+        result = result['equity']
+    values = np.asarray(result, dtype=np.float64)
+    return dict(returns=values[1:] / values[:-1] - 1.0, pnl=pnl, cash=values[0])
+
+
+def _resample_chunk(tasks, methods, confidence, options):
+    frames = []
+    for name, inputs, seeds in tasks:
+        for method, seed in zip(methods, seeds):
+            result = resample(method=method, seed=seed, **inputs, **options)
+            frame = confidence_intervals(result['samples'], result['observed'], confidence).reset_index()
+            frame.insert(0, 'method', method)
+            frame.insert(0, 'name', name)
+            frames.append(frame)
+    return frames
+
+
+def robustness(results, methods=METHODS, n_resamples=10_000, confidence=0.95, seed=0, workers=None, **options):
+    """
+    Runs the resamples of many backtest results over a process pool.
+
+    Parameters:
+    - results (dict): The backtest results by name, e.g. by pair, see `result_inputs`.
+    - methods (tuple): The resampling methods, see `METHODS`.
+    - n_resamples (int): Number of resampled paths per result and method.
+    - confidence (float): Coverage of the confidence intervals.
+    - seed (int): Seed of the whole run. The same seed gives the same intervals whatever the workers.
+    - workers (int, optional): Number of processes. Defaults to the number of CPUs.
+    - options: The other arguments of `resample`: block_size, noise, riskfree, annualization, chunk_size.
+
+    Returns:
+    - pd.DataFrame: One row per result, method and metric with the columns name, method, metric,
+      observed, mean, std, lower, median and upper.
+    """
+    unknown = set(methods) - set(METHODS)
+    if unknown:
+        raise ValueError(f'Unknown methods: {", ".join(sorted(unknown))}.')
+    options = dict(options, n_resamples=n_resamples)
+    names = list(results)
+    streams = np.random.SeedSequence(seed).spawn(len(names))
+    tasks = [(name, result_inputs(results[name]), stream.spawn(len(methods))) for name, stream in zip(names, streams)]
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers == 1:
+        frames = _resample_chunk(tasks, methods, confidence, options)
+    else:
+        size = -(-len(tasks) // (4 * workers))
+        chunks = [tasks[start:start + size] for start in range(0, len(tasks), size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = [frame for chunk_frames in pool.map(_resample_chunk, chunks, [methods] * len(chunks),
+                                                        [confidence] * len(chunks), [options] * len(chunks))
+                      for frame in chunk_frames]
+    if not frames:
+        return pd.DataFrame(columns=['name', 'method', 'metric', 'observed', 'mean', 'std', 'lower', 'median',
+                                     'upper'])
+    return pd.concat(frames, ignore_index=True)
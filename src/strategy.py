@@ -5,6 +5,8 @@ import backtrader as bt
 import backtrader.feeds as btfeeds
 import backtrader.indicators as btind
 import math
+import numpy as np
+from src.vectorized import OLS_PERIOD, SMA_PERIOD
 
 class PairsTradingStrategy(bt.Strategy):
     """
@@ -12,6 +14,10 @@ class PairsTradingStrategy(bt.Strategy):
     It uses a mean-reversion approach to identify trading opportunities between two correlated assets.
     The strategy checks conditions for entering short or long positions based on the z-score of the spread between the assets.
     It also implements position sizing based on the deviation from the simple moving averages (SMA) of the assets.
+    The z-score indicator is set by the `transform` param: `btind.OLS_TransformationN` refits a statsmodels OLS
+    on every bar, `src.indicators.RollingOLSTransformation` gives the same z-score with constant-time updates.
+    The `sma` and `transform` params also take the `Cached*` indicators of `src.indicators`, which compute
+    their lines once per data and share them with every other run, e.g. in a parameter sweep.
     """
 
     params = dict(
@@ -25,27 +31,36 @@ class PairsTradingStrategy(bt.Strategy):
         low_medium=-0.5,
         status=0,
         portfolio_value=100000,
-        stop_loss=3.0
+        stop_loss=3.0,
+        # z-score indicator to use
+        transform=btind.OLS_TransformationN,
+        # moving average used for position sizing
+        sma=btind.SimpleMovingAverage,
+        # print the orders and the closed positions
+        printlog=False
     )
 
     def log(self, txt, dt=None):
-        dt = dt or self.data.datetime[0]
+        if self.p.printlog:
+            dt = bt.num2date(dt or self.data.datetime[0])
+            print('%s, %s' % (dt.date().isoformat(), txt))
 
     def notify_order(self, order):
         if order.status in [bt.Order.Submitted, bt.Order.Accepted]:
             return  # Await further notifications
 
-        if order.status == order.Completed:
-            if order.isbuy():
-                buytxt = 'BUY COMPLETE, %.2f' % order.executed.price
-                self.log(buytxt, order.executed.dt)
-            else:
-                selltxt = 'SELL COMPLETE, %.2f' % order.executed.price
-                self.log(selltxt, order.executed.dt)
+        # The messages are only built when they are printed, see `src.events` to record the orders.
+        if self.p.printlog:
+            if order.status == order.Completed:
+                if order.isbuy():
+                    buytxt = 'BUY COMPLETE, %.2f' % order.executed.price
+                    self.log(buytxt, order.executed.dt)
+                else:
+                    selltxt = 'SELL COMPLETE, %.2f' % order.executed.price
+                    self.log(selltxt, order.executed.dt)
 
-        elif order.status in [order.Expired, order.Canceled, order.Margin]:
-            self.log('%s ,' % order.Status[order.status])
-            pass  # Simply log
+            elif order.status in [order.Expired, order.Canceled, order.Margin]:
+                self.log('%s ,' % order.Status[order.status])
 
         # Allow new orders
         self.orderid = None
@@ -63,10 +78,10 @@ class PairsTradingStrategy(bt.Strategy):
         self.portfolio_value = self.p.portfolio_value
         self.stop_loss = self.p.stop_loss
 
-        self.sma1 = bt.indicators.SimpleMovingAverage(self.datas[0], period=50)
-        self.sma2 = bt.indicators.SimpleMovingAverage(self.datas[1], period=50)
+        self.sma1 = self.p.sma(self.datas[0], period=SMA_PERIOD)
+        self.sma2 = self.p.sma(self.datas[1], period=SMA_PERIOD)
         # Signals performed with PD.OLS :
-        self.transform = btind.OLS_TransformationN(self.data0, self.data1, period=self.p.period)
+        self.transform = self.p.transform(self.data0, self.data1, period=self.p.period)
         self.zscore = self.transform.zscore
 
     def next(self):
@@ -129,16 +144,159 @@ class PairsTradingStrategy(bt.Strategy):
         elif ((self.zscore[0] < self.up_medium) and (self.zscore[0] > self.low_medium)):
             order1 = self.close(self.data0)
             order2 = self.close(self.data1)
-            if order1 is not None:
-                print('CLOSE POSITION %s, price = %.2f' % ("Visa", self.data0.close[0]))
-            if order2 is not None:
-                print('CLOSE POSITION %s, price = %.2f' % ("Mastercard", self.data1.close[0]))
+            if self.p.printlog:
+                if order1 is not None:
+                    self.log('CLOSE POSITION %s, price = %.2f' % (self.data0._name, self.data0.close[0]))
+                if order2 is not None:
+                    self.log('CLOSE POSITION %s, price = %.2f' % (self.data1._name, self.data1.close[0]))
 
     def stop(self):
-        print('==================================================')
-        print('Starting Value - %.2f' % self.broker.startingcash)
-        print('Ending   Value - %.2f' % self.broker.getvalue())
-        print('==================================================')
+        if self.p.printlog:
+            print('==================================================')
+            print('Starting Value - %.2f' % self.broker.startingcash)
+            print('Ending   Value - %.2f' % self.broker.getvalue())
+            print('==================================================')
+
+
+class PairsPortfolioStrategy(bt.Strategy):
+    """
+    PairsPortfolioStrategy trades many pairs with the rules of PairsTradingStrategy in a single Cerebro run.
+    Each distinct ticker is added once as a named data feed, and the `pairs` param lists the (ticker1, ticker2)
+    pairs to trade, so a ticker shared by several pairs is loaded and synchronized only once.
+    The per-pair state (quantities, status, positions, z-scores) is kept in NumPy arrays, and the SMAs and the
+    rolling OLS z-scores of every pair are updated together on each bar from ring buffers of the closes.
+    The z-score is the one of `btind.OLS_TransformationN`: y is regressed on x over the last 10 bars, and the
+    spread is compared with its mean and standard deviation over `period` bars.
+    Every pair trades its own positions on the shared broker, with a capital of `portfolio_value` (by default
+    the broker value at the time of the entry) times its weight.
+    """
+
+    params = dict(
+        # (ticker1, ticker2) pairs, the tickers being the names of the data feeds
+        pairs=(),
+        # share of the capital allocated to each pair, equal by default
+        weights=None,
+        period=20,
+        qty1=0,
+        qty2=0,
+        upper=2.5,
+        lower=-2.5,
+        up_medium=0.5,
+        low_medium=-0.5,
+        status=0,
+        portfolio_value=None,
+    )
+
+    def __init__(self):
+        pairs = [tuple(pair) for pair in self.p.pairs]
+        if not pairs:
+            raise ValueError('PairsPortfolioStrategy needs at least one pair.')
+        self.pairs = pairs
+        self.tickers = list(dict.fromkeys(ticker for pair in pairs for ticker in pair))
+        self.feeds = []
+        for ticker in self.tickers:
+            feed = self.env.datasbyname.get(ticker)
+            if feed is None:
+                raise ValueError(f'No data feed named {ticker}.')
+            self.feeds.append(feed)
+        column = {ticker: index for index, ticker in enumerate(self.tickers)}
+        self.left = np.array([column[pair[0]] for pair in pairs])
+        self.right = np.array([column[pair[1]] for pair in pairs])
+        weights = np.ones(len(pairs)) if self.p.weights is None else np.asarray(self.p.weights, dtype=np.float64)
+        self.weights = weights / weights.sum()
+
+        # Per pair state
+        self.qty = np.tile(np.array([self.p.qty1, self.p.qty2], dtype=np.int64), (len(pairs), 1))
+        self.status = np.full(len(pairs), self.p.status, dtype=np.int8)
+        self.holdings = np.zeros((len(pairs), 2), dtype=np.int64)
+        self.zscore = np.full(len(pairs), np.nan)
+
+        # Ring buffers of the closes of every ticker and of the spreads of every pair.
+        self._window = max(SMA_PERIOD, OLS_PERIOD)
+        self._closes = np.full((self._window, len(self.tickers)), np.nan)
+        self._spreads = np.full((self.p.period, len(pairs)), np.nan)
+        self._lengths = np.zeros(len(self.tickers), dtype=np.int64)
+        self._bar = 0
+
+    def notify_order(self, order):
+        if order.status in [bt.Order.Submitted, bt.Order.Accepted, bt.Order.Partial]:
+            return  # Await further notifications
+        # Completed, or rejected after a partial fill: book what was executed to its pair.
+        self.holdings[order.info.pair, order.info.leg] += order.executed.size
+
+    def _update(self):
+        # Tickers without a bar on this date (not listed yet) are NaN, and so are their pairs.
+        lengths = np.fromiter((len(feed) for feed in self.feeds), dtype=np.int64, count=len(self.feeds))
+        closes = np.fromiter((feed.close[0] for feed in self.feeds), dtype=np.float64, count=len(self.feeds))
+        closes[lengths == self._lengths] = np.nan
+        self._lengths = lengths
+        row = self._bar % self._window
+        self._closes[row] = closes
+
+        window = self._closes[(row - np.arange(OLS_PERIOD)) % self._window]
+        y, x = window[:, self.left], window[:, self.right]
+        x_mean, y_mean = x.mean(axis=0), y.mean(axis=0)
+        x_dev = x - x_mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = (x_dev * (y - y_mean)).sum(axis=0) / (x_dev * x_dev).sum(axis=0)
+            intercept = y_mean - slope * x_mean
+            spread = closes[self.left] - (slope * closes[self.right] + intercept)
+            self._spreads[self._bar % self.p.period] = spread
+            mean = self._spreads.mean(axis=0)
+            std = np.sqrt((self._spreads * self._spreads).mean(axis=0) - mean * mean)
+            self.zscore = (spread - mean) / std
+        self._bar += 1
+
+        sma = self._closes[(row - np.arange(SMA_PERIOD)) % self._window].mean(axis=0)
+        return closes, sma
+
+    def _order(self, pair, leg, size):
+        if size:
+            feed = self.feeds[(self.left, self.right)[leg][pair]]
+            order = (self.buy if size > 0 else self.sell)(data=feed, size=abs(size))
+            order.addinfo(pair=pair, leg=leg)
+
+    def prenext(self):
+        # Pairs whose tickers are listed trade while the other tickers have no data yet.
+        self.next()
+
+    def next(self):
+        closes, sma = self._update()
+        z = self.zscore
+        active = np.isfinite(z) & np.isfinite(sma[self.left]) & np.isfinite(sma[self.right])
+        with np.errstate(invalid='ignore'):
+            short = active & (z > self.p.upper) & (self.status != 1)
+            long = active & ~short & (z < self.p.lower) & (self.status != 2)
+            flat = active & ~short & ~long & (z < self.p.up_medium) & (z > self.p.low_medium)
+
+        capital = self.p.portfolio_value if self.p.portfolio_value is not None else self.broker.getvalue()
+        for pair in np.flatnonzero(short | long | flat):
+            if flat[pair]:
+                # Close the positions of this pair only, other pairs may hold the same tickers.
+                self._order(pair, 0, -self.holdings[pair, 0])
+                self._order(pair, 1, -self.holdings[pair, 1])
+                continue
+
+            # POSITION SIZING based off SMA
+            close1, close2 = closes[self.left[pair]], closes[self.right[pair]]
+            deviationOffSMA1 = math.fabs((close1 / sma[self.left[pair]]) - 1)
+            deviationOffSMA2 = math.fabs((close2 / sma[self.right[pair]]) - 1)
+            value1 = 0.6 * capital * self.weights[pair]
+            value2 = 0.4 * capital * self.weights[pair]
+            if deviationOffSMA1 > deviationOffSMA2:
+                x, y = int(value1 / close1), int(value2 / close2)
+            else:
+                x, y = int(value2 / close1), int(value1 / close2)
+
+            if short[pair]:
+                self._order(pair, 0, -(x + self.qty[pair, 0]))
+                self._order(pair, 1, y + self.qty[pair, 1])
+                self.status[pair] = 1  # short the spread
+            else:
+                self._order(pair, 0, x + self.qty[pair, 0])
+                self._order(pair, 1, -(y + self.qty[pair, 1]))
+                self.status[pair] = 2  # long the spread
+            self.qty[pair] = x, y
 
 
 class SimpleMovingAverage(bt.Strategy):
@@ -169,26 +327,32 @@ class SimpleMovingAverage(bt.Strategy):
         # period for the slow moving average
         ('slow', 30),
         # moving average to use
-        ('_movav', btind.MovAv.SMA)
+        ('_movav', btind.MovAv.SMA),
+        # crossover indicator to use
+        ('_crossover', btind.CrossOver),
+        # print the orders
+        ('printlog', False),
     )
     def log(self, txt, dt=None):
-        dt = dt or self.data.datetime[0]
+        if self.p.printlog:
+            dt = bt.num2date(dt or self.data.datetime[0])
+            print('%s, %s' % (dt.date().isoformat(), txt))
 
     def notify_order(self, order):
         if order.status in [bt.Order.Submitted, bt.Order.Accepted]:
             return  # Await further notifications
 
-        if order.status == order.Completed:
-            if order.isbuy():
-                buytxt = 'BUY COMPLETE, %.2f' % order.executed.price
-                self.log(buytxt, order.executed.dt)
-            else:
-                selltxt = 'SELL COMPLETE, %.2f' % order.executed.price
-                self.log(selltxt, order.executed.dt)
+        if self.p.printlog:
+            if order.status == order.Completed:
+                if order.isbuy():
+                    buytxt = 'BUY COMPLETE, %.2f' % order.executed.price
+                    self.log(buytxt, order.executed.dt)
+                else:
+                    selltxt = 'SELL COMPLETE, %.2f' % order.executed.price
+                    self.log(selltxt, order.executed.dt)
 
-        elif order.status in [order.Expired, order.Canceled, order.Margin]:
-            self.log('%s ,' % order.Status[order.status])
-            pass  # Simply log
+            elif order.status in [order.Expired, order.Canceled, order.Margin]:
+                self.log('%s ,' % order.Status[order.status])
 
         # Allow new orders
         self.orderid = None    
@@ -197,7 +361,7 @@ class SimpleMovingAverage(bt.Strategy):
         sma_fast = self.p._movav(period=self.p.fast)
         sma_slow = self.p._movav(period=self.p.slow)
 
-        self.buysig = btind.CrossOver(sma_fast, sma_slow)
+        self.buysig = self.p._crossover(sma_fast, sma_slow)
 
     def next(self):
         if self.position.size:
@@ -211,6 +375,8 @@ class SimpleRSI(bt.Strategy):
     params = (
         ('maperiod', 15),
         ('printlog', False),
+        # RSI indicator to use
+        ('_rsi', btind.RelativeStrengthIndex),
     )
 
     def log(self, txt, dt=None, doprint=False):
@@ -229,7 +395,7 @@ class SimpleRSI(bt.Strategy):
         self.buycomm = None
 
         # Add a RSI indicator
-        self.rsi = bt.indicators.RelativeStrengthIndex(self.datas[0])
+        self.rsi = self.p._rsi(self.datas[0])
 
     def notify_order(self, order):
         if order.status in [order.Submitted, order.Accepted]:
@@ -240,15 +406,16 @@ class SimpleRSI(bt.Strategy):
         # Attention: broker could reject order if not enough cash
         if order.status in [order.Completed]:
             if order.isbuy():
-                self.log(
-                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                    (order.executed.price,
-                     order.executed.value,
-                     order.executed.comm))
+                if self.p.printlog:
+                    self.log(
+                        'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
+                        (order.executed.price,
+                         order.executed.value,
+                         order.executed.comm))
 
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
-            else:  # Sell
+            elif self.p.printlog:  # Sell
                 self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
                          (order.executed.price,
                           order.executed.value,
@@ -263,7 +430,7 @@ class SimpleRSI(bt.Strategy):
         self.order = None
 
     def notify_trade(self, trade):
-        if not trade.isclosed:
+        if not trade.isclosed or not self.p.printlog:
             return
 
         self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' %
@@ -271,7 +438,9 @@ class SimpleRSI(bt.Strategy):
 
     def next(self):
         # Simply log the closing price of the series from the reference
-        self.log('Close, %.2f' % self.dataclose[0])
+        # (the messages of `next` are only built when they are printed)
+        if self.p.printlog:
+            self.log('Close, %.2f' % self.dataclose[0])
 
         # Check if an order is pending ... if yes, we cannot send a 2nd one
         if self.order:
@@ -284,7 +453,8 @@ class SimpleRSI(bt.Strategy):
             if self.rsi[0] < 40:
 
                 # BUY, BUY, BUY!!! (with all possible default parameters)
-                self.log('BUY CREATE, %.2f' % self.dataclose[0])
+                if self.p.printlog:
+                    self.log('BUY CREATE, %.2f' % self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.buy()
@@ -293,12 +463,13 @@ class SimpleRSI(bt.Strategy):
 
             if self.rsi[0] > 60:
                 # SELL, SELL, SELL!!! (with all possible default parameters)
-                self.log('SELL CREATE, %.2f' % self.dataclose[0])
+                if self.p.printlog:
+                    self.log('SELL CREATE, %.2f' % self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.sell()
 
     def stop(self):
         self.log('(MA Period %2d) Ending Value %.2f' %
-                 (self.params.maperiod, self.broker.getvalue()), doprint=True)
+                 (self.params.maperiod, self.broker.getvalue()))
 
@@ -0,0 +1,265 @@
+"""Streaming backtests over partitioned intraday bars, in bounded memory.
+
+Intraday bars are stored one CSV file per ticker and day, `<folder>/<ticker>/<YYYY-MM-DD>.csv`
+(optionally compressed, e.g. `.csv.gz`), with the `date,open,high,low,close,volume` header of the
+daily files and the time of the bar in the date column. `write_partitions` splits downloaded bars
+into that layout.
+
+`StreamingData` reads the partitions in chunks of at most `chunksize` rows, on a background thread
+that keeps `prefetch` chunks ahead of the strategy, so reading and parsing the files overlaps with
+the backtest. Only those chunks are held in memory. Run it in a cerebro from `streaming_cerebro`,
+which neither preloads the data nor keeps more bars of the lines than the indicators need, so the
+memory stays flat whatever the length of the history:
+
+    cerebro = streaming_cerebro()
+    cerebro.adddata(stream_feed('AAPL', start='2024-01-02', end='2024-03-28'), name='AAPL')
+    cerebro.addstrategy(SimpleRSI)
+    cerebro.run()
+"""
+import os
+import queue
+import threading
+
+import backtrader as bt
+import pandas as pd
+
+from src.feeds import frame_arrays
+
+PARTITION_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2', '.csv.zip', '.csv.xz')
+
+
+def default_partition_folder():
+    """Returns the path of the `data/intraday` folder, next to the daily `data/raw` folder."""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(os.path.dirname(package_dir), 'data', 'intraday')
+
+
+def _partition_day(file_name):
+    for extension in PARTITION_EXTENSIONS:
+        if file_name.endswith(extension):
+            return file_name[:-len(extension)]
+    return None
+
+
+def partition_files(ticker, folder=None, start=None, end=None):
+    """
+    Returns the partition files of a ticker, in date order.
+
+    Parameters:
+    - ticker (str): The ticker symbol.
+    - folder (str, optional): The partitions folder. Defaults to `data/intraday`.
+    - start (str, optional): First day, e.g. '2024-01-02'.
+    - end (str, optional): Last day, inclusive.
+
+    Returns:
+    - list: The paths of the `<folder>/<ticker>/<YYYY-MM-DD>.csv` files between `start` and `end`.
+    """
+    ticker_folder = os.path.join(folder or default_partition_folder(), ticker)
+    if not os.path.isdir(ticker_folder):
+        raise ValueError(f'Intraday data for {ticker} does not exist.')
+    start = None if start is None else pd.Timestamp(start).strftime('%Y-%m-%d')
+    end = None if end is None else pd.Timestamp(end).strftime('%Y-%m-%d')
+    files = []
+    for file_name in os.listdir(ticker_folder):
+        day = _partition_day(file_name)
+        if day is None or (start is not None and day < start) or (end is not None and day > end):
+            continue
+        files.append((day, os.path.join(ticker_folder, file_name)))
+    return [path for day, path in sorted(files)]
+
+
+def write_partitions(df, ticker, folder=None):
+    """
+    Writes bars to the partitions of a ticker, one CSV file per day, replacing the existing days.
+
+    Parameters:
+    - df (pd.DataFrame): The bars, indexed by date and time, with open, high, low, close and volume columns.
+    - ticker (str): The ticker symbol.
+    - folder (str, optional): The partitions folder. Defaults to `data/intraday`.
+
+    Returns:
+    - list: The paths of the files written.
+    """
+    ticker_folder = os.path.join(folder or default_partition_folder(), ticker)
+    os.makedirs(ticker_folder, exist_ok=True)
+    df = df.sort_index()
+    df.index.name = 'date'
+    paths = []
+    for day, bars in df.groupby(df.index.normalize()):
+        path = os.path.join(ticker_folder, f'{day:%Y-%m-%d}.csv')
+        bars.to_csv(path + '.tmp', date_format='%Y-%m-%d %H:%M:%S')
+        os.replace(path + '.tmp', path)
+        paths.append(path)
+    return paths
+
+
+def iter_chunks(files, chunksize=100_000):
+    """
+    Reads partition files in chunks.
+
+    Parameters:
+    - files (list): The CSV files, in date order.
+    - chunksize (int): Maximum number of rows of a chunk.
+
+    Yields:
+    - dict: The 'datetime' (backtrader date numbers), 'open', 'high', 'low', 'close' and 'volume'
+      of the bars of a chunk, as lists of floats ready to be copied to the lines of a feed.
+    """
+    for path in files:
+        with pd.read_csv(path, parse_dates=['date'], index_col='date', chunksize=chunksize) as reader:
+            for chunk in reader:
+                if len(chunk):
+                    yield {name: values.tolist() for name, values in frame_arrays(chunk).items()}
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class ReadAhead:
+    """
+    Iterates over an iterable on a background thread, at most `size` items ahead of the consumer.
+
+    Exceptions raised by the iterable are raised again by `next`. Call `close` to stop the thread
+    before the end of the iterable.
+
+    Parameters:
+    - iterable (iterable): The items to read, e.g. a generator of chunks.
+    - size (int): Maximum number of items waiting to be consumed.
+    """
+    _END = object()
+
+    def __init__(self, iterable, size=2):
+        self._queue = queue.Queue(maxsize=max(size, 1))
+        self._stop = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=self._produce, args=(iter(iterable),), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, iterator):
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    return
+        except BaseException as error:
+            self._put(_Failure(error))
+            return
+        self._put(self._END)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        item = self._queue.get()
+        if item is self._END:
+            self._done = True
+            raise StopIteration
+        if isinstance(item, _Failure):
+            self._done = True
+            raise item.error
+        return item
+
+    def close(self):
+        """Stops the background thread and drops the items read ahead."""
+        self._stop.set()
+        self._done = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._thread.join()
+
+
+class StreamingData(bt.feed.DataBase):
+    '''Data feed streaming bars from partition files, chunk by chunk.
+
+    The chunks are read on a background thread (see ``ReadAhead``) while
+    the strategy runs, and only ``prefetch`` chunks wait in memory. Use it
+    in a cerebro which does not preload the data, see ``streaming_cerebro``.
+
+    Params:
+      - ``dataname``: the CSV partition files, in date order (see
+        ``partition_files``)
+      - ``chunksize``: maximum number of rows read at once
+      - ``prefetch``: number of chunks read ahead, 0 to read them in the
+        main thread
+      - ``timeframe``: minutes by default
+    '''
+    params = (
+        ('chunksize', 100_000),
+        ('prefetch', 2),
+        ('timeframe', bt.TimeFrame.Minutes),
+    )
+
+    def start(self):
+        super(StreamingData, self).start()
+        chunks = iter_chunks(list(self.p.dataname), self.p.chunksize)
+        self._reader = ReadAhead(chunks, self.p.prefetch) if self.p.prefetch else None
+        self._chunks = self._reader or chunks
+        self._columns = []
+        self._row = self._size = 0
+
+    def stop(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        super(StreamingData, self).stop()
+
+    def _load(self):
+        while self._row >= self._size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            self._columns = [(getattr(self.lines, name), values) for name, values in chunk.items()]
+            self._row, self._size = 0, len(chunk['datetime'])
+        row = self._row
+        for line, values in self._columns:
+            line[0] = values[row]
+        self._row += 1
+        return True
+
+
+def stream_feed(ticker, folder=None, start=None, end=None, chunksize=100_000, prefetch=2, **kwargs):
+    """
+    Returns a `StreamingData` feed of the partitions of a ticker.
+
+    Parameters:
+    - ticker (str): The ticker symbol.
+    - folder (str, optional): The partitions folder. Defaults to `data/intraday`.
+    - start (str, optional): First day, e.g. '2024-01-02'.
+    - end (str, optional): Last day, inclusive.
+    - chunksize (int): Maximum number of rows read at once.
+    - prefetch (int): Number of chunks read ahead on a background thread.
+    - kwargs: Other parameters of the feed.
+    """
+    files = partition_files(ticker, folder, start, end)
+    return StreamingData(dataname=files, chunksize=chunksize, prefetch=prefetch, **kwargs)
+
+
+def streaming_cerebro(**kwargs):
+    """
+    Returns a cerebro engine for streaming feeds.
+
+    It loads the bars one by one instead of preloading them, and only keeps the bars of the lines
+    that the indicators need (`exactbars=1`). The standard observers are off, and plotting is not
+    possible.
+
+    Parameters:
+    - kwargs: Other parameters of the cerebro engine.
+    """
+    options = dict(preload=False, runonce=False, exactbars=1, stdstats=False)
+    options.update(kwargs)
+    return bt.Cerebro(**options)
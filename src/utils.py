@@ -1,23 +1,44 @@
+import threading
+
+import numpy as np
 import pandas as pd
-from openbb import obb
-from statsmodels.api import OLS, add_constant
-from statsmodels.tsa.stattools import adfuller
-import statsmodels.api as stat
-from src.config import get_api_key
+from src.data_manager import DataManager
+
+# OpenBB, statsmodels and scipy take seconds to import, so they are imported by the functions using
+# them. The OpenBB session is opened by `openbb_session` on the first download and shared afterwards.
+_session = {}
+_session_lock = threading.Lock()
+
+
+def openbb_session(pat=None):
+    """
+    Returns the OpenBB app, logged in on the first call and reused by the following ones.
+
+    Parameters:
+    - pat (str, optional): The OpenBB personal access token. Read from the `.env` file by default.
+    """
+    with _session_lock:
+        if 'obb' not in _session:
+            from openbb import obb
+            from src.config import get_api_key
+            obb.account.login(pat=pat or get_api_key())
+            _session['obb'] = obb
+        return _session['obb']
 
 
 class DataWrangler:
     """
     A class for downloading historical data for a given ticker.
+
+    The OpenBB session is only opened when data is downloaded, see `openbb_session`.
     """
 
-    def __init__(self):
-        self.pat = get_api_key()
-        obb.account.login(pat=self.pat)
+    def __init__(self, pat=None):
+        self.pat = pat
         self.start_date = '2020-01-01'
         self.end_date = '2024-01-01'
 
-    def download_data(self, ticker, start_date, end_date):
+    def download_data(self, ticker, start_date, end_date, interval='1d'):
         """
         Downloads historical data for the given ticker.
 
@@ -25,19 +46,27 @@ class DataWrangler:
         - ticker (str): The ticker symbol of the stock.
         - start_date (str): The start date of the historical data in the format 'YYYY-MM-DD'.
         - end_date (str): The end date of the historical data in the format 'YYYY-MM-DD'.
+        - interval (str): The bar interval, '1d' by default, or e.g. '1m' for minute bars
+          (see `src.streaming.write_partitions` to store them).
 
         Returns:
         - historical_data (pandas.DataFrame): The historical data for the given ticker.
         """
-        historical_data = obb.equity.price.historical(ticker, interval='1d', start_date=start_date, end_date=end_date, provider='yfinance').to_df()
+        obb = openbb_session(self.pat)
+        historical_data = obb.equity.price.historical(ticker, interval=interval, start_date=start_date, end_date=end_date, provider='yfinance').to_df()
         return historical_data
 
 class TimeSeriesAnalysis:
     """
     A class for performing time series analysis.
     - estimate_long_run_short_run_relationships(y, x) to estimate the long-run and short-run cointegration relationships.
+    - estimate_relationships_batch(prices, pairs) to do the same for many pairs of a price matrix at once.
     - engle_granger_two_step_cointegration_test(y, x) to perform the two-step Engle & Granger test for cointegration.
     - adf_test(data) to perform the Augmented Dickey-Fuller test for cointegration.
+    - prefilter_pairs(universe) to keep the most correlated or closest pairs of a universe before testing them.
+    - scan_pairs(universe) to run the Engle & Granger test on every pair of a universe in batch.
+    - rolling_cointegration(y, x) to re-estimate the Engle & Granger test over a rolling or expanding window.
+    - rolling_scan_pairs(pairs) to do the same for many pairs in batch.
     """
     
     @staticmethod
@@ -58,7 +87,8 @@ class TimeSeriesAnalysis:
         assert sum(df1.isnull()) == 0, 'Input series df1 has nan-values. Unhandled case.'
         assert sum(df2.isnull()) == 0, 'Input series df2 has nan-values. Unhandled case.'
         assert df1.index.equals(df2.index), 'The two input series df1 and df2 do not have the same index.'
-        
+        from statsmodels.api import OLS, add_constant
+
         long_run_ols = OLS(df1, add_constant(df2), has_const=True)
         long_run_ols_fit = long_run_ols.fit()
 
@@ -68,10 +98,74 @@ class TimeSeriesAnalysis:
         short_run_ols = OLS(df1.diff().iloc[1:], (z.shift().iloc[1:]))
         short_run_ols_fit = short_run_ols.fit()
 
-        alpha = short_run_ols_fit.params[0]
+        alpha = short_run_ols_fit.params.iloc[0]
 
         return c, gamma, alpha, z
 
+    @staticmethod
+    def estimate_relationships_batch(prices, pairs, dtype=np.float64, chunk_size=1024):
+        """
+        Estimates the long-run and short-run relationships of many pairs of a price matrix at once.
+
+        Gives the same c, gamma, alpha and residuals as `estimate_long_run_short_run_relationships` for
+        every pair, with closed-form least squares solved for blocks of pairs. The prices are checked and
+        centered once for the whole batch, and each series is only centered once whatever the number of
+        pairs it belongs to.
+
+        Parameters:
+            prices (np.ndarray or pd.DataFrame): The (dates x tickers) price matrix, without NaN in the
+                columns used by the pairs.
+            pairs (array-like): The (i, j) column indices of the pairs, series i being regressed on series j.
+                With a DataFrame, the pairs can also be given as (ticker1, ticker2) column names.
+            dtype (np.dtype): np.float64, or np.float32 to halve the memory used by the residuals on
+                large universes. The sums of the regressions are accumulated in float64 either way.
+            chunk_size (int): Number of pairs solved together, bounds the temporary memory.
+
+        Returns:
+            tuple: The arrays c, gamma and alpha (one value per pair) and the (dates x pairs) residual
+                   matrix z, all of `dtype`.
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float32, np.float64):
+            raise ValueError(f'Unsupported dtype {dtype}, expected float32 or float64.')
+        pairs = _pair_columns(prices, pairs)
+        values = np.asarray(prices, dtype=dtype)
+        if values.ndim != 2:
+            raise ValueError('The prices should be a (dates x tickers) matrix.')
+        if len(pairs) and (pairs.min() < 0 or pairs.max() >= values.shape[1]):
+            raise ValueError('The pairs refer to columns which are not in the price matrix.')
+        used = np.unique(pairs)
+        if not np.isfinite(values[:, used]).all():
+            raise ValueError('The prices of the pairs have nan-values. Unhandled case.')
+
+        # Every used column is centered once: the long-run fit on centered data is a single ratio.
+        means = np.zeros(values.shape[1])
+        means[used] = values[:, used].mean(axis=0, dtype=np.float64)
+        centered = np.zeros_like(values)
+        centered[:, used] = values[:, used] - means[used].astype(dtype)
+        squares = np.zeros(values.shape[1])
+        squares[used] = np.square(centered[:, used]).sum(axis=0, dtype=np.float64)
+        changes = np.diff(centered, axis=0)
+
+        c = np.empty(len(pairs), dtype=dtype)
+        gamma = np.empty(len(pairs), dtype=dtype)
+        alpha = np.empty(len(pairs), dtype=dtype)
+        z = np.empty((len(values), len(pairs)), dtype=dtype)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for start in range(0, len(pairs), chunk_size):
+                block = slice(start, start + chunk_size)
+                left, right = pairs[block, 0], pairs[block, 1]
+                y, x = centered[:, left], centered[:, right]
+                block_gamma = (y * x).sum(axis=0, dtype=np.float64) / squares[right]
+                gamma[block] = block_gamma
+                c[block] = means[left] - block_gamma * means[right]
+                z[:, block] = residuals = y - block_gamma.astype(dtype) * x
+                # Short run: diff(y) = alpha * z(-1), without constant.
+                lagged = residuals[:-1]
+                alpha[block] = ((changes[:, left] * lagged).sum(axis=0, dtype=np.float64)
+                                / np.square(lagged).sum(axis=0, dtype=np.float64))
+        return c, gamma, alpha, z
+
     @staticmethod
     def engle_granger_two_step_cointegration_test(df1, df2):
         """
@@ -95,6 +189,8 @@ class TimeSeriesAnalysis:
         assert sum(df2.isnull()) == 0, 'Input series df2 has nan-values. Unhandled case.'
         assert df1.index.equals(df2.index), 'The two input series df1 and df2 do not have the same index.'
 
+        from statsmodels.tsa.stattools import adfuller
+
         c, gamma, alpha, z = TimeSeriesAnalysis.estimate_long_run_short_run_relationships(df1, df2)
 
         adfstat, pvalue, usedlag, nobs, crit_values = adfuller(z, maxlag=1, autolag=None)
@@ -124,6 +220,9 @@ class TimeSeriesAnalysis:
         assert sum(df2.isnull()) == 0, 'Input series df2 has nan-values. Unhandled case.'
         assert df1.index.equals(df2.index), 'The two input series df1 and df2 do not have the same index.'
 
+        import statsmodels.api as stat
+        from statsmodels.tsa.stattools import adfuller
+
         #store result of OLS regression on closing prices of fetched data
         df1 = df1.dropna()
         df2 = df2.dropna()
@@ -139,4 +238,445 @@ class TimeSeriesAnalysis:
         if computationResults[0] <= computationResults[4]['10%']  and computationResults[1]<= 0.05:
             print("Given Sig Level <= Critical Value @ 10%, and pValue <= 0.05")
             print ("Co-integrated")
-            return True
\ No newline at end of file
+            return True
+
+    @staticmethod
+    def prefilter_pairs(universe=None, field='adj_close', data_manager=None, method='correlation', on='returns',
+                        top_k=None, min_correlation=None, max_distance=None, min_obs=30, block_size=1024):
+        """
+        Scores every pair of a universe with cheap similarity measures, to only run the cointegration tests
+        on the candidates.
+
+        Two measures are computed for all the pairs at once with matrix products, over the dates where both
+        tickers have data:
+        - correlation: the Pearson correlation of the log returns (or of the log prices with on='prices').
+        - distance: the mean squared difference of the prices normalized by their value at the first common
+          date of the pair, the distance of the classic distance method of pairs selection. A ticker listed
+          later than its partner does not inflate the distance with the moves before its listing.
+
+        A pair is kept if it passes the thresholds, and, with `top_k`, if it is one of the `top_k` best
+        pairs of one of its two tickers, ranked by `method`. The candidates can be passed as they are to
+        `scan_pairs(pairs=...)` or `rolling_scan_pairs`.
+
+        Parameters:
+            universe (list or pd.DataFrame, optional): The tickers, or an already aligned price matrix with
+                dates as index and tickers as columns. Defaults to every available ticker.
+            field (str): The price column used when loading tickers. Defaults to 'adj_close', the split
+                and dividend adjusted close.
+            data_manager (DataManager, optional): The data manager used to load tickers.
+            method (str): 'correlation' (highest first) or 'distance' (lowest first), ranks the pairs.
+            on (str): 'returns' or 'prices', the log series whose correlation is computed.
+            top_k (int, optional): Number of best partners kept per ticker. All the pairs passing the
+                thresholds are kept if None.
+            min_correlation (float, optional): Only keep pairs with a correlation at least this high.
+            max_distance (float, optional): Only keep pairs with a distance at most this high.
+            min_obs (int): Pairs with fewer common dates are skipped.
+            block_size (int): Number of tickers scored against the whole universe at once, bounds the
+                memory used to a few (block_size x tickers) arrays.
+
+        Returns:
+            pd.DataFrame: One row per candidate pair with the columns ticker1, ticker2 (in universe order),
+            correlation, distance and nobs, best pairs first.
+        """
+        if method not in ('correlation', 'distance'):
+            raise ValueError(f'Unknown method {method!r}, expected correlation or distance.')
+        if on not in ('returns', 'prices'):
+            raise ValueError(f'Unknown series {on!r}, expected returns or prices.')
+        prices = _load_price_matrix(universe, field, data_manager)
+        tickers = list(prices.columns)
+        values = prices.to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.where(values > 0, values, np.nan)
+            logs = np.log(values)
+        series = np.diff(logs, axis=0) if on == 'returns' else logs
+        correlation_stats = _masked_moments(series)
+        distance_stats = _masked_moments(values, center=False)
+        # The prices are normalized per pair: by the last price of each ticker on the first common date.
+        anchors = (pd.DataFrame(values).ffill().to_numpy(), np.argmax(np.isfinite(values), axis=0))
+
+        found = []
+        for start in range(0, len(tickers), block_size):
+            rows = np.arange(start, min(start + block_size, len(tickers)))
+            correlation, nobs = _block_correlation(correlation_stats, rows)
+            distance, price_nobs = _block_distance(distance_stats, rows, anchors)
+            keep = (price_nobs >= min_obs) & (rows[:, None] != np.arange(len(tickers)))
+            keep &= np.isfinite(correlation) & np.isfinite(distance)
+            if min_correlation is not None:
+                keep &= correlation >= min_correlation
+            if max_distance is not None:
+                keep &= distance <= max_distance
+            if top_k is not None:
+                score = np.where(keep, -correlation if method == 'correlation' else distance, np.inf)
+                order = np.argsort(score, axis=1, kind='stable')[:, :top_k]
+                best = np.zeros_like(keep)
+                np.put_along_axis(best, order, True, axis=1)
+                keep &= best
+            block_rows, columns = np.nonzero(keep)
+            found.append((rows[block_rows], columns, correlation[block_rows, columns],
+                          distance[block_rows, columns], price_nobs[block_rows, columns]))
+
+        left, right, correlation, distance, nobs = (np.concatenate(parts) for parts in zip(*found))
+        candidates = pd.DataFrame(dict(ticker1=np.minimum(left, right), ticker2=np.maximum(left, right),
+                                       correlation=correlation, distance=distance, nobs=nobs.astype(int)))
+        candidates = candidates.drop_duplicates(['ticker1', 'ticker2'])
+        names = np.asarray(tickers, dtype=object)
+        candidates['ticker1'] = names[candidates['ticker1'].to_numpy()]
+        candidates['ticker2'] = names[candidates['ticker2'].to_numpy()]
+        by, ascending = ('correlation', False) if method == 'correlation' else ('distance', True)
+        return candidates.sort_values(by, ascending=ascending, kind='mergesort').reset_index(drop=True)
+
+    @staticmethod
+    def scan_pairs(universe=None, field='adj_close', data_manager=None, max_pvalue=None, min_obs=30, chunk_size=1024,
+                   pairs=None):
+        """
+        Applies the two-step Engle & Granger test to every pair of tickers of a universe at once.
+
+        Each series is loaded a single time into an aligned (dates x tickers) price matrix. The long-run
+        regressions and the ADF regressions of their residuals are then solved for blocks of pairs with
+        NumPy, instead of one statsmodels fit per pair. The test specification matches
+        `engle_granger_two_step_cointegration_test` (constant in both steps, one lagged difference), so
+        the statistics and p-values agree with it. Each pair is tested over the dates where both tickers
+        have data, which handles tickers listed after the start of the sample.
+
+        Parameters:
+            universe (list or pd.DataFrame, optional): The tickers to scan, or an already aligned price
+                matrix with dates as index and tickers as columns. Defaults to every available ticker.
+            field (str): The price column used when loading tickers. Defaults to 'adj_close', the split
+                and dividend adjusted close.
+            data_manager (DataManager, optional): The data manager used to load tickers.
+            max_pvalue (float, optional): Only keep pairs with a p-value lower or equal to this value.
+            min_obs (int): Pairs with fewer common observations are skipped.
+            chunk_size (int): Number of pairs solved together, bounds the memory used by the scan.
+            pairs (list or pd.DataFrame, optional): Only test these (ticker1, ticker2) pairs, e.g. the
+                candidates of `prefilter_pairs`, instead of every pair of the universe.
+
+        Returns:
+            pd.DataFrame: One row per pair (ticker1 regressed on ticker2) with the columns c, gamma, alpha,
+            adfstat, pvalue and nobs, sorted by increasing p-value.
+        """
+        from statsmodels.tsa.adfvalues import mackinnonp
+
+        prices = _load_price_matrix(universe, field, data_manager)
+        tickers = list(prices.columns)
+        values = prices.to_numpy(dtype=np.float64)
+        valid = np.isfinite(values)
+        values = np.where(valid, values, 0.0)
+
+        if pairs is None:
+            left, right = np.triu_indices(len(tickers), k=1)
+        else:
+            if isinstance(pairs, pd.DataFrame):
+                pairs = pairs[['ticker1', 'ticker2']].itertuples(index=False)
+            left, right = _pair_columns(prices, [tuple(pair) for pair in pairs]).T
+        columns = ['c', 'gamma', 'alpha', 'adfstat', 'nobs']
+        results = np.full((len(left), len(columns)), np.nan)
+        for start in range(0, len(left), chunk_size):
+            stop = start + chunk_size
+            results[start:stop] = _engle_granger_block(values, valid, left[start:stop], right[start:stop])
+
+        scan = pd.DataFrame(results, columns=columns)
+        scan.insert(0, 'ticker2', np.asarray(tickers, dtype=object)[right])
+        scan.insert(0, 'ticker1', np.asarray(tickers, dtype=object)[left])
+        scan = scan[scan['nobs'] >= min_obs].copy()
+        scan['nobs'] = scan['nobs'].astype(int)
+        scan['pvalue'] = [mackinnonp(stat_value, regression='c', N=1) for stat_value in scan['adfstat']]
+        if max_pvalue is not None:
+            scan = scan[scan['pvalue'] <= max_pvalue]
+        return scan.sort_values(['pvalue', 'adfstat'], kind='mergesort').reset_index(drop=True)
+
+
+    @staticmethod
+    def rolling_cointegration(df1, df2, window=None, min_periods=60, step=1):
+        """
+        Re-estimates the two-step Engle & Granger test over a rolling or an expanding window.
+
+        Every estimate only uses the observations up to its date, so the series can be used for walk-forward
+        pair selection without look-ahead. Each window gives the same c, gamma, alpha and ADF statistic as
+        `engle_granger_two_step_cointegration_test` applied to the data of that window.
+
+        Parameters:
+            df1 (pd.Series): The first input series, regressed on the second one.
+            df2 (pd.Series): The second input series, with the same index.
+            window (int, optional): Number of observations of the rolling window. By default the window
+                expands from the first date where both series have data.
+            min_periods (int): Dates with fewer observations in their window are NaN.
+            step (int): Re-estimate every `step` dates only, counting back from the last date.
+
+        Returns:
+            pd.DataFrame: The columns c, gamma, alpha, adfstat, pvalue and nobs (of the ADF regression),
+            indexed by the last date of each window.
+        """
+        assert isinstance(df1, pd.Series), 'Input series df1 should be of type pd.Series'
+        assert isinstance(df2, pd.Series), 'Input series df2 should be of type pd.Series'
+        assert df1.index.equals(df2.index), 'The two input series df1 and df2 do not have the same index.'
+
+        y = df1.to_numpy(dtype=np.float64)[:, None]
+        x = df2.to_numpy(dtype=np.float64)[:, None]
+        ends = _window_ends(len(y), step)
+        results = _rolling_engle_granger_block(y, x, ends, window, min_periods)
+        return pd.DataFrame({name: values[:, 0] for name, values in results.items()}, index=df1.index[ends])
+
+    @staticmethod
+    def rolling_scan_pairs(pairs, universe=None, field='adj_close', data_manager=None, window=None, min_periods=60,
+                           step=1, chunk_size=128):
+        """
+        Runs `rolling_cointegration` for many pairs at once.
+
+        The prices are loaded a single time into an aligned price matrix. For each block of pairs, running
+        sums of the products of the prices and of their differences are accumulated once over the dates. The
+        regressions of any window are then solved from the difference of two running sums, so the cost of
+        a window does not depend on its length.
+
+        Parameters:
+            pairs (list): The (ticker1, ticker2) pairs, ticker1 being regressed on ticker2.
+            universe (pd.DataFrame, optional): An already aligned price matrix with dates as index and tickers
+                as columns. Loaded with the data manager otherwise.
+            field (str): The price column used when loading tickers. Defaults to 'adj_close', the split
+                and dividend adjusted close.
+            data_manager (DataManager, optional): The data manager used to load tickers.
+            window (int, optional): Number of observations of the rolling window, expanding by default.
+            min_periods (int): Dates with fewer observations in their window are NaN.
+            step (int): Re-estimate every `step` dates only, counting back from the last date.
+            chunk_size (int): Number of pairs processed together, bounds the memory used.
+
+        Returns:
+            dict: Maps c, gamma, alpha, adfstat, pvalue and nobs to a DataFrame with the last date of each
+            window as index and the pairs as columns.
+        """
+        pairs = [tuple(pair) for pair in pairs]
+        if universe is None:
+            universe = sorted({ticker for pair in pairs for ticker in pair})
+        prices = _load_price_matrix(universe, field, data_manager)
+        column = {ticker: index for index, ticker in enumerate(prices.columns)}
+        values = prices.to_numpy(dtype=np.float64)
+        left = np.array([column[pair[0]] for pair in pairs], dtype=np.int64)
+        right = np.array([column[pair[1]] for pair in pairs], dtype=np.int64)
+
+        ends = _window_ends(len(values), step)
+        results = {name: np.full((len(ends), len(pairs)), np.nan) for name in ROLLING_COLUMNS}
+        for start in range(0, len(pairs), chunk_size):
+            block = slice(start, start + chunk_size)
+            for name, block_values in _rolling_engle_granger_block(values[:, left[block]], values[:, right[block]],
+                                                                  ends, window, min_periods).items():
+                results[name][:, block] = block_values
+        index = prices.index[ends]
+        columns = pd.MultiIndex.from_tuples(pairs, names=['ticker1', 'ticker2'])
+        return {name: pd.DataFrame(values, index=index, columns=columns) for name, values in results.items()}
+
+def _load_price_matrix(universe, field, data_manager):
+    """Returns the (dates x tickers) price matrix of a universe, loading every ticker only once."""
+    if isinstance(universe, pd.DataFrame):
+        return universe
+    data_manager = data_manager or DataManager()
+    return data_manager.load_panel(universe, fields=(field,)).frame(field)
+
+
+def _masked_moments(series, center=True):
+    """
+    Returns the zero-filled (dates x tickers) series, its squares and validity mask, used by the pairwise
+    sums of `_block_correlation` and `_block_distance`. With `center`, each series is first centered on its
+    mean, which does not change the correlations and limits cancellation.
+    """
+    valid = np.isfinite(series)
+    if center:
+        with np.errstate(invalid='ignore'):
+            means = np.nanmean(np.where(valid, series, np.nan), axis=0)
+        series = series - np.nan_to_num(means)
+    filled = np.where(valid, series, 0.0)
+    return filled, filled * filled, valid.astype(np.float64)
+
+
+def _block_correlation(stats, rows):
+    """Pairwise complete Pearson correlations and counts of the `rows` series with every series."""
+    filled, squares, mask = stats
+    n = mask[:, rows].T @ mask
+    sx = filled[:, rows].T @ mask
+    sy = mask[:, rows].T @ filled
+    sxx = squares[:, rows].T @ mask
+    syy = mask[:, rows].T @ squares
+    sxy = filled[:, rows].T @ filled
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = sxy - sx * sy / n
+        variance = (sxx - sx * sx / n) * (syy - sy * sy / n)
+        return covariance / np.sqrt(variance), n
+
+
+def _block_distance(stats, rows, anchors):
+    """
+    Mean squared differences over the common dates, and counts, of the `rows` series with every series, each
+    series of a pair being divided by its value at the first common date. `anchors` holds the forward filled
+    series and the first valid row of every series.
+    """
+    filled, squares, mask = stats
+    forward_filled, first = anchors
+    start = np.maximum(first[rows][:, None], first[None, :])
+    scale_x = forward_filled[start, rows[:, None]]
+    scale_y = forward_filled[start, np.arange(len(first))[None, :]]
+    n = mask[:, rows].T @ mask
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = ((squares[:, rows].T @ mask) / (scale_x * scale_x) + (mask[:, rows].T @ squares) / (scale_y * scale_y)
+                 - 2.0 * (filled[:, rows].T @ filled) / (scale_x * scale_y))
+        return np.maximum(total, 0.0) / n, n
+
+
+def _pair_columns(prices, pairs):
+    """Returns the (pairs x 2) int64 array of the column indices of the pairs, given as indices or column names."""
+    pairs = list(pairs)
+    if isinstance(prices, pd.DataFrame) and pairs and not isinstance(pairs[0][0], (int, np.integer)):
+        column = {ticker: index for index, ticker in enumerate(prices.columns)}
+        pairs = [(column[ticker1], column[ticker2]) for ticker1, ticker2 in pairs]
+    return np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+
+
+def _engle_granger_block(values, valid, left, right):
+    """
+    Runs the Engle & Granger two-step test for a block of pairs with batched least squares.
+
+    `values` is the (dates x tickers) price matrix with zeros where `valid` is False. Series `left` are
+    regressed on series `right`. Returns an array with the columns c, gamma, alpha, adfstat and nobs.
+    """
+    weight = (valid[:, left] & valid[:, right]).astype(np.float64)
+    y = values[:, left] * weight
+    x = values[:, right] * weight
+    n = weight.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Long run: y = c + gamma * x + z, solved on demeaned data for numerical stability.
+        x_mean = x.sum(axis=0) / n
+        y_mean = y.sum(axis=0) / n
+        x_dev = (x - x_mean) * weight
+        y_dev = (y - y_mean) * weight
+        gamma = (x_dev * y_dev).sum(axis=0) / (x_dev * x_dev).sum(axis=0)
+        c = y_mean - gamma * x_mean
+        z = (y - c - gamma * x) * weight
+
+        # Short run: diff(y) = alpha * z(-1), without constant.
+        step = weight[1:] * weight[:-1]
+        z_lag = z[:-1] * step
+        alpha = ((y[1:] - y[:-1]) * step * z_lag).sum(axis=0) / (z_lag * z_lag).sum(axis=0)
+
+        # ADF on the residuals: diff(z) = beta * z(-1) + phi * diff(z)(-1) + const.
+        adf_weight = step[1:] * step[:-1]
+        dz = np.diff(z, axis=0)
+        target = dz[1:] * adf_weight
+        regressors = np.stack([z[1:-1] * adf_weight, dz[:-1] * adf_weight, adf_weight], axis=-1)
+        nobs = adf_weight.sum(axis=0)
+        xtx = np.einsum('tki,tkj->kij', regressors, regressors)
+        xty = np.einsum('tki,tk->ki', regressors, target)
+        solvable = (nobs > 3) & (np.abs(np.linalg.det(xtx)) > 0)
+        xtx[~solvable] = np.eye(3)
+        beta = np.linalg.solve(xtx, xty[..., None])[..., 0]
+        resid = target - np.einsum('tki,ki->tk', regressors, beta)
+        sigma2 = (resid * resid).sum(axis=0) / (nobs - 3)
+        adfstat = beta[:, 0] / np.sqrt(sigma2 * np.linalg.inv(xtx)[:, 0, 0])
+    adfstat[~solvable] = np.nan
+    return np.column_stack([c, gamma, alpha, adfstat, nobs])
+
+
+ROLLING_COLUMNS = ('c', 'gamma', 'alpha', 'adfstat', 'pvalue', 'nobs')
+
+
+def _mackinnonp_c(teststat):
+    """Vectorized `mackinnonp(teststat, regression='c', N=1)`, NaN where the statistic is NaN."""
+    from scipy.stats import norm
+    from statsmodels.tsa.adfvalues import tau_c_largep, tau_c_smallp, tau_max_c, tau_min_c, tau_star_c
+
+    teststat = np.asarray(teststat, dtype=np.float64)
+    small = np.polyval(tau_c_smallp[0][::-1], teststat)
+    large = np.polyval(tau_c_largep[0][::-1], teststat)
+    pvalue = norm.cdf(np.where(teststat <= tau_star_c[0], small, large))
+    pvalue = np.where(teststat > tau_max_c[0], 1.0, pvalue)
+    return np.where(teststat < tau_min_c[0], 0.0, pvalue)
+
+
+def _window_ends(length, step):
+    """Rows ending the windows: every `step` rows, counting back from the last one."""
+    return np.arange(length - 1, -1, -step)[::-1]
+
+
+def _rolling_engle_granger_block(y, x, ends, window, min_periods):
+    """
+    Runs the Engle & Granger two-step test of `engle_granger_two_step_cointegration_test` over many windows.
+
+    `y` and `x` are (dates x pairs) arrays, NaN where a series has no data. A window never spans a missing
+    value: it starts at the latest of `end - window + 1` and the first row of the run of valid rows ending
+    at `end`.
+
+    Every statistic of the test is a quadratic form of the basis (1, y, x, dy, dx, dy(-1), dx(-1)). The
+    running sums of the outer products of the basis are accumulated once, and the sums over a window are
+    the difference of two of them. The long-run fit gives c and gamma, which turn the window sums into
+    the sums of the residual regressions: the short run one for alpha and the ADF one.
+
+    Returns a dict of (ends x pairs) arrays for c, gamma, alpha, adfstat, pvalue and nobs.
+    """
+    length, n_pairs = y.shape
+    rows = np.arange(length)
+    valid = np.isfinite(y) & np.isfinite(x)
+    run_start = np.maximum.accumulate(np.where(valid, -1, rows[:, None]), axis=0) + 1
+
+    # Prices are centered on their mean to limit cancellation in the sums, c is corrected at the end.
+    with np.errstate(invalid='ignore'):
+        y_mean = np.nanmean(np.where(valid, y, np.nan), axis=0)
+        x_mean = np.nanmean(np.where(valid, x, np.nan), axis=0)
+    y_mean, x_mean = np.nan_to_num(y_mean), np.nan_to_num(x_mean)
+    yc = np.where(valid, y - y_mean, 0.0)
+    xc = np.where(valid, x - x_mean, 0.0)
+    step = np.zeros_like(valid)
+    step[1:] = valid[1:] & valid[:-1]
+    dy = np.zeros_like(yc)
+    dx = np.zeros_like(xc)
+    dy[1:] = np.where(step[1:], yc[1:] - yc[:-1], 0.0)
+    dx[1:] = np.where(step[1:], xc[1:] - xc[:-1], 0.0)
+    dy_lag = np.zeros_like(dy)
+    dx_lag = np.zeros_like(dx)
+    dy_lag[1:], dx_lag[1:] = dy[:-1], dx[:-1]
+    basis = np.stack([valid.astype(np.float64), yc, xc, dy, dx, dy_lag, dx_lag], axis=-1)
+    sums = np.zeros((length + 1, n_pairs, 7, 7))
+    np.cumsum(basis[..., :, None] * basis[..., None, :], axis=0, out=sums[1:])
+
+    columns = np.arange(n_pairs)
+    end = ends[:, None]
+    start = run_start[ends]
+    if window is not None:
+        start = np.maximum(start, end - window + 1)
+    n = (end - start + 1).astype(np.float64)
+    ok = valid[ends] & (n >= max(min_periods, 6))
+    # Sums over the rows of the long run (start..end), short run (start+1..) and ADF (start+2..) regressions.
+    last = sums[ends + 1]
+    long_run = last - sums[start, columns]
+    short_run = last - sums[np.minimum(start + 1, end + 1), columns]
+    adf = last - sums[np.minimum(start + 2, end + 1), columns]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sum_y, sum_x = long_run[..., 0, 1], long_run[..., 0, 2]
+        gamma = (long_run[..., 1, 2] - sum_x * sum_y / n) / (long_run[..., 2, 2] - sum_x * sum_x / n)
+        intercept = (sum_y - gamma * sum_x) / n
+
+        # Coefficients of the residual terms on the basis.
+        zeros, ones = np.zeros_like(gamma), np.ones_like(gamma)
+        z_lag = np.stack([-intercept, ones, -gamma, -ones, gamma, zeros, zeros], axis=-1)
+        dy = np.stack([zeros, zeros, zeros, ones, zeros, zeros, zeros], axis=-1)
+        dz = np.stack([zeros, zeros, zeros, ones, -gamma, zeros, zeros], axis=-1)
+        dz_lag = np.stack([zeros, zeros, zeros, zeros, zeros, ones, -gamma], axis=-1)
+        constant = np.stack([ones, zeros, zeros, zeros, zeros, zeros, zeros], axis=-1)
+
+        # Short run: diff(y) = alpha * z(-1), without constant.
+        alpha = (np.einsum('epi,epij,epj->ep', z_lag, short_run, dy)
+                 / np.einsum('epi,epij,epj->ep', z_lag, short_run, z_lag))
+
+        # ADF on the residuals: diff(z) = beta * z(-1) + phi * diff(z)(-1) + const.
+        regressors = np.stack([z_lag, dz_lag, constant], axis=-2)
+        xtx = np.einsum('epki,epij,eplj->epkl', regressors, adf, regressors)
+        xty = np.einsum('epki,epij,epj->epk', regressors, adf, dz)
+        yty = np.einsum('epi,epij,epj->ep', dz, adf, dz)
+        nobs = n - 2
+        solvable = ok & (np.abs(np.linalg.det(xtx)) > 0)
+        xtx[~solvable] = np.eye(3)
+        beta = np.linalg.solve(xtx, xty[..., None])[..., 0]
+        sigma2 = (yty - (beta * xty).sum(axis=-1)) / (nobs - 3)
+        adfstat = beta[..., 0] / np.sqrt(sigma2 * np.linalg.inv(xtx)[..., 0, 0])
+
+    c = intercept + y_mean - gamma * x_mean
+    results = dict(c=c, gamma=gamma, alpha=alpha, adfstat=adfstat, pvalue=_mackinnonp_c(adfstat), nobs=nobs)
+    for values in results.values():
+        values[~solvable] = np.nan
+    return results
@@ -0,0 +1,238 @@
+"""Array based backtest engine for `PairsTradingStrategy`.
+
+The indicators of the strategy (the 50 period SMAs and the rolling OLS z-score of
+`OLS_TransformationN`) are computed over whole arrays with NumPy. The position state is derived from
+the z-score with vectorized operations, and only the bars where the strategy sends orders are
+visited to simulate the broker. The simulation follows backtrader's default broker: market orders
+are checked against the cash at the creation close when they are submitted, and filled at the open
+of the next bar if the cash allows it. Positions, cash and portfolio value are then rebuilt for every
+bar with cumulative sums.
+
+The results match a `cerebro.run()` of `PairsTradingStrategy` on the same two feeds, see
+`tests/test_vectorized.py`. Like the strategy, the engine does not use the `stop_loss` parameter.
+"""
+import math
+import numbers
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.data_manager import DataManager
+
+# Period of the SMAs used by `PairsTradingStrategy` for position sizing.
+SMA_PERIOD = 50
+# `OLS_TransformationN` does not forward its period to `OLS_Slope_InterceptN`, so the hedge ratio
+# is always estimated over the default window of 10 bars. Only the z-score uses `period`.
+OLS_PERIOD = 10
+
+FILL_DTYPE = np.dtype([('bar', np.int64), ('leg', np.int8), ('size', np.int64), ('price', np.float64)])
+
+
+def strategy_params():
+    """
+    Returns the parameters of `PairsTradingStrategy` with their defaults, indicator classes included.
+
+    Read from the strategy, so that the engine accepts any new parameter of it. The strategy module
+    imports this one, hence the import on call.
+    """
+    from src.strategy import PairsTradingStrategy
+
+    return dict(PairsTradingStrategy.params._getitems())
+
+
+def pairs_params():
+    """
+    Returns the numeric parameters of `PairsTradingStrategy` with their defaults, the ones the engine uses.
+
+    The indicator classes (`transform`, `sma`) and the flags such as `printlog` are left out: the engine
+    has its own z-score and SMAs and prints nothing.
+    """
+    return {name: value for name, value in strategy_params().items()
+            if isinstance(value, numbers.Number) and not isinstance(value, bool)}
+
+
+def rolling_mean(values, period):
+    """Simple moving average, NaN for the first `period - 1` bars."""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        out[period - 1:] = sliding_window_view(values, period).sum(axis=1) / period
+    return out
+
+
+def rolling_ols_zscore(y, x, period, ols_period=OLS_PERIOD):
+    """
+    Computes the lines of `OLS_TransformationN(y, x, period)` over whole arrays.
+
+    For every bar, y is regressed on x (with a constant) over the last `ols_period` bars. The spread
+    uses the coefficients of its own bar, and the z-score compares it with the mean and the standard
+    deviation of the last `period` spreads, as backtrader does.
+
+    Parameters:
+    - y (np.ndarray): The close prices of data0.
+    - x (np.ndarray): The close prices of data1.
+    - period (int): The z-score window.
+    - ols_period (int): The regression window.
+
+    Returns:
+    - dict: The arrays 'slope', 'intercept', 'spread', 'spread_mean', 'spread_std' and 'zscore'.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    slope = np.full(len(y), np.nan)
+    intercept = np.full(len(y), np.nan)
+    if len(y) >= ols_period:
+        y_windows = sliding_window_view(y, ols_period)
+        x_windows = sliding_window_view(x, ols_period)
+        x_mean = x_windows.mean(axis=1)
+        y_mean = y_windows.mean(axis=1)
+        x_dev = x_windows - x_mean[:, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope[ols_period - 1:] = (x_dev * (y_windows - y_mean[:, None])).sum(axis=1) / (x_dev * x_dev).sum(axis=1)
+        intercept[ols_period - 1:] = y_mean - slope[ols_period - 1:] * x_mean
+    spread = y - (slope * x + intercept)
+    spread_mean = rolling_mean(spread, period)
+    # Same formula as bt.ind.StdDev: sqrt(mean(s^2) - mean(s)^2).
+    with np.errstate(invalid='ignore', divide='ignore'):
+        spread_std = np.sqrt(rolling_mean(spread * spread, period) - spread_mean ** 2)
+        zscore = (spread - spread_mean) / spread_std
+    return dict(slope=slope, intercept=intercept, spread=spread, spread_mean=spread_mean,
+                spread_std=spread_std, zscore=zscore)
+
+
+def _split(position, size):
+    """Splits an order into the part closing the position and the part opening a new one."""
+    if position * size < 0:
+        closed = math.copysign(min(abs(size), abs(position)), size)
+        return int(closed), size - int(closed)
+    return 0, size
+
+
+def backtest_pairs(open0, close0, open1, close1, cash=100_000.0, zscore=None, **params):
+    """
+    Backtests the `PairsTradingStrategy` logic on two aligned price series.
+
+    Parameters:
+    - open0, close0 (np.ndarray): Open and close prices of the first leg (data0).
+    - open1, close1 (np.ndarray): Open and close prices of the second leg (data1).
+    - cash (float): Starting cash of the broker.
+    - zscore (np.ndarray, optional): Precomputed z-score, e.g. shared across a parameter sweep.
+      Computed with `rolling_ols_zscore(close0, close1, period)` otherwise.
+    - params: Overrides of the strategy parameters, see `pairs_params`. Every other parameter of the
+      strategy is accepted so that strategy params can be passed as is, the z-score is always the one of
+      `OLS_TransformationN`, the SMAs simple moving averages of `SMA_PERIOD` bars and nothing is printed.
+
+    Returns:
+    - dict: Per bar arrays 'value', 'cash', 'position0', 'position1', 'zscore' and 'status',
+      the 'fills' as a structured array (bar, leg, size, price) and the 'final_value'.
+    """
+    unknown = set(params) - set(strategy_params())
+    if unknown:
+        raise ValueError(f'Unknown parameters: {", ".join(sorted(unknown))}.')
+    p = dict(pairs_params(), **params)
+    opens = (np.asarray(open0, dtype=np.float64), np.asarray(open1, dtype=np.float64))
+    closes = (np.asarray(close0, dtype=np.float64), np.asarray(close1, dtype=np.float64))
+    n = len(closes[0])
+    if zscore is None:
+        zscore = rolling_ols_zscore(closes[0], closes[1], p['period'])['zscore']
+    sma = (rolling_mean(closes[0], SMA_PERIOD), rolling_mean(closes[1], SMA_PERIOD))
+
+    # The strategy starts once every indicator has a value.
+    first = max(SMA_PERIOD - 1, OLS_PERIOD + p['period'] - 2)
+    active = np.arange(n) >= first
+    with np.errstate(invalid='ignore'):
+        above = active & (zscore > p['upper'])
+        below = active & (zscore < p['lower'])
+        band = active & (zscore < p['up_medium']) & (zscore > p['low_medium'])
+
+    # The status only changes on entries, so it is the last extreme signal carried forward.
+    signal = np.where(above, 1, np.where(below, 2, 0))
+    seen = np.maximum.accumulate(np.where(signal > 0, np.arange(n), -1))
+    status = np.where(seen >= 0, signal[np.maximum(seen, 0)], p['status'])
+    previous = np.concatenate(([p['status']], status[:-1]))
+    short_entry = above & (previous != 1)
+    long_entry = ~short_entry & below & (previous != 2)
+    closing = ~short_entry & ~long_entry & band
+
+    # Broker simulation, only on the bars where orders are sent.
+    fills = []
+    position = [0, 0]
+    broker_cash = float(cash)
+    qty1, qty2 = p['qty1'], p['qty2']
+    value1 = 0.6 * p['portfolio_value']
+    value2 = 0.4 * p['portfolio_value']
+    for bar in np.flatnonzero(short_entry | long_entry | closing):
+        if closing[bar]:
+            orders = [(leg, -position[leg]) for leg in (0, 1) if position[leg]]
+        else:
+            deviation1 = math.fabs((closes[0][bar] / sma[0][bar]) - 1)
+            deviation2 = math.fabs((closes[1][bar] / sma[1][bar]) - 1)
+            if deviation1 > deviation2:
+                x, y = int(value1 / closes[0][bar]), int(value2 / closes[1][bar])
+            else:
+                x, y = int(value2 / closes[0][bar]), int(value1 / closes[1][bar])
+            if short_entry[bar]:
+                orders = [(0, -(x + qty1)), (1, y + qty2)]
+            else:
+                orders = [(0, x + qty1), (1, -(y + qty2))]
+            qty1, qty2 = x, y
+        orders = [(leg, size) for leg, size in orders if size]
+        if not orders or bar + 1 >= n:
+            continue
+
+        # Submission check at the next bar, priced at the creation close.
+        check_cash = broker_cash
+        accepted = []
+        for leg, size in orders:
+            check_cash -= size * closes[leg][bar]
+            if check_cash >= 0.0:
+                accepted.append((leg, size))
+
+        # Execution at the open of the next bar. The opening part is dropped if cash is short.
+        for leg, size in accepted:
+            price = opens[leg][bar + 1]
+            closed, opened = _split(position[leg], size)
+            broker_cash -= closed * price
+            if opened and broker_cash - opened * price >= 0.0:
+                broker_cash -= opened * price
+            else:
+                opened = 0
+            if closed or opened:
+                position[leg] += closed + opened
+                fills.append((bar + 1, leg, closed + opened, price))
+
+    fills = np.array(fills, dtype=FILL_DTYPE)
+    flows = np.zeros((3, n))
+    np.add.at(flows[0], fills['bar'], -fills['size'] * fills['price'])
+    np.add.at(flows[1], fills['bar'][fills['leg'] == 0], fills['size'][fills['leg'] == 0])
+    np.add.at(flows[2], fills['bar'][fills['leg'] == 1], fills['size'][fills['leg'] == 1])
+    cash_line = cash + np.cumsum(flows[0])
+    position0 = np.cumsum(flows[1])
+    position1 = np.cumsum(flows[2])
+    value = cash_line + position0 * closes[0] + position1 * closes[1]
+    return dict(value=value, cash=cash_line, position0=position0, position1=position1, zscore=zscore,
+                status=status, fills=fills, final_value=value[-1] if n else float(cash))
+
+
+def backtest_pair(ticker1, ticker2, data_manager=None, cash=100_000.0, **params):
+    """
+    Backtests `PairsTradingStrategy` on two tickers over the dates both of them are listed.
+
+    Parameters:
+    - ticker1 (str): The first leg (data0).
+    - ticker2 (str): The second leg (data1).
+    - data_manager (DataManager, optional): The data manager used to load the tickers.
+    - cash (float): Starting cash of the broker.
+    - params: Overrides of the strategy parameters, see `backtest_pairs`.
+
+    Returns:
+    - dict: The output of `backtest_pairs`, plus the 'dates' of the bars.
+    """
+    data_manager = data_manager or DataManager()
+    panel = data_manager.load_panel([ticker1, ticker2], fields=('open', 'close'))
+    rows = panel.common_rows()
+    opens = panel.field('open')[rows]
+    closes = panel.field('close')[rows]
+    result = backtest_pairs(opens[:, 0], closes[:, 0], opens[:, 1], closes[:, 1], cash=cash, **params)
+    result['dates'] = panel.dates[rows]
+    return result
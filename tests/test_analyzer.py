@@ -0,0 +1,70 @@
+import contextlib
+import io
+import unittest
+
+import backtrader as bt
+import numpy as np
+
+from src.analyzer import METRICS, AnalyzerSuite, compute_metrics
+from src.data_manager import DataManager
+from src.strategy import SimpleMovingAverage, SimpleRSI
+
+
+class TestRecorder(unittest.TestCase):
+    def _run(self, preload=True, metrics=None, optimize=False):
+        cerebro = bt.Cerebro(stdstats=False, preload=preload, maxcpus=1)
+        cerebro.adddata(bt.feeds.PandasData(dataname=DataManager().load_ticker_data('AAPL')))
+        if optimize:
+            cerebro.optstrategy(SimpleMovingAverage, fast=[5, 10])
+        else:
+            cerebro.addstrategy(SimpleRSI)
+        cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
+        AnalyzerSuite.defineRecorder(cerebro, metrics=metrics)
+        with contextlib.redirect_stdout(io.StringIO()):
+            thestrats = cerebro.run()
+        return cerebro, thestrats
+
+    def test_matches_backtrader_analyzers(self):
+        for preload in (True, False):
+            with self.subTest(preload=preload):
+                cerebro, thestrats = self._run(preload=preload)
+                strategy = thestrats[0]
+                metrics = AnalyzerSuite.returnMetrics(thestrats)[0]
+                self.assertEqual(metrics['strategy'], 'SimpleRSI')
+                self.assertEqual(list(metrics)[1:], list(METRICS))
+                self.assertAlmostEqual(metrics['final_value'], cerebro.broker.getvalue())
+                self.assertAlmostEqual(metrics['max_drawdown'] * 100,
+                                       strategy.analyzers.drawdown.get_analysis()['max']['drawdown'])
+                trades = strategy.analyzers.trades.get_analysis()
+                self.assertEqual(metrics['trades'], trades['total']['closed'])
+                self.assertAlmostEqual(metrics['hit_rate'], trades['won']['total'] / trades['total']['closed'])
+                self.assertAlmostEqual(metrics['avg_trade'], trades['pnl']['net']['average'])
+                self.assertAlmostEqual(metrics['avg_bars'], trades['len']['average'])
+                self.assertEqual(strategy.analyzers.recorder.bars, len(strategy))
+
+    def test_selected_metrics(self):
+        _, thestrats = self._run(metrics=['sharpe', 'hit_rate'])
+        self.assertEqual(set(AnalyzerSuite.returnMetrics(thestrats)[0]), {'strategy', 'sharpe', 'hit_rate'})
+
+    def test_every_strategy_of_an_optimization(self):
+        _, thestrats = self._run(optimize=True, metrics=['final_value'])
+        self.assertEqual(len(AnalyzerSuite.returnMetrics(thestrats)), 2)
+
+    def test_compute_metrics(self):
+        values = np.array([100.0, 110.0, 99.0, 121.0, 120.0])
+        metrics = compute_metrics(values, pnl=np.array([10.0, -5.0, 15.0]), traded=np.array([0, 50, 0, 50, 0]),
+                                  annualization=4)
+        self.assertAlmostEqual(metrics['total_return'], 0.2)
+        self.assertAlmostEqual(metrics['cagr'], 1.2 ** (4 / 5) - 1)
+        self.assertAlmostEqual(metrics['max_drawdown'], 0.1)
+        self.assertEqual(metrics['max_drawdown_length'], 1)
+        self.assertAlmostEqual(metrics['hit_rate'], 2 / 3)
+        self.assertAlmostEqual(metrics['profit_factor'], 5.0)
+        self.assertAlmostEqual(metrics['turnover'], 100 / values.mean() / (5 / 4))
+        with self.assertRaises(ValueError):
+            compute_metrics(values, metrics=['alpha'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+from src.batch import expand_job, load_manifest, parse_params, read_pairs, run_jobs
+from src.data_manager import DataManager
+from src.indicators import RollingOLSTransformation
+from src.results_store import run_backtest
+from src.strategy import PairsPortfolioStrategy, PairsTradingStrategy, SimpleMovingAverage
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'backtest.py')
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.folder.name, name)
+        with open(path, 'w') as file:
+            file.write(text)
+        return path
+
+    def test_parse_params(self):
+        self.assertEqual(parse_params(['period=30', 'upper=2.5', 'transform=RollingOLSTransformation']),
+                         dict(period=30, upper=2.5, transform=RollingOLSTransformation))
+        with self.assertRaises(ValueError):
+            parse_params(['period'])
+
+    def test_read_pairs(self):
+        path = self.write('pairs.txt', '# pairs\nAAPL:MSFT\n\nNVDA, AMD\n')
+        self.assertEqual(read_pairs(path), [('AAPL', 'MSFT'), ('NVDA', 'AMD')])
+        path = self.write('scan.csv', 'ticker1,ticker2,pvalue\nAAPL,MSFT,0.01\n')
+        self.assertEqual(read_pairs(path), [('AAPL', 'MSFT')])
+
+    def test_manifest_defaults_and_pairs_file(self):
+        self.write('pairs.txt', 'AAPL:MSFT\nNVDA:AMD\n')
+        path = self.write('jobs.json', json.dumps(dict(
+            defaults=dict(start='2020-01-01', cash=50_000),
+            jobs=[dict(name='sma', strategy='SimpleMovingAverage', tickers=['AAPL'], params=dict(fast=10)),
+                  dict(pairs_file='pairs.txt', end='2022-12-31')])))
+        sma, pairs = [expand_job(job) for job in load_manifest(path)]
+        self.assertEqual(sma, [dict(strategy=SimpleMovingAverage, tickers=['AAPL'], params=dict(fast=10),
+                                    start='2020-01-01', end=None, cash=50_000.0, adjusted=False,
+                                    common_dates=True)])
+        self.assertEqual([backtest['tickers'] for backtest in pairs], [['AAPL', 'MSFT'], ['NVDA', 'AMD']])
+        self.assertTrue(all(backtest['strategy'] is PairsTradingStrategy and backtest['end'] == '2022-12-31'
+                            for backtest in pairs))
+
+    def test_portfolio_job_adds_each_ticker_once(self):
+        backtest, = expand_job(dict(pairs=['AAPL:MSFT', 'MSFT:NVDA'], portfolio=True))
+        self.assertIs(backtest['strategy'], PairsPortfolioStrategy)
+        self.assertEqual(backtest['tickers'], ['AAPL', 'MSFT', 'NVDA'])
+        self.assertEqual(backtest['params']['pairs'], [('AAPL', 'MSFT'), ('MSFT', 'NVDA')])
+        self.assertFalse(backtest['common_dates'])
+
+    def test_invalid_jobs(self):
+        for job in (dict(tickers=['AAPL'], strategy='Unknown'), dict(tickers=['AAPL'], pairs=['AAPL:MSFT']),
+                    dict(), dict(tickers=['AAPL'], period=10), dict(tickers=['AAPL'], portfolio=True)):
+            with self.subTest(job=job), self.assertRaises(ValueError):
+                expand_job(job)
+
+
+class TestRunJobs(unittest.TestCase):
+    def test_runs_match_single_backtests(self):
+        data = DataManager()
+        jobs = [dict(name='sma', strategy='SimpleMovingAverage', tickers=['MSFT'], params=dict(fast=10),
+                     start='2021-01-01'),
+                dict(name='pairs', pairs=[('AAPL', 'MSFT'), ('ABNB', 'MSFT')], end='2023-12-31'),
+                dict(name='broken', tickers=['AAPL'], params=dict(unknown=1))]
+        results = run_jobs(jobs, data_manager=data)
+        self.assertEqual(list(results['job']), ['sma', 'pairs', 'pairs', 'broken'])
+        self.assertEqual(list(results['tickers']), ['MSFT', 'AAPL,MSFT', 'ABNB,MSFT', 'AAPL'])
+        self.assertTrue(results['error'].iloc[:3].isna().all())
+        self.assertIn('unknown', results['error'].iloc[3])
+        single = run_backtest(PairsTradingStrategy, ['ABNB', 'MSFT'], data_manager=data, end='2023-12-31')
+        self.assertEqual(results['final_value'].iloc[2], single['metrics']['final_value'])
+        self.assertLessEqual(single['equity'].index[-1].strftime('%Y-%m-%d'), '2023-12-31')
+
+    def test_failing_pair_of_a_pool_job_only_fills_its_error(self):
+        jobs = [dict(name='pairs', pairs=[('AAPL', 'MSFT'), ('AAPL', 'NOPE')], end='2023-12-31')]
+        data = DataManager()
+        results = run_jobs(jobs, data_manager=data, workers=2)
+        self.assertEqual(list(results['tickers']), ['AAPL,MSFT', 'AAPL,NOPE'])
+        self.assertTrue(pd.isna(results['error'].iloc[0]))
+        self.assertIn('NOPE', results['error'].iloc[1])
+        single = run_backtest(PairsTradingStrategy, ['AAPL', 'MSFT'], data_manager=data, end='2023-12-31')
+        self.assertEqual(results['final_value'].iloc[0], single['metrics']['final_value'])
+
+    def test_events_are_recorded_per_job(self):
+        jobs = [dict(name='pairs', pairs=[('AAPL', 'MSFT'), ('ABNB', 'MSFT')], end='2023-12-31')]
+        with tempfile.TemporaryDirectory() as folder:
+            results = run_jobs(jobs, data_manager=DataManager(), events=folder)
+            self.assertTrue(results['error'].isna().all())
+            self.assertEqual(sorted(os.listdir(os.path.join(folder, 'pairs'))),
+                             ['AAPL-MSFT.parquet', 'ABNB-MSFT.parquet'])
+
+    def test_command_line(self):
+        output = subprocess.run(
+            [sys.executable, SCRIPT, '--strategy', 'SimpleMovingAverage', '--tickers', 'AAPL', '--param',
+             'fast=10', '--start', '2022-01-01', '--format', 'json'],
+            capture_output=True, text=True, check=True, cwd=tempfile.gettempdir()).stdout
+        run, = json.loads(output)
+        self.assertEqual(run['strategy'], 'SimpleMovingAverage')
+        self.assertEqual(json.loads(run['params']), dict(fast=10))
+        self.assertIsNone(run['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
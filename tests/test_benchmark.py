@@ -0,0 +1,50 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from benchmarks.suite import BENCHMARKS, compare, run_suite
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'benchmark.py')
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    def test_run_suite_reports_rates(self):
+        report = run_suite(['load_ticker_data', 'scan_pairs'], repeat=1)
+        self.assertEqual(set(report['results']), {'load_ticker_data', 'scan_pairs'})
+        result = report['results']['scan_pairs']
+        self.assertEqual(result['unit'], 'pairs')
+        self.assertAlmostEqual(result['rate'], result['units'] / result['seconds'])
+        self.assertIn('pandas', report['environment']['libraries'])
+
+    def test_timed_calls_do_not_print(self):
+        run, _ = BENCHMARKS['adf_test']['setup'](2)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run()
+        self.assertEqual(output.getvalue(), '')
+
+    def test_missing_baseline_fails_before_running(self):
+        with tempfile.TemporaryDirectory() as folder:
+            result = subprocess.run([sys.executable, SCRIPT, '--compare', os.path.join(folder, 'baseline.json')],
+                                    capture_output=True, text=True)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn('--save-baseline', result.stderr)
+
+    def test_compare_flags_regressions(self):
+        baseline = dict(results={name: dict(unit=entry['unit'], rate=100.0) for name, entry in BENCHMARKS.items()})
+        report = dict(results={'load_ticker_data': dict(unit='bars', rate=90.0),
+                               'scan_pairs': dict(unit='pairs', rate=50.0),
+                               'new_benchmark': dict(unit='bars', rate=1.0)})
+        comparison = compare(report, baseline, tolerance=0.2).set_index('benchmark')
+        self.assertEqual(list(comparison.index), ['load_ticker_data', 'scan_pairs'])
+        self.assertFalse(comparison.loc['load_ticker_data', 'regression'])
+        self.assertTrue(comparison.loc['scan_pairs', 'regression'])
+        self.assertAlmostEqual(comparison.loc['scan_pairs', 'ratio'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.data_manager import DataManager, default_data_folder
+from src.price_store import adjust_prices
+
+
+class TestPriceStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_folder = os.path.join(self.folder, 'raw')
+        os.makedirs(self.data_folder)
+        for ticker in ('AAPL', 'ABNB'):
+            shutil.copy(os.path.join(default_data_folder(), f'{ticker}.csv'), self.data_folder)
+        self.data = DataManager(data_folder=self.data_folder)
+        self.csv = DataManager(data_folder=self.data_folder, use_cache=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_store_matches_csv(self):
+        for ticker in ('AAPL', 'ABNB'):
+            pd.testing.assert_frame_equal(self.data.load_ticker_data(ticker), self.csv.load_ticker_data(ticker),
+                                          check_index_type=False)
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'cache', 'manifest.json')))
+
+    def test_columns_are_views_of_the_store(self):
+        store = self.data.price_store()
+        first = store.columns('AAPL')['close']
+        second = store.columns('AAPL')['close']
+        self.assertTrue(np.shares_memory(first, second))
+        self.assertFalse(first.flags.writeable)
+
+    def test_modified_csv_rebuilds_store(self):
+        self.data.load_ticker_data('AAPL')
+        path = os.path.join(self.data_folder, 'AAPL.csv')
+        frame = pd.read_csv(path).iloc[:10]
+        frame.to_csv(path, index=False)
+        self.assertEqual(len(self.data.load_ticker_data('AAPL')), 10)
+
+    def test_missing_ticker_raises(self):
+        with self.assertRaises(ValueError):
+            self.data.load_ticker_data('MISSING')
+
+
+class TestAdjustedPrices(unittest.TestCase):
+    def test_dividends_and_splits(self):
+        columns = dict(open=[100.0, 100.0, 50.0, 52.0], high=[101.0, 101.0, 51.0, 53.0], low=[99.0, 99.0, 49.0, 51.0],
+                       close=[100.0, 100.0, 50.0, 52.0], dividends=[0.0, 2.0, 0.0, 0.0],
+                       stock_splits=[0.0, 0.0, 2.0, 0.0])
+        adjusted = adjust_prices(columns)
+        np.testing.assert_allclose(adjusted['adj_factor'], [0.98 / 2, 0.5, 1.0, 1.0])
+        np.testing.assert_allclose(adjusted['adj_close'], [49.0, 50.0, 50.0, 52.0])
+        np.testing.assert_allclose(adjusted['adj_high'], np.array(columns['high']) * adjusted['adj_factor'])
+
+    def test_split_already_in_the_prices_is_not_applied_again(self):
+        columns = dict(open=[25.0, 25.5], high=[25.0, 25.5], low=[25.0, 25.5], close=[25.0, 25.5],
+                       dividends=[0.0, 0.0], stock_splits=[0.0, 4.0])
+        np.testing.assert_array_equal(adjust_prices(columns)['adj_factor'], [1.0, 1.0])
+
+    def test_store_holds_adjusted_prices(self):
+        data = DataManager()
+        frame = data.load_ticker_data('AAPL')
+        dividends = frame.index[frame['dividends'] > 0]
+        self.assertGreater(len(dividends), 0)
+        # The bundled prices are split adjusted: only the dividends change the factor.
+        self.assertEqual(frame['adj_factor'].iloc[-1], 1.0)
+        self.assertLess(frame['adj_factor'].iloc[0], 1.0)
+        self.assertEqual(len(np.unique(frame['adj_factor'])), len(dividends) + 1)
+        np.testing.assert_allclose(frame['adj_close'], frame['close'] * frame['adj_factor'])
+
+        arrays = data.feed_arrays('AAPL', adjusted=True)
+        np.testing.assert_array_equal(arrays['close'], frame['adj_close'])
+        np.testing.assert_array_equal(arrays['volume'], frame['volume'])
+        self.assertIs(data.feed_arrays('AAPL', adjusted=True), arrays)
+        np.testing.assert_array_equal(data.feed_arrays('AAPL')['close'], frame['close'])
+
+
+class TestLoadPanel(unittest.TestCase):
+    def setUp(self):
+        self.data = DataManager()
+
+    def test_panel_aligns_late_listings(self):
+        panel = self.data.load_panel(['AAPL', 'ABNB'], fields=('close', 'volume'))
+        close = panel.frame('close')
+        self.assertEqual(len(panel.dates), len(self.data.load_ticker_data('AAPL')))
+        self.assertEqual(panel.first_valid()['ABNB'], pd.Timestamp('2020-12-10'))
+        np.testing.assert_array_equal(close['ABNB'][panel.mask[:, 1]], self.data.load_ticker_data('ABNB')['close'])
+        self.assertTrue(close['ABNB'][~panel.mask[:, 1]].isnull().all())
+        self.assertEqual(panel.common_rows().sum(), panel.mask[:, 1].sum())
+
+    def test_panel_date_range_is_inclusive(self):
+        panel = self.data.load_panel(['NVDA'], start='2021-01-04', end='2021-01-08')
+        self.assertEqual(list(panel.dates.strftime('%Y-%m-%d')),
+                         ['2021-01-04', '2021-01-05', '2021-01-06', '2021-01-07', '2021-01-08'])
+
+    def test_panel_is_cached(self):
+        panel = self.data.load_panel(['AAPL', 'MSFT'])
+        self.assertIs(DataManager().load_panel(['AAPL', 'MSFT']), panel)
+        self.assertFalse(panel.values.flags.writeable)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from src.data_manager import DataManager, default_data_folder
+from src.downloader import DataProvider, Downloader, LocalCSVProvider, last_stored_date
+
+
+class RecordingProvider(LocalCSVProvider):
+    """Serves the bundled CSV files, records the requested ranges and fails the first calls."""
+
+    def __init__(self, folder, failures=0):
+        super().__init__(folder)
+        self.failures = failures
+        self.calls = []
+
+    def historical(self, ticker, start_date, end_date):
+        self.calls.append((ticker, start_date, end_date))
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('Too many requests')
+        return super().historical(ticker, start_date, end_date)
+
+
+class FailingProvider(DataProvider):
+    def historical(self, ticker, start_date, end_date):
+        raise ConnectionError('Provider unavailable')
+
+
+class NoCorporateActionsProvider(LocalCSVProvider):
+    def historical(self, ticker, start_date, end_date):
+        return super().historical(ticker, start_date, end_date).drop(columns=['dividends', 'stock_splits'])
+
+
+class TestDownloader(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_folder = os.path.join(self.folder, 'raw')
+        os.makedirs(self.data_folder)
+        # AAPL stops at the end of 2022, ABNB is missing.
+        frame = pd.read_csv(os.path.join(default_data_folder(), 'AAPL.csv'))
+        frame[frame['date'] < '2023-01-01'].to_csv(os.path.join(self.data_folder, 'AAPL.csv'), index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_incremental_update(self):
+        provider = RecordingProvider(default_data_folder())
+        downloader = Downloader(provider, data_folder=self.data_folder, workers=2, backoff=0)
+        summary = downloader.update(['AAPL', 'ABNB'], '2020-01-01', '2024-01-01').set_index('ticker')
+
+        self.assertEqual(sorted(provider.calls), [('AAPL', '2022-12-31', '2024-01-01'),
+                                                  ('ABNB', '2020-01-01', '2024-01-01')])
+        self.assertTrue(summary['error'].isnull().all())
+        local = DataManager(data_folder=self.data_folder, use_cache=False)
+        bundled = DataManager(use_cache=False)
+        for ticker in ('AAPL', 'ABNB'):
+            pd.testing.assert_frame_equal(local.load_ticker_data(ticker), bundled.load_ticker_data(ticker))
+            self.assertEqual(summary.loc[ticker, 'rows_added'],
+                             len(bundled.load_ticker_data(ticker).loc['2023':]) if ticker == 'AAPL'
+                             else len(bundled.load_ticker_data(ticker)))
+
+        # Nothing is missing any more, so a second refresh does not call the provider.
+        provider.calls.clear()
+        summary = downloader.update(['AAPL', 'ABNB'], '2020-01-01', '2023-12-30')
+        self.assertEqual(provider.calls, [])
+        self.assertEqual(summary['rows_added'].sum(), 0)
+        self.assertEqual(last_stored_date(os.path.join(self.data_folder, 'AAPL.csv')), pd.Timestamp('2023-12-29'))
+
+    def test_retries_failed_downloads(self):
+        provider = RecordingProvider(default_data_folder(), failures=2)
+        downloader = Downloader(provider, data_folder=self.data_folder, workers=1, retries=2, backoff=0)
+        self.assertGreater(downloader.update_ticker('AAPL', '2020-01-01', '2024-01-01'), 0)
+        self.assertEqual(len(provider.calls), 3)
+
+    def test_failed_download_keeps_file(self):
+        path = os.path.join(self.data_folder, 'AAPL.csv')
+        with open(path) as file:
+            content = file.read()
+        downloader = Downloader(FailingProvider(), data_folder=self.data_folder, retries=1, backoff=0)
+        summary = downloader.update(['AAPL'], '2020-01-01', '2024-01-01')
+        self.assertIn('Provider unavailable', summary.loc[0, 'error'])
+        with open(path) as file:
+            self.assertEqual(file.read(), content)
+        self.assertEqual(os.listdir(self.data_folder), ['AAPL.csv'])
+
+    def test_missing_corporate_actions_fail_the_ticker(self):
+        downloader = Downloader(NoCorporateActionsProvider(default_data_folder()), data_folder=self.data_folder,
+                                retries=0, backoff=0)
+        summary = downloader.update(['AAPL', 'ABNB'], '2020-01-01', '2024-01-01')
+        self.assertTrue(summary['error'].str.contains('dividends and stock_splits').all())
+        self.assertEqual(last_stored_date(os.path.join(self.data_folder, 'AAPL.csv')), pd.Timestamp('2022-12-30'))
+        self.assertEqual(os.listdir(self.data_folder), ['AAPL.csv'])
+
+
+if __name__ == '__main__':
+    unittest.main()
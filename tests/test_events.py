@@ -0,0 +1,103 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import backtrader as bt
+import numpy as np
+
+from src.analyzer import AnalyzerSuite
+from src.data_manager import DataManager
+from src.events import EVENT_DTYPE, ORDER, TRADE, EventLog, EventRecorder
+from src.indicators import RollingOLSTransformation
+from src.strategy import PairsTradingStrategy, SimpleRSI
+
+
+def sample_events(count):
+    events = np.zeros(count, dtype=EVENT_DTYPE)
+    events['date'] = 738000.0 + np.arange(count)
+    events['data'] = np.arange(count) % 3
+    events['kind'] = np.arange(count) % 2
+    events['side'] = np.where(np.arange(count) % 4 < 2, 1, -1)
+    events['size'] = np.arange(count) * 10.0
+    events['price'] = 100.0 + np.arange(count)
+    events['pnl'] = np.arange(count) - 5.0
+    return events
+
+
+class TestEventLog(unittest.TestCase):
+    def test_spills_full_chunks(self):
+        expected = sample_events(11)
+        with tempfile.TemporaryDirectory() as folder:
+            for name in ('events.bin', 'events.parquet'):
+                with self.subTest(file=name):
+                    log = EventLog(chunk_size=4, path=os.path.join(folder, name))
+                    for event in expected:
+                        log.append(*event.item())
+                    self.assertEqual((log.spilled, len(log)), (8, 11))
+                    self.assertEqual(len(log._buffer), 4)
+                    np.testing.assert_array_equal(log.events(), expected)
+                    log.close()
+                    np.testing.assert_array_equal(log.events(), expected)
+
+    def test_grows_without_file(self):
+        expected = sample_events(10)
+        log = EventLog(chunk_size=4)
+        for event in expected:
+            log.append(*event.item())
+        np.testing.assert_array_equal(log.events(), expected)
+        frame = log.to_frame(names=['A', 'B', 'C'])
+        self.assertEqual(list(frame['ticker'][:4]), ['A', 'B', 'C', 'A'])
+        self.assertEqual(list(frame['kind'][:2]), ['order', 'trade'])
+
+
+class TestEventRecorder(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = DataManager()
+
+    def run_strategy(self, tickers, strategy, **kwargs):
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.broker.setcash(1e9)
+        for ticker in tickers:
+            cerebro.adddata(self.data.feed(ticker), name=ticker)
+        cerebro.addstrategy(strategy, **kwargs)
+        cerebro.addanalyzer(EventRecorder, _name='events', chunk_size=16)
+        AnalyzerSuite.defineRecorder(cerebro, metrics=['trades'])
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            thestrat = cerebro.run()[0]
+        return thestrat, output.getvalue()
+
+    def test_records_orders_and_trades(self):
+        thestrat, _ = self.run_strategy(['AAPL', 'MSFT'], PairsTradingStrategy, transform=RollingOLSTransformation)
+        events = thestrat.analyzers.events.get_analysis()
+        orders = events[events['kind'] == 'order']
+        trades = events[(events['kind'] == 'trade') & (events['status'] == bt.Trade.Closed)]
+        self.assertGreater(len(orders), 10)
+        self.assertEqual(set(events['ticker']), {'AAPL', 'MSFT'})
+        self.assertTrue((np.sign(orders['size']) == orders['side']).all())
+        recorder = thestrat.analyzers.recorder
+        np.testing.assert_allclose(trades['pnl'], recorder.pnl)
+        # The finished orders and closed trades are not kept by the strategy and the broker.
+        self.assertEqual(len(thestrat._orders), 0)
+        self.assertTrue(all(order.alive() for order in thestrat.broker.orders))
+        self.assertTrue(all(len(history) <= 1 for trades in thestrat._trades.values()
+                            for history in trades.values()))
+
+    def test_printing_is_off_by_default(self):
+        for tickers, strategy, kwargs in ((['AAPL'], SimpleRSI, {}),
+                                          (['AAPL', 'MSFT'], PairsTradingStrategy,
+                                           dict(transform=RollingOLSTransformation))):
+            _, output = self.run_strategy(tickers, strategy, **kwargs)
+            self.assertEqual(output, '')
+        thestrat, output = self.run_strategy(['AAPL'], SimpleRSI, printlog=True)
+        self.assertIn('BUY EXECUTED', output)
+        self.assertIn('Ending Value', output)
+        self.assertIn(ORDER, thestrat.analyzers.events.events.events()['kind'])
+        self.assertIn(TRADE, thestrat.analyzers.events.events.events()['kind'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import contextlib
+import datetime
+import io
+import unittest
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from src.analyzer import AnalyzerSuite
+from src.data_manager import DataManager
+from src.feeds import ArrayData, date2num
+from src.strategy import PairsTradingStrategy, SimpleRSI
+
+
+class TestArrayData(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = DataManager()
+
+    def run_metrics(self, feeds, strategy, **kwargs):
+        cerebro = bt.Cerebro(stdstats=False, **kwargs)
+        for name, feed in feeds:
+            cerebro.adddata(feed, name=name)
+        cerebro.addstrategy(strategy)
+        AnalyzerSuite.defineRecorder(cerebro)
+        with contextlib.redirect_stdout(io.StringIO()):
+            thestrats = cerebro.run()
+        return AnalyzerSuite.returnMetrics(thestrats)[0]
+
+    def test_date2num_matches_backtrader(self):
+        dates = pd.DatetimeIndex(['1999-12-31', '2020-02-29', '2023-06-30 15:59:59.999989', '2024-01-02 09:30'])
+        np.testing.assert_array_equal(date2num(dates), [bt.date2num(date.to_pydatetime()) for date in dates])
+
+    def test_matches_pandas_feed(self):
+        frame = self.data.load_ticker_data('AAPL')
+        for kwargs in (dict(), dict(preload=False, runonce=False)):
+            with self.subTest(**kwargs):
+                expected = self.run_metrics([('AAPL', bt.feeds.PandasData(dataname=frame))], SimpleRSI, **kwargs)
+                self.assertEqual(self.run_metrics([('AAPL', self.data.feed('AAPL'))], SimpleRSI, **kwargs), expected)
+                self.assertEqual(self.run_metrics([('AAPL', ArrayData.from_frame(frame))], SimpleRSI, **kwargs),
+                                 expected)
+
+    def test_cerebro_add_data_maps_columns_by_name(self):
+        cerebro = bt.Cerebro(stdstats=False)
+        self.data.cerebro_add_data(['AAPL', 'MSFT'], cerebro, start='2022-01-01', end='2022-12-31')
+        self.assertEqual([data._name for data in cerebro.datas], ['AAPL', 'MSFT'])
+        feed = cerebro.datas[0]
+        feed._start()
+        feed.preload()
+        frame = pd.read_csv(f'{self.data.data_folder}/AAPL.csv', parse_dates=['date'], index_col='date')
+        frame = frame.loc['2022-01-01':'2022-12-31']
+        self.assertEqual(feed.buflen(), len(frame))
+        for name in ('open', 'high', 'low', 'close', 'volume'):
+            np.testing.assert_array_equal(np.asarray(getattr(feed.lines, name).array), frame[name].to_numpy())
+        self.assertEqual(bt.num2date(feed.lines.datetime.array[0]), datetime.datetime(2022, 1, 3))
+
+    def test_feeds_share_the_cached_arrays(self):
+        arrays = self.data.feed_arrays('MSFT')
+        self.assertIs(DataManager().feed_arrays('MSFT'), arrays)
+        self.assertFalse(arrays['close'].flags.writeable)
+        feed = self.data.feed('MSFT', start='2021-01-01')
+        self.assertTrue(np.shares_memory(feed.p.dataname['close'], arrays['close']))
+
+    def test_fromdate_and_late_listing(self):
+        metrics = self.run_metrics([('ABNB', self.data.feed('ABNB')), ('MSFT', self.data.feed('MSFT'))],
+                                   PairsTradingStrategy)
+        frames = [self.data.load_ticker_data(ticker) for ticker in ('ABNB', 'MSFT')]
+        expected = self.run_metrics([(ticker, bt.feeds.PandasData(dataname=frame))
+                                     for ticker, frame in zip(('ABNB', 'MSFT'), frames)], PairsTradingStrategy)
+        self.assertEqual(metrics, expected)
+        fromdate = datetime.datetime(2023, 1, 1)
+        feed = ArrayData(dataname=self.data.feed_arrays('MSFT'), fromdate=fromdate)
+        cerebro = bt.Cerebro()
+        cerebro.adddata(feed)
+        feed._start()
+        feed.preload()
+        self.assertEqual(bt.num2date(feed.lines.datetime.array[0]), datetime.datetime(2023, 1, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import contextlib
+import io
+import tempfile
+import unittest
+
+import backtrader as bt
+import backtrader.indicators as btind
+import numpy as np
+import pandas as pd
+
+from src.analyzer import AnalyzerSuite
+from src.data_manager import DataManager
+from src.indicator_cache import IndicatorCache
+from src.indicators import CachedCrossOver, CachedOLSTransformation, CachedRSI, CachedSMA, RollingOLSTransformation
+from src.strategy import PairsTradingStrategy, SimpleMovingAverage, SimpleRSI
+
+
+class ZScoreStrategy(bt.Strategy):
+    params = dict(transform=btind.OLS_TransformationN, period=20, reanchor=None)
+
+    def __init__(self):
+        kwargs = dict(reanchor=self.p.reanchor) if self.p.reanchor else {}
+        self.transform = self.p.transform(self.data0, self.data1, period=self.p.period, **kwargs)
+
+
+class TestRollingOLSTransformation(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.panel = DataManager().load_panel(['AAPL', 'MSFT'], fields=('open', 'high', 'low', 'close', 'volume'))
+        cls.expected = cls.zscore(btind.OLS_TransformationN, runonce=True)
+
+    @classmethod
+    def zscore(cls, transform, runonce, **params):
+        cerebro = bt.Cerebro(stdstats=False, runonce=runonce)
+        for column in range(2):
+            frame = pd.DataFrame(cls.panel.values[:, :, column].T, index=cls.panel.dates, columns=list(cls.panel.fields))
+            cerebro.adddata(bt.feeds.PandasData(dataname=frame))
+        cerebro.addstrategy(ZScoreStrategy, transform=transform, **params)
+        thestrat = cerebro.run()[0]
+        return np.array(thestrat.transform.zscore.array)
+
+    def test_next_mode_matches_ols_transformation(self):
+        zscore = self.zscore(RollingOLSTransformation, runonce=False, reanchor=50)
+        np.testing.assert_array_equal(np.isnan(zscore), np.isnan(self.expected))
+        np.testing.assert_allclose(zscore, self.expected, atol=1e-9)
+
+    def test_once_mode_matches_ols_transformation(self):
+        zscore = self.zscore(RollingOLSTransformation, runonce=True)
+        np.testing.assert_allclose(zscore, self.expected, atol=1e-9)
+
+
+class BothIndicators(bt.Strategy):
+    params = dict(cache=None)
+
+    def __init__(self):
+        cache = self.p.cache
+        self.lines_pairs = dict(
+            sma=(btind.SMA(self.data0, period=50), CachedSMA(self.data0, period=50, cache=cache)),
+            rsi=(btind.RSI(self.data0), CachedRSI(self.data0, cache=cache)),
+            crossover=(btind.CrossOver(btind.SMA(period=5), btind.SMA(period=30)),
+                       CachedCrossOver(CachedSMA(period=5, cache=cache), CachedSMA(period=30, cache=cache),
+                                       cache=cache)),
+            zscore=(RollingOLSTransformation(self.data0, self.data1, period=20).zscore,
+                    CachedOLSTransformation(self.data0, self.data1, period=20, cache=cache).zscore),
+        )
+
+
+class TestCachedIndicators(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = DataManager()
+
+    def run_strategy(self, strategy, tickers=('AAPL', 'MSFT'), **kwargs):
+        options = {key: kwargs.pop(key) for key in ('preload', 'runonce') if key in kwargs}
+        cerebro = bt.Cerebro(stdstats=False, **options)
+        for ticker in tickers:
+            cerebro.adddata(self.data.feed(ticker), name=ticker)
+        cerebro.addstrategy(strategy, **kwargs)
+        AnalyzerSuite.defineRecorder(cerebro)
+        with contextlib.redirect_stdout(io.StringIO()):
+            thestrats = cerebro.run()
+        return thestrats[0], AnalyzerSuite.returnMetrics(thestrats)[0]
+
+    def test_lines_match_backtrader(self):
+        for runonce in (True, False):
+            thestrat, _ = self.run_strategy(BothIndicators, runonce=runonce, cache=IndicatorCache())
+            for name, (expected, cached) in thestrat.lines_pairs.items():
+                with self.subTest(name=name, runonce=runonce):
+                    expected, cached = np.array(expected.array), np.array(cached.array)
+                    np.testing.assert_array_equal(np.isnan(cached), np.isnan(expected))
+                    np.testing.assert_allclose(cached, expected, atol=1e-9)
+
+    def test_strategies_match_backtrader_indicators(self):
+        cases = [
+            (SimpleRSI, ('AAPL',), dict(), dict(_rsi=CachedRSI)),
+            (SimpleMovingAverage, ('MSFT',), dict(), dict(_movav=CachedSMA, _crossover=CachedCrossOver)),
+            (PairsTradingStrategy, ('AAPL', 'MSFT'), dict(transform=RollingOLSTransformation),
+             dict(sma=CachedSMA, transform=CachedOLSTransformation)),
+            # ABNB is listed after MSFT, the feeds have different lengths.
+            (PairsTradingStrategy, ('ABNB', 'MSFT'), dict(transform=RollingOLSTransformation, runonce=False),
+             dict(sma=CachedSMA, transform=CachedOLSTransformation)),
+        ]
+        for strategy, tickers, params, cached in cases:
+            with self.subTest(strategy=strategy.__name__, tickers=tickers):
+                _, expected = self.run_strategy(strategy, tickers, **params)
+                _, metrics = self.run_strategy(strategy, tickers, **cached)
+                self.assertEqual(metrics, expected)
+                self.assertGreater(metrics['trades'], 0)
+
+    def test_results_are_shared_across_runs_and_processes(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = IndicatorCache(folder=folder)
+            self.run_strategy(BothIndicators, cache=cache)
+            misses = cache.misses
+            self.assertEqual(misses, 6)
+            self.run_strategy(BothIndicators, cache=cache)
+            self.assertEqual((cache.misses, cache.hits), (misses, misses))
+            # A new process has an empty memory tier and reads the folder.
+            cold = IndicatorCache(folder=folder)
+            thestrat, _ = self.run_strategy(BothIndicators, cache=cold)
+            self.assertEqual((cold.misses, cold.disk_hits), (0, misses))
+            expected, cached = thestrat.lines_pairs['rsi']
+            np.testing.assert_allclose(np.array(cached.array), np.array(expected.array), atol=1e-9)
+
+    def test_lru_eviction(self):
+        cache = IndicatorCache(maxsize=2)
+        values = np.arange(100, dtype=np.float64)
+        for period in (5, 10, 20):
+            lines = cache.get('sma', [values], period=period)
+        self.assertEqual(len(cache), 2)
+        self.assertFalse(lines['sma'].flags.writeable)
+        cache.get('sma', [values], period=5)
+        self.assertEqual((cache.hits, cache.misses), (0, 4))
+
+    def test_needs_preloaded_data(self):
+        with self.assertRaises(RuntimeError):
+            self.run_strategy(SimpleRSI, ('AAPL',), preload=False, runonce=False, _rsi=CachedRSI)
+
+
+if __name__ == '__main__':
+    unittest.main()
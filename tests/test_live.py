@@ -0,0 +1,119 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import backtrader as bt
+import numpy as np
+
+from src.data_manager import DataManager
+from src.indicators import RollingOLSTransformation
+from src.live import PairsSignalEngine, replay
+from src.strategy import PairsTradingStrategy
+
+
+class OrderRecorder(PairsTradingStrategy):
+    def start(self):
+        self.orders = []
+
+    def notify_order(self, order):
+        if order.status == order.Submitted:
+            self.orders.append((bt.num2date(order.created.dt).date(), order.data._name, int(order.size)))
+        super(OrderRecorder, self).notify_order(order)
+
+
+def signal_orders(signals_by_date):
+    orders = []
+    for date, signals in signals_by_date:
+        for signal in signals:
+            for ticker, size in ((signal['ticker1'], signal['size1']), (signal['ticker2'], signal['size2'])):
+                if size:
+                    orders.append((date.date(), ticker, size))
+    return orders
+
+
+class TestPairsSignalEngine(unittest.TestCase):
+    pairs = [('AAPL', 'MSFT'), ('PEP', 'MDLZ')]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = DataManager()
+
+    def test_replay_matches_strategy_orders(self):
+        signals = list(replay(PairsSignalEngine(self.pairs), self.data))
+        for pair in self.pairs:
+            with self.subTest(pair=pair):
+                cerebro = bt.Cerebro(stdstats=False)
+                # Enough cash for the broker to fill every order, as the engine assumes.
+                cerebro.broker.setcash(1e9)
+                for ticker in pair:
+                    cerebro.adddata(self.data.feed(ticker), name=ticker)
+                cerebro.addstrategy(OrderRecorder, transform=RollingOLSTransformation)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    expected = cerebro.run()[0].orders
+                orders = [order for order in signal_orders(signals) if order[1] in pair]
+                self.assertGreater(len(expected), 10)
+                self.assertEqual(sorted(orders), sorted(expected))
+
+    def test_checkpoint_restores_the_state(self):
+        expected_engine = PairsSignalEngine(self.pairs, portfolio_value=[100000, 50000])
+        expected = list(replay(expected_engine, self.data))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'engine.npz')
+            engine = PairsSignalEngine(self.pairs, portfolio_value=[100000, 50000])
+            signals = list(replay(engine, self.data, end='2022-06-30'))
+            engine.save(path)
+            restored = PairsSignalEngine.load(path)
+            # The bars already seen are sent again after the restart, and ignored.
+            signals += [(date, found) for date, found in replay(restored, self.data) if date > engine.last_date]
+            self.assertEqual(list(replay(restored, self.data, end='2022-06-30'))[-1][1], [])
+        self.assertEqual(signal_orders(signals), signal_orders(expected))
+        np.testing.assert_array_equal(restored.zscore, expected_engine.zscore)
+        np.testing.assert_array_equal(restored.holdings, expected_engine.holdings)
+
+    def test_holdings_from_recorded_fills(self):
+        engine = PairsSignalEngine(self.pairs[:1], assume_fills=False)
+        entries = closes = 0
+        for date, signals in replay(engine, self.data):
+            for signal in signals:
+                if signal['action'] == 'close':
+                    closes += 1
+                    self.assertEqual((signal['size1'], signal['size2']), tuple(-engine.holdings[0]))
+                else:
+                    entries += 1
+                # Only the first leg is filled.
+                engine.record_fill(signal['pair'], signal['size1'], 0)
+        self.assertGreater(entries, 0)
+        self.assertGreater(closes, 0)
+        self.assertEqual(engine.holdings[0, 1], 0)
+
+    def test_gap_in_the_feed_only_skips_its_bar(self):
+        panel = self.data.load_panel(list(self.pairs[0]))
+        closes = panel.field('close').copy()
+        closes[300, 1] = np.nan
+        expected_engine, engine = PairsSignalEngine(self.pairs[:1]), PairsSignalEngine(self.pairs[:1])
+        for bar, (date, row) in enumerate(zip(panel.dates, closes)):
+            expected = expected_engine.update(date, panel.field('close')[bar])
+            signals = engine.update(date, row)
+            if bar == 300:
+                self.assertEqual(signals, [])
+                self.assertTrue(np.isfinite(engine.zscore).all())
+            elif bar > 300 + expected_engine.window:
+                # The carried close has left the windows of the SMAs and of the regression.
+                self.assertEqual(signals, expected)
+        self.assertTrue(np.isfinite(engine.zscore).all())
+
+    def test_rejects_bad_input(self):
+        with self.assertRaises(ValueError):
+            PairsSignalEngine([])
+        with self.assertRaises(ValueError):
+            PairsSignalEngine(self.pairs, stake=10)
+        engine = PairsSignalEngine(self.pairs)
+        with self.assertRaises(ValueError):
+            engine.update('2024-01-02', [1.0, 2.0])
+        self.assertEqual(engine.update('2024-01-02', dict(AAPL=180.0, MSFT=370.0)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
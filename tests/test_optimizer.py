@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import backtrader as bt
+import pandas as pd
+
+from src.events import TRADE
+from src.optimizer import ParameterSweep, grid, random_points
+from src.strategy import SimpleMovingAverage
+
+
+class TestParameterSweep(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_grid_and_random_points(self):
+        self.assertEqual(len(grid(fast=[5, 10], slow=[20, 30, 40])), 6)
+        points = random_points(5, seed=3, fast=(2, 10), slow=[30, 40])
+        self.assertEqual(points, random_points(5, seed=3, fast=(2, 10), slow=[30, 40]))
+        self.assertTrue(all(2 <= point['fast'] <= 10 for point in points))
+
+    def test_results_are_memoized(self):
+        points = grid(fast=[5, 10], slow=[30])
+        sweep = ParameterSweep(SimpleMovingAverage, ['AAPL'], cache_folder=self.folder)
+        results = sweep.run(points, workers=1)
+        self.assertEqual(list(results['fast']), [5, 10])
+        self.assertIn('final_value', results)
+
+        path = os.path.join(self.folder, 'results.jsonl')
+        with open(path) as file:
+            self.assertEqual(len(file.readlines()), 2)
+        again = ParameterSweep(SimpleMovingAverage, ['AAPL'], cache_folder=self.folder).run(points + grid(fast=[7], slow=[30]))
+        with open(path) as file:
+            self.assertEqual(len(file.readlines()), 3)
+        self.assertEqual(list(again['final_value'][:2]), list(results['final_value']))
+
+    def test_events_are_recorded_for_every_point(self):
+        points = grid(fast=[5, 10], slow=[30])
+        ParameterSweep(SimpleMovingAverage, ['AAPL'], cache_folder=self.folder).run(points, workers=1)
+        events = os.path.join(self.folder, 'events')
+        sweep = ParameterSweep(SimpleMovingAverage, ['AAPL'], cache_folder=self.folder, events=events)
+        results = sweep.run(points, workers=1)
+        self.assertEqual(len(set(results['events'])), 2)
+        for path, trades in zip(results['events'], results['trades']):
+            log = pd.read_parquet(path)
+            self.assertEqual(((log['kind'] == TRADE) & (log['status'] == bt.Trade.Closed)).sum(), trades)
+
+
+if __name__ == '__main__':
+    unittest.main()
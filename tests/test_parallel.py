@@ -0,0 +1,93 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from src.analyzer import AnalyzerSuite
+from src.data_manager import DataManager
+from src.events import TRADE
+from src.indicators import RollingOLSTransformation
+from src.parallel import SharedPriceMatrix, run_pair_backtests, run_pair_tests
+from src.strategy import PairsTradingStrategy
+from src.utils import TimeSeriesAnalysis
+
+
+class TestParallel(unittest.TestCase):
+    pairs = [('AAPL', 'MSFT'), ('ABNB', 'NVDA'), ('GOOG', 'GOOGL')]
+
+    def test_shared_matrix_holds_prices(self):
+        data = DataManager()
+        with SharedPriceMatrix.from_tickers(['AAPL', 'ABNB'], data) as matrix:
+            close = matrix.values[matrix.fields.index('close')]
+            np.testing.assert_array_equal(close[:, 0], data.load_ticker_data('AAPL')['close'].to_numpy())
+            self.assertTrue(np.isnan(close[0, 1]))
+            self.assertEqual(np.isfinite(close[:, 1]).sum(), len(data.load_ticker_data('ABNB')))
+
+    def test_pool_results_match_serial_run(self):
+        serial = run_pair_tests(self.pairs, workers=1)
+        pooled = run_pair_tests(self.pairs, workers=2, chunk_size=1)
+        self.assertEqual(list(pooled['ticker1']), [pair[0] for pair in self.pairs])
+        np.testing.assert_allclose(pooled[['adfstat', 'pvalue', 'nobs']], serial[['adfstat', 'pvalue', 'nobs']])
+
+    def test_one_matrix_serves_tests_and_backtests(self):
+        expected = run_pair_tests(self.pairs, workers=1)
+        tickers = sorted({ticker for pair in self.pairs for ticker in pair})
+        for adjusted in (False, True):
+            with self.subTest(adjusted=adjusted), SharedPriceMatrix.from_tickers(tickers, adjusted=adjusted) as matrix:
+                tests = run_pair_tests(self.pairs, matrix=matrix, workers=1)
+                np.testing.assert_allclose(tests[['adfstat', 'pvalue']], expected[['adfstat', 'pvalue']])
+                params = dict(transform=RollingOLSTransformation)
+                backtests = run_pair_backtests(self.pairs[:1], params=params, matrix=matrix, workers=1, quiet=True)
+                loaded = run_pair_backtests(self.pairs[:1], params=params, workers=1, quiet=True, adjusted=adjusted)
+                self.assertEqual(backtests['final_value'].iloc[0], loaded['final_value'].iloc[0])
+        with SharedPriceMatrix.from_tickers(tickers, fields=('close',)) as matrix:
+            with self.assertRaisesRegex(ValueError, 'adj_close'):
+                run_pair_tests(self.pairs, matrix=matrix, workers=1)
+
+    def test_pair_tests_agree_with_scan_pairs(self):
+        pooled = run_pair_tests(self.pairs, workers=1)
+        scan = TimeSeriesAnalysis.scan_pairs(pairs=self.pairs).set_index(['ticker1', 'ticker2'])
+        scan = scan.loc[[tuple(pair) for pair in self.pairs]]
+        np.testing.assert_allclose(pooled[['adfstat', 'pvalue']], scan[['adfstat', 'pvalue']], rtol=1e-6)
+
+    def test_pool_backtests_match_serial_cerebro(self):
+        pairs = [('AAPL', 'MSFT'), ('PEP', 'MDLZ')]
+        params = dict(transform=RollingOLSTransformation)
+        data = DataManager()
+        for adjusted in (False, True):
+            pooled = run_pair_backtests(pairs, params=params, workers=2, chunk_size=1, quiet=True, adjusted=adjusted)
+            self.check_serial(pooled, pairs, params, data, adjusted)
+
+    def test_pool_backtests_record_events(self):
+        pairs = [('AAPL', 'MSFT'), ('PEP', 'MDLZ')]
+        with tempfile.TemporaryDirectory() as folder:
+            pooled = run_pair_backtests(pairs, workers=2, chunk_size=1, quiet=True, events=folder)
+            self.assertEqual(sorted(os.listdir(folder)), ['AAPL-MSFT.parquet', 'PEP-MDLZ.parquet'])
+            for row, pair in zip(pooled.itertuples(), pairs):
+                log = pd.read_parquet(os.path.join(folder, '-'.join(pair) + '.parquet'))
+                self.assertEqual(((log['kind'] == TRADE) & (log['status'] == bt.Trade.Closed)).sum(), row.trades)
+
+    def check_serial(self, pooled, pairs, params, data, adjusted):
+        for row, pair in zip(pooled.itertuples(), pairs):
+            with self.subTest(pair=pair, adjusted=adjusted):
+                cerebro = bt.Cerebro(stdstats=False)
+                data.cerebro_add_data(pair, cerebro, adjusted=adjusted)
+                cerebro.addstrategy(PairsTradingStrategy, **params)
+                cerebro.broker.setcash(100_000.0)
+                AnalyzerSuite.defineRecorder(cerebro)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    metrics = AnalyzerSuite.returnMetrics(cerebro.run())[0]
+                self.assertEqual((row.ticker1, row.ticker2), pair)
+                self.assertGreater(metrics['trades'], 0)
+                self.assertEqual(row.trades, metrics['trades'])
+                self.assertAlmostEqual(row.final_value, metrics['final_value'], places=6)
+                self.assertAlmostEqual(row.sharpe, metrics['sharpe'], places=9)
+
+
+if __name__ == '__main__':
+    unittest.main()
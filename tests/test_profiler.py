@@ -0,0 +1,61 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import backtrader as bt
+
+from src.data_manager import DataManager
+from src.profiler import Profiler
+from src.strategy import SimpleRSI
+
+
+class TestProfiler(unittest.TestCase):
+    def _cerebro(self):
+        cerebro = bt.Cerebro()
+        frame = DataManager().load_ticker_data('AAPL')
+        cerebro.adddata(bt.feeds.PandasData(dataname=frame), name='AAPL')
+        cerebro.addstrategy(SimpleRSI)
+        return cerebro, len(frame)
+
+    def _run(self, profiler, runonce):
+        cerebro, bars = self._cerebro()
+        with contextlib.redirect_stdout(io.StringIO()):
+            profiler.run(cerebro, runonce=runonce)
+        return cerebro, bars
+
+    def test_components_are_timed(self):
+        start = bt.Strategy._start
+        for runonce in (True, False):
+            with self.subTest(runonce=runonce):
+                profiler = Profiler()
+                cerebro, bars = self._run(profiler, runonce)
+                report = profiler.report().set_index('component')
+                self.assertEqual(report.loc['bar', 'calls'], bars)
+                self.assertEqual(report.loc['broker', 'calls'], bars)
+                self.assertIn('indicator:RelativeStrengthIndex', report.index)
+                self.assertIn('strategy:SimpleRSI', report.index)
+                self.assertIn('feed:AAPL', report.index)
+                self.assertLess(report['share'].sum(), 1.0)
+                self.assertIn('run', profiler.summary())
+        self.assertIs(bt.Strategy._start, start)
+
+    def test_disabled_profiler_wraps_nothing(self):
+        profiler = Profiler(enabled=False)
+        cerebro, _ = self._run(profiler, True)
+        self.assertNotIn('next', vars(cerebro.broker))
+        self.assertEqual(profiler.durations, {})
+        self.assertEqual(len(profiler.report()), 0)
+
+    def test_dump_stats(self):
+        profiler = Profiler(cprofile=True)
+        self._run(profiler, True)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'run.prof')
+            profiler.dump_stats(path)
+            self.assertGreater(os.path.getsize(path), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import results_store
+from src.data_manager import DataManager
+from src.indicators import RollingOLSTransformation
+from src.results_store import ResultsStore, run_backtest
+from src.strategy import PairsTradingStrategy, SimpleMovingAverage
+
+
+class TestResultsStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.data = DataManager()
+        cls.store = ResultsStore(os.path.join(cls.folder.name, 'results.sqlite'))
+        cls.runs = [run_backtest(SimpleMovingAverage, [ticker], dict(fast=period), data_manager=cls.data,
+                                 store=cls.store)
+                    for ticker in ('AAPL', 'MSFT') for period in (10, 20)]
+        cls.pair = run_backtest(PairsTradingStrategy, ['AAPL', 'MSFT'], data_manager=cls.data, store=cls.store)
+        cls.changed = run_backtest(SimpleMovingAverage, ['AAPL'], dict(fast=10), cash=50_000.0,
+                                   data_manager=cls.data, store=cls.store)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.store.close()
+        cls.folder.cleanup()
+
+    def test_identical_run_is_served_from_the_store(self):
+        self.assertFalse(self.runs[0]['served'])
+        served = run_backtest(SimpleMovingAverage, ['AAPL'], dict(fast=10), data_manager=self.data,
+                              store=self.store)
+        self.assertTrue(served['served'])
+        self.assertEqual(served['id'], self.runs[0]['id'])
+        self.assertEqual(served['metrics'], self.runs[0]['metrics'])
+        self.assertFalse(self.changed['served'])
+        self.assertNotEqual(self.changed['id'], self.runs[0]['id'])
+
+    def test_adjusted_run_is_not_served_the_raw_one(self):
+        with ResultsStore(os.path.join(self.folder.name, 'adjusted.sqlite')) as store:
+            raw = run_backtest(SimpleMovingAverage, ['AAPL'], dict(fast=10), data_manager=self.data, store=store)
+            adjusted = run_backtest(SimpleMovingAverage, ['AAPL'], dict(fast=10), data_manager=self.data,
+                                    store=store, adjusted=True)
+        self.assertFalse(adjusted['served'])
+        self.assertNotEqual(adjusted['id'], raw['id'])
+        self.assertNotEqual(adjusted['metrics']['final_value'], raw['metrics']['final_value'])
+
+    def test_key_covers_the_code_of_params_and_engine(self):
+        args = (PairsTradingStrategy, dict(transform=RollingOLSTransformation), ['AAPL', 'MSFT'], 1e5, 'data')
+        key = ResultsStore.key(*args)
+        source = results_store.source_of
+        with mock.patch.object(results_store, 'source_of',
+                               lambda obj: 'changed' if obj is RollingOLSTransformation else source(obj)):
+            self.assertNotEqual(ResultsStore.key(*args), key)
+        with mock.patch.object(results_store, 'engine_digest', lambda: 'changed'):
+            self.assertNotEqual(ResultsStore.key(*args), key)
+        self.assertEqual(ResultsStore.key(*args), key)
+
+    def test_equity_and_trades_round_trip(self):
+        stored = self.store.run(self.pair['id'])
+        np.testing.assert_array_equal(stored['equity'].to_numpy(), self.pair['equity'].to_numpy())
+        self.assertTrue(stored['equity'].index.equals(self.pair['equity'].index))
+        self.assertEqual(stored['equity'].iloc[-1], self.pair['metrics']['final_value'])
+        self.assertEqual(len(stored['trades']), self.pair['metrics']['trades'])
+        self.assertEqual(set(stored['trades']['data']), {0, 1})
+        self.assertAlmostEqual(stored['trades']['pnl'].mean(), self.pair['metrics']['avg_trade'])
+        self.assertEqual(stored['tickers'], ['AAPL', 'MSFT'])
+
+    def test_query_filters_and_ranks(self):
+        self.assertEqual(len(self.store.query(strategy='SimpleMovingAverage')), 5)
+        self.assertEqual(set(self.store.query(ticker='MSFT')['strategy']), {'SimpleMovingAverage',
+                                                                           'PairsTradingStrategy'})
+        runs = self.store.query(strategy='SimpleMovingAverage', params=dict(fast=20))
+        self.assertEqual(sorted(runs['tickers']), ['AAPL', 'MSFT'])
+        ranked = self.store.query(order_by='sharpe', limit=3)
+        self.assertEqual(len(ranked), 3)
+        self.assertTrue(ranked['sharpe'].is_monotonic_decreasing)
+        best = max(self.runs + [self.pair, self.changed], key=lambda run: run['metrics']['sharpe'])
+        self.assertEqual(ranked['id'].iloc[0], best['id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from src.analyzer import compute_metrics
+from src.indicators import RollingOLSTransformation
+from src.results_store import run_backtest
+from src.robustness import ROBUSTNESS_METRICS, confidence_intervals, path_metrics, resample, result_inputs, robustness
+from src.strategy import PairsTradingStrategy
+
+
+class TestRobustness(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.result = run_backtest(PairsTradingStrategy, ['AAPL', 'MSFT'], params=dict(transform=RollingOLSTransformation))
+        cls.inputs = result_inputs(cls.result)
+
+    def test_path_metrics_match_compute_metrics(self):
+        rng = np.random.default_rng(0)
+        returns = rng.normal(0.0005, 0.01, size=(3, 300))
+        batched = path_metrics(returns, riskfree=0.02)
+        for path, row in enumerate(returns):
+            values = 1000.0 * np.concatenate([[1.0], np.cumprod(1.0 + row)])
+            expected = compute_metrics(values, metrics=ROBUSTNESS_METRICS, riskfree=0.02)
+            for name in ROBUSTNESS_METRICS:
+                self.assertAlmostEqual(batched[name][path], expected[name], places=10)
+
+    def test_observed_metrics_of_a_run(self):
+        result = resample(method='block_bootstrap', n_resamples=10, seed=0, **self.inputs)
+        expected = compute_metrics(self.result['equity'].to_numpy(), metrics=ROBUSTNESS_METRICS)
+        for name in ROBUSTNESS_METRICS:
+            self.assertAlmostEqual(result['observed'][name], expected[name], places=10)
+
+    def test_resamples(self):
+        bootstrap = resample(method='block_bootstrap', n_resamples=2000, seed=1, chunk_size=300, **self.inputs)
+        self.assertEqual(len(bootstrap['samples']['sharpe']), 2000)
+        intervals = confidence_intervals(bootstrap['samples'], bootstrap['observed'])
+        self.assertTrue((intervals['lower'] < intervals['observed']).all())
+        self.assertTrue((intervals['observed'] < intervals['upper']).all())
+
+        # Reordering the trades does not change their sum, only the path.
+        reshuffle = resample(method='reshuffle', n_resamples=500, seed=1, **self.inputs)
+        total = self.inputs['pnl'].sum() / self.inputs['cash']
+        np.testing.assert_allclose(reshuffle['samples']['total_return'], total, atol=1e-12)
+        self.assertGreater(reshuffle['samples']['max_drawdown'].std(), 0)
+
+        quiet = resample(method='noise', noise=0.0, n_resamples=20, seed=1, **self.inputs)
+        np.testing.assert_allclose(quiet['samples']['sharpe'], quiet['observed']['sharpe'])
+
+    def test_seeded_and_independent_of_workers(self):
+        results = dict(first=self.result, second=self.result['equity'], third=self.result)
+        single = robustness(results, n_resamples=300, seed=7, workers=1)
+        pooled = robustness(results, n_resamples=300, seed=7, workers=2)
+        self.assertEqual(len(single), 3 * 3 * 3)
+        self.assertTrue(single.equals(pooled))
+        # Each result has its own stream, and an equity curve alone cannot be reshuffled.
+        bootstrap = single[single['method'] == 'block_bootstrap'].set_index(['name', 'metric'])
+        self.assertNotEqual(bootstrap.loc[('first', 'sharpe'), 'median'], bootstrap.loc[('third', 'sharpe'), 'median'])
+        self.assertTrue(single[(single['name'] == 'second') & (single['method'] == 'reshuffle')]['lower'].isna().all())
+        with self.assertRaises(ValueError):
+            robustness(results, methods=('jackknife',))
+
+
+if __name__ == '__main__':
+    unittest.main()
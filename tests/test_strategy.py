@@ -0,0 +1,79 @@
+import contextlib
+import io
+import unittest
+
+import backtrader as bt
+import pandas as pd
+
+from src.data_manager import DataManager
+from src.strategy import PairsPortfolioStrategy
+from src.vectorized import backtest_pair
+
+
+class Fills(bt.Analyzer):
+    """Records the executed orders by date and ticker."""
+
+    def start(self):
+        self.fills = []
+
+    def notify_order(self, order):
+        if order.executed.size:
+            self.fills.append((order.data.datetime.date(0), order.data._name, order.executed.size,
+                               order.executed.price))
+
+    def get_analysis(self):
+        return self.fills
+
+
+def run_portfolio(pairs, tickers=None, cash=100_000.0, **params):
+    data = DataManager()
+    tickers = tickers or list(dict.fromkeys(ticker for pair in pairs for ticker in pair))
+    cerebro = bt.Cerebro(stdstats=False)
+    for ticker in tickers:
+        cerebro.adddata(bt.feeds.PandasData(dataname=data.load_ticker_data(ticker)), name=ticker)
+    cerebro.addstrategy(PairsPortfolioStrategy, pairs=pairs, **params)
+    cerebro.broker.setcash(cash)
+    cerebro.addanalyzer(Fills, _name='fills')
+    with contextlib.redirect_stdout(io.StringIO()):
+        strategy = cerebro.run()[0]
+    return cerebro, strategy
+
+
+class TestPairsPortfolioStrategy(unittest.TestCase):
+    cases = [
+        ('AAPL', 'MSFT', {}),
+        ('ABNB', 'NVDA', {}),
+        ('AAPL', 'MSFT', dict(period=10, upper=1.5, lower=-1.5)),
+    ]
+
+    def test_single_pair_matches_pairs_trading(self):
+        # The array engine reproduces PairsTradingStrategy, see tests/test_vectorized.py.
+        for ticker1, ticker2, params in self.cases:
+            with self.subTest(pair=(ticker1, ticker2), params=params):
+                cerebro, strategy = run_portfolio([(ticker1, ticker2)], portfolio_value=100000, **params)
+                expected = backtest_pair(ticker1, ticker2, **params)
+                dates = pd.DatetimeIndex(expected['dates']).date
+                tickers = (ticker1, ticker2)
+                self.assertEqual([fill[:3] for fill in strategy.analyzers.fills.get_analysis()],
+                                 [(dates[bar], tickers[leg], size) for bar, leg, size, _ in expected['fills'].tolist()])
+                self.assertAlmostEqual(cerebro.broker.getvalue(), expected['final_value'], places=6)
+
+    def test_shared_tickers_are_loaded_once(self):
+        pairs = [('AAPL', 'MSFT'), ('MSFT', 'GOOGL'), ('AAPL', 'GOOGL'), ('PEP', 'KDP')]
+        cerebro, strategy = run_portfolio(pairs)
+        self.assertEqual(len(cerebro.datas), 5)
+        self.assertEqual(strategy.holdings.shape, (4, 2))
+        self.assertTrue(len(strategy.analyzers.fills.get_analysis()) > 0)
+        # The positions booked to the pairs add up to the broker positions.
+        for ticker in strategy.tickers:
+            booked = sum(strategy.holdings[index, leg] for index, pair in enumerate(pairs)
+                         for leg in (0, 1) if pair[leg] == ticker)
+            self.assertEqual(booked, strategy.getpositionbyname(ticker).size)
+
+    def test_unknown_ticker_raises(self):
+        with self.assertRaises(ValueError):
+            run_portfolio([('AAPL', 'MISSING')], tickers=['AAPL', 'MSFT'])
+
+
+if __name__ == '__main__':
+    unittest.main()
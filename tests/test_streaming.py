@@ -0,0 +1,118 @@
+import contextlib
+import io
+import os
+import tempfile
+import time
+import unittest
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from src.analyzer import AnalyzerSuite
+from src.feeds import ArrayData
+from src.streaming import ReadAhead, partition_files, stream_feed, streaming_cerebro, write_partitions
+from src.strategy import SimpleMovingAverage, SimpleRSI
+
+
+def minute_bars(days, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(day + pd.Timedelta('9h30min'), periods=390, freq='min')
+        for day in pd.bdate_range('2024-01-02', periods=days)]))
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.001, len(index)))), 2)
+    return pd.DataFrame(dict(open=close, high=close + 0.05, low=close - 0.05, close=close, volume=1000.0), index=index)
+
+
+class TestStreamingData(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.bars = minute_bars(6)
+        write_partitions(cls.bars, 'TEST', cls.folder.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder.cleanup()
+
+    def run_metrics(self, cerebro, feed, strategy):
+        cerebro.adddata(feed, name='TEST')
+        cerebro.addstrategy(strategy)
+        AnalyzerSuite.defineRecorder(cerebro, metrics=['final_value', 'trades'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            thestrats = cerebro.run()
+        return AnalyzerSuite.returnMetrics(thestrats)[0], feed
+
+    def test_partitions(self):
+        files = partition_files('TEST', self.folder.name, start='2024-01-03', end='2024-01-05')
+        self.assertEqual([os.path.basename(path) for path in files],
+                         ['2024-01-03.csv', '2024-01-04.csv', '2024-01-05.csv'])
+        with self.assertRaises(ValueError):
+            partition_files('MISSING', self.folder.name)
+
+    def test_matches_in_memory_feed_with_bounded_buffers(self):
+        for strategy in (SimpleRSI, SimpleMovingAverage):
+            with self.subTest(strategy=strategy.__name__):
+                expected, _ = self.run_metrics(bt.Cerebro(stdstats=False),
+                                               ArrayData.from_frame(self.bars, timeframe=bt.TimeFrame.Minutes),
+                                               strategy)
+                metrics, feed = self.run_metrics(streaming_cerebro(),
+                                                 stream_feed('TEST', self.folder.name, chunksize=250), strategy)
+                self.assertEqual(metrics, expected)
+                self.assertGreater(metrics['trades'], 0)
+                # Only the bars needed by the indicators are kept, not the 2340 bars of the history.
+                self.assertLess(len(feed.lines.close.array), 100)
+
+    def test_date_range(self):
+        class Dates(bt.Strategy):
+            def start(self):
+                self.dates = []
+
+            def next(self):
+                self.dates.append(self.data.datetime.datetime(0))
+
+        cerebro = streaming_cerebro()
+        cerebro.adddata(stream_feed('TEST', self.folder.name, start='2024-01-08', prefetch=0))
+        cerebro.addstrategy(Dates)
+        dates = cerebro.run()[0].dates
+        self.assertEqual(len(dates), 2 * 390)
+        self.assertEqual((dates[0], dates[-1]), (pd.Timestamp('2024-01-08 09:30'), pd.Timestamp('2024-01-09 15:59')))
+
+
+class TestReadAhead(unittest.TestCase):
+    def test_reads_at_most_size_items_ahead(self):
+        produced = []
+
+        def items():
+            for item in range(10):
+                produced.append(item)
+                yield item
+
+        reader = ReadAhead(items(), size=2)
+        first = next(reader)
+        time.sleep(0.3)
+        # The queue holds 2 items and the producer blocks with the next one.
+        self.assertLessEqual(len(produced) - 1, 3)
+        self.assertEqual([first] + list(reader), list(range(10)))
+        reader.close()
+
+    def test_errors_are_raised_in_the_consumer(self):
+        def items():
+            yield 1
+            raise OSError('unreadable partition')
+
+        reader = ReadAhead(items())
+        self.assertEqual(next(reader), 1)
+        with self.assertRaises(OSError):
+            next(reader)
+        self.assertEqual(list(reader), [])
+
+    def test_close_stops_the_thread(self):
+        reader = ReadAhead(iter(range(1_000_000)), size=1)
+        next(reader)
+        reader.close()
+        self.assertFalse(reader._thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+from statsmodels.tsa.adfvalues import mackinnonp
+
+from src.data_manager import DataManager
+from src.utils import DataWrangler, TimeSeriesAnalysis, _mackinnonp_c
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_heavy_dependencies_are_imported_on_first_use(self):
+        code = ('import sys; import src.utils, src.batch, src.downloader; '
+                'print(sorted(m for m in ("openbb", "statsmodels", "scipy.stats", "src.config") if m in sys.modules))')
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), '[]')
+
+    def test_wrangler_does_not_log_in_before_downloading(self):
+        wrangler = DataWrangler()
+        self.assertIsNone(wrangler.pat)
+
+
+class TestScanPairs(unittest.TestCase):
+    tickers = ['AAPL', 'ABNB', 'MSFT', 'NVDA']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = DataManager()
+        cls.scan = TimeSeriesAnalysis.scan_pairs(cls.tickers, data_manager=cls.data)
+
+    def test_scans_every_pair_once(self):
+        self.assertEqual(len(self.scan), 6)
+        self.assertTrue(self.scan['pvalue'].is_monotonic_increasing)
+
+    def test_matches_engle_granger_test(self):
+        for row in self.scan.itertuples():
+            df1 = self.data.load_ticker_data(row.ticker1)['adj_close']
+            df2 = self.data.load_ticker_data(row.ticker2)['adj_close']
+            common = df1.index.intersection(df2.index)
+            df1, df2 = df1[common], df2[common]
+            c, gamma, alpha, _ = TimeSeriesAnalysis.estimate_long_run_short_run_relationships(df1, df2)
+            adfstat, pvalue = TimeSeriesAnalysis.engle_granger_two_step_cointegration_test(df1, df2)
+            np.testing.assert_allclose([row.c, row.gamma, row.alpha], [c, gamma, alpha], rtol=1e-8)
+            np.testing.assert_allclose([row.adfstat, row.pvalue], [adfstat, pvalue], rtol=1e-8)
+
+    def test_max_pvalue_filters_pairs(self):
+        scan = TimeSeriesAnalysis.scan_pairs(self.tickers, data_manager=self.data, max_pvalue=0.1)
+        self.assertTrue((scan['pvalue'] <= 0.1).all())
+
+
+class TestPrefilterPairs(unittest.TestCase):
+    tickers = ['AAPL', 'ABNB', 'GOOG', 'GOOGL', 'MSFT', 'NVDA', 'PEP', 'MDLZ']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = DataManager()
+        cls.prices = cls.data.load_panel(cls.tickers).frame('close')
+        cls.scores = TimeSeriesAnalysis.prefilter_pairs(cls.prices)
+
+    def test_scores_match_pairwise_computation(self):
+        self.assertEqual(len(self.scores), 28)
+        correlations = np.log(self.prices).diff().corr()
+        for row in self.scores.itertuples():
+            # Both prices are normalized at the first common date, e.g. the listing of ABNB.
+            prices = self.prices[[row.ticker1, row.ticker2]].dropna()
+            normalized = prices / prices.iloc[0]
+            distance = (normalized[row.ticker1] - normalized[row.ticker2]).pow(2).mean()
+            np.testing.assert_allclose([row.correlation, row.distance],
+                                       [correlations.loc[row.ticker1, row.ticker2], distance], rtol=1e-9)
+            self.assertEqual(row.nobs, len(prices))
+            self.assertLess(self.tickers.index(row.ticker1), self.tickers.index(row.ticker2))
+
+    def test_top_k_and_thresholds(self):
+        candidates = TimeSeriesAnalysis.prefilter_pairs(self.prices, top_k=1, block_size=3)
+        pairs = set(zip(candidates['ticker1'], candidates['ticker2']))
+        for ticker in self.tickers:
+            partners = self.scores[(self.scores['ticker1'] == ticker) | (self.scores['ticker2'] == ticker)]
+            best = partners.iloc[0]
+            self.assertIn((best.ticker1, best.ticker2), pairs)
+        self.assertLessEqual(len(candidates), len(self.tickers))
+        self.assertEqual(tuple(candidates.iloc[0][['ticker1', 'ticker2']]), ('GOOG', 'GOOGL'))
+        closest = TimeSeriesAnalysis.prefilter_pairs(self.prices, method='distance', max_distance=0.01,
+                                                     min_correlation=0.5)
+        self.assertTrue((closest['distance'] <= 0.01).all() and (closest['correlation'] >= 0.5).all())
+        self.assertTrue(closest['distance'].is_monotonic_increasing)
+
+    def test_candidates_feed_the_scan(self):
+        candidates = TimeSeriesAnalysis.prefilter_pairs(self.prices, top_k=2)
+        scan = TimeSeriesAnalysis.scan_pairs(self.prices, pairs=candidates)
+        full = TimeSeriesAnalysis.scan_pairs(self.prices)
+        self.assertEqual(len(scan), len(candidates))
+        expected = full.merge(candidates[['ticker1', 'ticker2']]).reset_index(drop=True)
+        np.testing.assert_allclose(scan[['c', 'gamma', 'adfstat']], expected[['c', 'gamma', 'adfstat']])
+
+
+class TestRelationshipsBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.prices = DataManager().load_panel(['AAPL', 'MSFT', 'NVDA']).frame('close')
+        cls.pairs = [(0, 1), (1, 0), (2, 0), (1, 2)]
+
+    def test_matches_single_pair(self):
+        c, gamma, alpha, z = TimeSeriesAnalysis.estimate_relationships_batch(self.prices.to_numpy(), self.pairs,
+                                                                             chunk_size=3)
+        self.assertEqual(z.shape, (len(self.prices), len(self.pairs)))
+        for k, (i, j) in enumerate(self.pairs):
+            expected = TimeSeriesAnalysis.estimate_long_run_short_run_relationships(self.prices.iloc[:, i],
+                                                                                    self.prices.iloc[:, j])
+            np.testing.assert_allclose([c[k], gamma[k], alpha[k]], expected[:3], rtol=1e-9)
+            np.testing.assert_allclose(z[:, k], expected[3], rtol=1e-8, atol=1e-9)
+
+    def test_float32_and_ticker_pairs(self):
+        expected = TimeSeriesAnalysis.estimate_relationships_batch(self.prices, self.pairs)
+        names = [(self.prices.columns[i], self.prices.columns[j]) for i, j in self.pairs]
+        result = TimeSeriesAnalysis.estimate_relationships_batch(self.prices, names, dtype=np.float32)
+        for values, expected_values in zip(result, expected):
+            self.assertEqual(values.dtype, np.float32)
+            np.testing.assert_allclose(values, expected_values, rtol=1e-3, atol=1e-2)
+
+    def test_validates_the_batch(self):
+        prices = self.prices.to_numpy().copy()
+        prices[10, 2] = np.nan
+        with self.assertRaises(ValueError):
+            TimeSeriesAnalysis.estimate_relationships_batch(prices, [(0, 2)])
+        # Columns which are not part of a pair are not checked.
+        TimeSeriesAnalysis.estimate_relationships_batch(prices, [(0, 1)])
+        with self.assertRaises(ValueError):
+            TimeSeriesAnalysis.estimate_relationships_batch(prices, [(0, 3)])
+
+
+class TestRollingCointegration(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.prices = DataManager().load_panel(['AAPL', 'ABNB', 'MSFT']).frame('close')
+
+    def assert_matches_window(self, row, df1, df2):
+        c, gamma, alpha, _ = TimeSeriesAnalysis.estimate_long_run_short_run_relationships(df1, df2)
+        adfstat, pvalue = TimeSeriesAnalysis.engle_granger_two_step_cointegration_test(df1, df2)
+        np.testing.assert_allclose([row.c, row.gamma, row.alpha, row.adfstat, row.pvalue],
+                                   [c, gamma, alpha, adfstat, pvalue], rtol=1e-8)
+        self.assertEqual(row.nobs, len(df1) - 2)
+
+    def test_matches_engle_granger_test_on_each_window(self):
+        for ticker1, window in (('AAPL', None), ('AAPL', 250), ('ABNB', None), ('ABNB', 120)):
+            with self.subTest(ticker1=ticker1, window=window):
+                rolling = TimeSeriesAnalysis.rolling_cointegration(self.prices[ticker1], self.prices['MSFT'],
+                                                                   window=window, step=50)
+                estimated = rolling.dropna()
+                # ABNB is listed in December 2020: nothing is estimated before 60 observations.
+                first = self.prices[ticker1].first_valid_index()
+                self.assertGreaterEqual(len(self.prices.loc[first:estimated.index[0]]), 60)
+                self.assertLess(len(self.prices.loc[first:estimated.index[0]]), 60 + 50)
+                for date in estimated.index[[0, len(estimated) // 2, -1]]:
+                    window_prices = self.prices.loc[:date, [ticker1, 'MSFT']].dropna()
+                    if window is not None:
+                        window_prices = window_prices.iloc[-window:]
+                    self.assert_matches_window(estimated.loc[date], window_prices[ticker1], window_prices['MSFT'])
+
+    def test_batch_matches_single_pair(self):
+        pairs = [('AAPL', 'MSFT'), ('ABNB', 'MSFT'), ('MSFT', 'AAPL')]
+        batch = TimeSeriesAnalysis.rolling_scan_pairs(pairs, self.prices, window=250, chunk_size=2)
+        for ticker1, ticker2 in pairs:
+            single = TimeSeriesAnalysis.rolling_cointegration(self.prices[ticker1], self.prices[ticker2], window=250)
+            for name in single:
+                np.testing.assert_allclose(batch[name][(ticker1, ticker2)], single[name], rtol=1e-12)
+
+    def test_vectorized_pvalues(self):
+        stats = np.array([-30.0, -4.5, -2.9, -1.6, 0.5, 3.0])
+        np.testing.assert_allclose(_mackinnonp_c(stats), [mackinnonp(stat, regression='c', N=1) for stat in stats])
+
+
+if __name__ == '__main__':
+    unittest.main()
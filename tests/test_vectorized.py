@@ -0,0 +1,102 @@
+import contextlib
+import io
+import unittest
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from src.data_manager import DataManager
+from src.indicators import CachedSMA
+from src.strategy import PairsTradingStrategy
+from src.vectorized import backtest_pair, backtest_pairs, rolling_ols_zscore, strategy_params
+
+
+class Recorder(bt.Analyzer):
+    """Records the broker value of every bar and the executed orders."""
+
+    def start(self):
+        self.values = []
+        self.fills = []
+
+    def prenext(self):
+        self.values.append(self.strategy.broker.getvalue())
+
+    def next(self):
+        self.values.append(self.strategy.broker.getvalue())
+
+    def notify_order(self, order):
+        if order.executed.size:
+            leg = self.strategy.datas.index(order.data)
+            self.fills.append((len(order.data) - 1, leg, order.executed.size, order.executed.price))
+
+    def get_analysis(self):
+        return dict(values=self.values, fills=self.fills)
+
+
+def run_backtrader(panel, rows, **params):
+    cerebro = bt.Cerebro(stdstats=False)
+    for column in range(2):
+        frame = pd.DataFrame(panel.values[:, rows, column].T, index=panel.dates[rows], columns=list(panel.fields))
+        cerebro.adddata(bt.feeds.PandasData(dataname=frame))
+    cerebro.addstrategy(PairsTradingStrategy, **params)
+    cerebro.broker.setcash(100_000.0)
+    cerebro.addanalyzer(Recorder, _name='recorder')
+    with contextlib.redirect_stdout(io.StringIO()):
+        thestrats = cerebro.run()
+    return thestrats[0].analyzers.recorder.get_analysis()
+
+
+class TestPairsParity(unittest.TestCase):
+    """The array engine must reproduce the backtrader run of PairsTradingStrategy."""
+
+    cases = [
+        ('AAPL', 'MSFT', {}),
+        ('ABNB', 'NVDA', {}),
+        ('PEP', 'KDP', {}),
+        ('AAPL', 'MSFT', dict(period=10, upper=1.5, lower=-1.5)),
+        ('LULU', 'ROP', dict(period=30, upper=2.0, lower=-2.0, up_medium=0.2, low_medium=-0.2)),
+    ]
+
+    def test_matches_backtrader(self):
+        data = DataManager()
+        for ticker1, ticker2, params in self.cases:
+            with self.subTest(pair=(ticker1, ticker2), params=params):
+                panel = data.load_panel([ticker1, ticker2], fields=('open', 'high', 'low', 'close', 'volume'))
+                rows = panel.common_rows()
+                expected = run_backtrader(panel, rows, **params)
+                opens, closes = panel.field('open')[rows], panel.field('close')[rows]
+                result = backtest_pairs(opens[:, 0], closes[:, 0], opens[:, 1], closes[:, 1], **params)
+
+                fills = result['fills']
+                self.assertGreater(len(fills), 0)
+                self.assertEqual([(bar, leg, size) for bar, leg, size, _ in fills.tolist()],
+                                 [(bar, leg, size) for bar, leg, size, _ in expected['fills']])
+                np.testing.assert_allclose(fills['price'], [fill[3] for fill in expected['fills']], rtol=1e-12)
+                np.testing.assert_allclose(result['value'], expected['values'], rtol=1e-10)
+
+
+class TestVectorized(unittest.TestCase):
+    def test_zscore_warm_up(self):
+        closes = DataManager().load_panel(['GOOG', 'GOOGL']).field('close')
+        zscore = rolling_ols_zscore(closes[:, 0], closes[:, 1], period=20)['zscore']
+        self.assertTrue(np.isnan(zscore[:28]).all())
+        self.assertTrue(np.isfinite(zscore[28:]).all())
+
+    def test_backtest_pair_uses_common_dates(self):
+        result = backtest_pair('ABNB', 'NVDA')
+        self.assertEqual(result['dates'][0], pd.Timestamp('2020-12-10'))
+        self.assertEqual(len(result['value']), len(result['dates']))
+
+    def test_unknown_parameter_raises(self):
+        with self.assertRaises(ValueError):
+            backtest_pair('AAPL', 'MSFT', periods=10)
+        # The indicator params of the strategy are accepted as they are.
+        expected = backtest_pair('AAPL', 'MSFT')['final_value']
+        self.assertEqual(backtest_pair('AAPL', 'MSFT', sma=CachedSMA)['final_value'], expected)
+        self.assertEqual(backtest_pair('AAPL', 'MSFT', printlog=True)['final_value'], expected)
+        self.assertEqual(backtest_pair('AAPL', 'MSFT', **strategy_params())['final_value'], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()